@@ -0,0 +1,130 @@
+"""
+Background agent initialization for fast, non-blocking startup.
+
+The Assistant used to be built at import time, after synchronous upstream
+probes, so the server could not bind until vLLM answered, and a vLLM that
+was slow at boot left the app without an agent until the next restart.
+AgentLoader runs the preflight checks and the build on a daemon thread,
+retries with exponential backoff until it succeeds, and records how long
+each startup phase took.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AgentLoader:
+    """Builds the agent in the background, retrying until it succeeds.
+
+    build() returns the agent; preflight() may raise or return False to
+    postpone the build. on_ready(agent) is called once the agent exists.
+    """
+
+    def __init__(self, build, preflight=None, on_ready=None, retry_interval=5.0, max_backoff=60.0,
+                 logger=None, started_at=None):
+        self.build = build
+        self.preflight = preflight
+        self.on_ready = on_ready
+        self.retry_interval = retry_interval
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self.started_at = started_at or time.time()
+        self.agent = None
+        self.state = 'pending'
+        self.attempts = 0
+        self.last_error = None
+        self.phases = {}
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time one startup phase (the latest attempt's duration is kept)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = round(time.perf_counter() - started, 4)
+
+    def record_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = round(seconds, 4)
+
+    def load_once(self):
+        """One initialization attempt; True if the agent is ready"""
+        if self._ready.is_set():
+            return True
+        with self._lock:
+            self.attempts += 1
+            self.state = 'initializing'
+        try:
+            if self.preflight is not None and self.preflight() is False:
+                raise RuntimeError("preflight checks failed")
+            with self.phase('agent_init'):
+                agent = self.build()
+        except Exception as e:
+            with self._lock:
+                self.state = 'retrying'
+                self.last_error = str(e)
+            if self.logger:
+                self.logger.error(f"❌ Agent initialization attempt {self.attempts} failed: {e}")
+            return False
+
+        with self._lock:
+            self.agent = agent
+            self.state = 'ready'
+            self.last_error = None
+            self.phases['ready'] = round(time.time() - self.started_at, 4)
+        if self.on_ready:
+            self.on_ready(agent)
+        self._ready.set()
+        if self.logger:
+            self.logger.info(f"✅ Agent ready {self.phases['ready']:.2f}s after startup "
+                             f"(attempt {self.attempts})")
+        return True
+
+    def _retry_delay(self):
+        return min(self.retry_interval * (2 ** max(self.attempts - 1, 0)), self.max_backoff)
+
+    def _loop(self):
+        while not self._stop.is_set() and not self.load_once():
+            delay = self._retry_delay()
+            if self.logger:
+                self.logger.info(f"⏳ Retrying agent initialization in {delay:.0f}s")
+            if self._stop.wait(delay):
+                return
+
+    def start(self):
+        """Keep trying in the background until the agent is ready"""
+        if self._thread is None and not self._ready.is_set():
+            self._thread = threading.Thread(target=self._loop, name='agent-loader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Block until the agent is ready; False on timeout"""
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def retry_after(self):
+        """Seconds a client should wait before retrying while the agent is not ready"""
+        return max(1, int(round(self.retry_interval)))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "attempts": self.attempts,
+                "last_error": self.last_error,
+                "uptime": round(time.time() - self.started_at, 3),
+                "phases": dict(self.phases)
+            }
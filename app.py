@@ -1,18 +1,34 @@
-from flask import Flask, request, jsonify, render_template
-from qwen_agent.agents import Assistant
-import httpx
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from contextlib import closing
 import logging
 import json
+import queue
+import threading
+import time
 import ssl
 import os
+import ipaddress
 import urllib3
-import requests
-from bs4 import BeautifulSoup
-import time
 import certifi
-import re
-from urllib.parse import quote, urljoin
+from collections import deque
 from datetime import datetime
+from agent_loader import AgentLoader
+from chat_jobs import ChatOverloaded, ChatRunner
+from health_prober import HealthProber
+from vllm_router import EndpointRouter
+from query_router import QueryRouter
+from sessions import SessionStore
+from response_cache import RESPONSE_CACHE_ENABLED, ResponseCache, bypass_requested
+import metrics
+import http_clients
+import llm_client  # registers the 'oai_pooled' model type
+import search_tool  # noqa: F401 - registers the search_web tool with qwen_agent
+import kernel_pool  # registers the pooled code_interpreter tool with qwen_agent
+import tool_compaction
+import deadlines
+import tool_results
+
+STARTUP_STARTED = time.time()  # startup phase timings are measured from here, once imports are done
 
 app = Flask(__name__)
 
@@ -24,6 +40,47 @@ VLLM_MODELS_URL = os.getenv("VLLM_MODELS_URL", "https://vllm.rangeresources.com/
 API_KEY = os.getenv("VLLM_API_KEY", "123456789")
 VERIFY_SSL = os.getenv("VLLM_VERIFY_SSL", "False").lower() in ['true', '1', 'yes', 'on']
 PLAYWRIGHT_SERVICE_URL = os.getenv("PLAYWRIGHT_SERVICE_URL", "http://playwright-service:3000")
+VLLM_HTTP2 = os.getenv("VLLM_HTTP2", "False").lower() in ['true', '1', 'yes', 'on']
+
+# vLLM replicas: comma-separated OpenAI-compatible base URLs (defaults to VLLM_BASE_URL alone)
+VLLM_ENDPOINTS = [url.strip() for url in os.getenv("VLLM_ENDPOINTS", "").split(",") if url.strip()] or [VLLM_BASE_URL]
+VLLM_ROUTING = os.getenv("VLLM_ROUTING", "least_outstanding").lower()  # or 'latency_ewma'
+VLLM_STICKY_ROUTING = os.getenv("VLLM_STICKY_ROUTING", "True").lower() in ['true', '1', 'yes', 'on']  # one replica per conversation
+VLLM_STICKY_SLACK = int(os.getenv("VLLM_STICKY_SLACK", "4"))  # extra in-flight calls tolerated on the sticky replica
+
+# Serving and concurrency
+SERVER_MODE = os.getenv("SERVER_MODE", "flask").lower()  # 'flask' (threaded WSGI) or 'asgi' (uvicorn)
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "16"))  # concurrent bot.run() executions
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "64"))  # runs waiting for a slot before 429s
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))  # max seconds a run may wait to start
+CHAT_COALESCE = os.getenv("CHAT_COALESCE", "True").lower() in ['true', '1', 'yes', 'on']  # identical in-flight queries share one run
+CHAT_BATCH_MAX_QUERIES = int(os.getenv("CHAT_BATCH_MAX_QUERIES", "500"))  # queries accepted per /chat/batch request
+CHAT_BATCH_PARALLEL = int(os.getenv("CHAT_BATCH_PARALLEL", "4"))  # default runs in flight per batch
+CHAT_BATCH_MAX_PARALLEL = int(os.getenv("CHAT_BATCH_MAX_PARALLEL", "8"))  # upper bound a batch may ask for
+CHAT_FAIR_QUANTUM = float(os.getenv("CHAT_FAIR_QUANTUM", "5"))  # run seconds credited to a client per round-robin turn
+CHAT_RUN_SECONDS_DIRECT = float(os.getenv("CHAT_RUN_SECONDS_DIRECT", "3"))  # initial cost estimate of a direct answer
+CHAT_RUN_SECONDS_AGENT = float(os.getenv("CHAT_RUN_SECONDS_AGENT", "30"))  # initial cost estimate of an agent (web search) run
+TRUSTED_PROXIES = [ipaddress.ip_network(net.strip(), strict=False)
+                   for net in os.getenv("TRUSTED_PROXIES", "").split(",") if net.strip()]  # proxies whose X-Real-IP/X-Forwarded-For are believed
+
+# Startup: 'background' binds immediately and builds the agent on a retrying
+# background thread; 'blocking' makes one attempt at import time first
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+AGENT_INIT_RETRY_INTERVAL = float(os.getenv("AGENT_INIT_RETRY_INTERVAL", "5"))
+AGENT_INIT_MAX_BACKOFF = float(os.getenv("AGENT_INIT_MAX_BACKOFF", "60"))
+
+# Background health probing
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "15"))
+HEALTH_PROBE_JITTER = float(os.getenv("HEALTH_PROBE_JITTER", "0.2"))  # +/- fraction of the interval
+HEALTH_PROBE_MAX_BACKOFF = float(os.getenv("HEALTH_PROBE_MAX_BACKOFF", "300"))
+
+# Query routing: plain knowledge questions skip the agent and get one direct completion
+QUERY_ROUTER_ENABLED = os.getenv("QUERY_ROUTER_ENABLED", "True").lower() in ['true', '1', 'yes', 'on']
+QUERY_ROUTER_MODEL = os.getenv("QUERY_ROUTER_MODEL", "")  # small model for queries the keywords leave open; empty = agent
+QUERY_ROUTER_DEFAULT = os.getenv("QUERY_ROUTER_DEFAULT", "agent").lower()  # route for those queries without a model
+
+# Response cache similarity lookup (off unless an embedding model is served by vLLM)
+RESPONSE_CACHE_EMBEDDING_MODEL = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "")
 
 logging.basicConfig(level=logging.INFO)
 app.logger.setLevel(logging.INFO)
@@ -44,50 +101,27 @@ if not VERIFY_SSL:
     # Global SSL context modification
     ssl._create_default_https_context = ssl._create_unverified_context
     
-    # Create custom session with proper SSL handling
-    import requests
-    from requests.adapters import HTTPAdapter
-    from requests.packages.urllib3.util.ssl_ import create_urllib3_context
-    
-    class SSLAdapter(HTTPAdapter):
-        def init_poolmanager(self, *args, **kwargs):
-            context = create_urllib3_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            kwargs['ssl_context'] = context
-            return super().init_poolmanager(*args, **kwargs)
-    
-    # Create a session with custom SSL adapter
-    session = requests.Session()
-    session.mount('https://', SSLAdapter())
-    session.mount('http://', HTTPAdapter())
-    
-    # Monkey patch requests to use our session
-    old_request = requests.request
-    def new_request(method, url, **kwargs):
-        kwargs['verify'] = False
-        return session.request(method=method, url=url, **kwargs)
-    requests.request = new_request
-    requests.get = lambda url, **kwargs: new_request('GET', url, **kwargs)
-    requests.post = lambda url, **kwargs: new_request('POST', url, **kwargs)
-    
-    # Patch OpenAI client
-    import openai
-    original_openai_init = openai.OpenAI.__init__
-    def patched_openai_init(self, *args, **kwargs):
-        kwargs['http_client'] = httpx.Client(verify=False, timeout=60)
-        return original_openai_init(self, *args, **kwargs)
-    openai.OpenAI.__init__ = patched_openai_init
+    # Outbound HTTP to vLLM/Playwright goes through http_clients, which is
+    # configured with verify=VERIFY_SSL below - no global patching needed
 
 else:
     app.logger.info("SSL verification is ENABLED")
     os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
     os.environ['SSL_CERT_FILE'] = certifi.where()
 
-# Configure LLM for Qwen-Agent
+# Pooled, keep-alive HTTP clients per upstream
+http_clients.configure_upstream('vllm', verify=VERIFY_SSL, http2=VLLM_HTTP2)
+http_clients.configure_upstream('playwright')
+
+# Route LLM calls across the vLLM replicas
+vllm_router = EndpointRouter(VLLM_ENDPOINTS, strategy=VLLM_ROUTING, sticky_slack=VLLM_STICKY_SLACK, logger=app.logger)
+llm_client.configure_router(vllm_router, sticky_routing=VLLM_STICKY_ROUTING)
+
+# Configure LLM for Qwen-Agent ('oai_pooled' shares the vLLM connection pool)
 llm_cfg = {
+    "model_type": "oai_pooled",
     "model": LLM_MODEL_NAME,
-    "model_server": VLLM_BASE_URL,
+    "model_server": VLLM_ENDPOINTS[0],
     "api_key": API_KEY,
     "generate_cfg": {
         "top_p": 0.9,
@@ -98,208 +132,27 @@ llm_cfg = {
     }
 }
 
-app.logger.info(f"LLM Configuration: {llm_cfg}")
+app.logger.info(f"LLM Configuration: {dict(llm_cfg, api_key='***')}")
+app.logger.info(f"vLLM endpoints: {VLLM_ENDPOINTS} (routing: {VLLM_ROUTING})")
 app.logger.info(f"SSL Verification: {'DISABLED' if not VERIFY_SSL else 'ENABLED'}")
 app.logger.info(f"Playwright Service: {PLAYWRIGHT_SERVICE_URL}")
 
-# Configure Tools - ONLY use code_interpreter for maximum compatibility
-tools_for_assistant = ['code_interpreter']
-app.logger.info(f"Tools initialized: {tools_for_assistant}")
+# Configure Tools - search_web runs natively in this process, code_interpreter stays for computation
+tools_for_assistant = [
+    {'name': 'search_web', 'playwright_url': PLAYWRIGHT_SERVICE_URL},
+    'code_interpreter'
+]
+tool_names = [tool['name'] if isinstance(tool, dict) else tool for tool in tools_for_assistant]
+app.logger.info(f"Tools initialized: {tool_names}")
 
 # Enhanced system prompt for enterprise web search capabilities
-system_prompt = """You are an advanced AI assistant with enterprise-grade web search capabilities. You can access current information from the internet using the code_interpreter tool.
+system_prompt = """You are an advanced AI assistant with enterprise-grade web search capabilities. You can access current information from the internet using the search_web tool.
 
 ## Web Search Guidelines
 
-When users ask about current information, recent events, live data, or anything that requires up-to-date information, use the code_interpreter tool with this approach:
+When users ask about current information, recent events, live data, or anything that requires up-to-date information, call the search_web tool with a short, focused query (e.g. {"query": "Apple stock price"}). The tool picks the best sources for the query type, ranks the content by relevance and returns excerpts with their sources and URLs.
 
-### For Web Searches:
-```python
-import requests
-import json
-from bs4 import BeautifulSoup
-import re
-from urllib.parse import quote
-import os
-
-# Configure environment for SSL handling
-os.environ['REQUESTS_CA_BUNDLE'] = ''
-os.environ['SSL_CERT_FILE'] = ''
-
-def search_web(query, max_results=3):
-    \"\"\"
-    Enterprise web search function using Playwright service
-    \"\"\"
-    print(f"🔍 Searching for: {query}")
-    
-    playwright_url = "http://playwright-service:3000/scrape"
-    
-    # Multi-source search strategy
-    search_sources = [
-        {
-            "name": "Google Search",
-            "url": f"https://www.google.com/search?q={quote(query)}&num=10",
-            "extract_links": True
-        },
-        {
-            "name": "DuckDuckGo",
-            "url": f"https://duckduckgo.com/?q={quote(query)}",
-            "extract_links": True
-        }
-    ]
-    
-    # Domain-specific sources based on query type
-    if any(term in query.lower() for term in ['news', 'breaking', 'latest', 'today']):
-        search_sources.extend([
-            {"name": "BBC News", "url": "https://www.bbc.com/news"},
-            {"name": "Reuters", "url": "https://www.reuters.com"},
-            {"name": "Associated Press", "url": "https://apnews.com"}
-        ])
-    
-    elif any(term in query.lower() for term in ['sports', 'game', 'score', 'nfl', 'nba', 'nhl', 'mlb']):
-        search_sources.extend([
-            {"name": "ESPN", "url": "https://www.espn.com"},
-            {"name": "The Score", "url": "https://www.thescore.com"},
-            {"name": "Sports Illustrated", "url": "https://www.si.com"}
-        ])
-    
-    elif any(term in query.lower() for term in ['stock', 'market', 'finance', 'trading']):
-        search_sources.extend([
-            {"name": "Yahoo Finance", "url": "https://finance.yahoo.com"},
-            {"name": "MarketWatch", "url": "https://www.marketwatch.com"},
-            {"name": "CNBC", "url": "https://www.cnbc.com"}
-        ])
-    
-    elif any(term in query.lower() for term in ['weather', 'forecast', 'temperature']):
-        search_sources.extend([
-            {"name": "Weather.com", "url": "https://weather.com"},
-            {"name": "AccuWeather", "url": "https://www.accuweather.com"}
-        ])
-    
-    results = []
-    
-    for source in search_sources[:max_results]:
-        try:
-            print(f"📡 Checking {source['name']}...")
-            
-            payload = {
-                "url": source["url"],
-                "action": "content",
-                "timeout": 20000
-            }
-            
-            response = requests.post(playwright_url, json=payload, timeout=25, verify=False)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success'):
-                    content = result.get('data', '')
-                    
-                    # Extract relevant information
-                    soup = BeautifulSoup(content, 'html.parser')
-                    
-                    # Remove script and style elements
-                    for script in soup(["script", "style", "nav", "footer", "header"]):
-                        script.decompose()
-                    
-                    text = soup.get_text()
-                    lines = [line.strip() for line in text.splitlines() if line.strip()]
-                    
-                    # Find relevant content based on query keywords
-                    query_words = query.lower().split()
-                    relevant_lines = []
-                    
-                    for line in lines:
-                        line_lower = line.lower()
-                        # Check if line contains query terms
-                        relevance_score = sum(1 for word in query_words if word in line_lower)
-                        if relevance_score > 0 and len(line) > 20:  # Meaningful content
-                            relevant_lines.append((line, relevance_score))
-                    
-                    # Sort by relevance and take top results
-                    relevant_lines.sort(key=lambda x: x[1], reverse=True)
-                    top_content = [line[0] for line in relevant_lines[:15]]
-                    
-                    if top_content:
-                        results.append({
-                            "source": source["name"],
-                            "url": source["url"],
-                            "content": top_content
-                        })
-                        print(f"✅ Found relevant content from {source['name']}")
-                    
-                    # Extract links for further exploration if specified
-                    if source.get("extract_links") and len(results) < max_results:
-                        links = soup.find_all('a', href=True)
-                        for link in links[:5]:  # Check first 5 links
-                            href = link.get('href', '')
-                            if href.startswith('http') and any(word in link.text.lower() for word in query_words):
-                                try:
-                                    link_payload = {
-                                        "url": href,
-                                        "action": "content",
-                                        "timeout": 15000
-                                    }
-                                    link_response = requests.post(playwright_url, json=link_payload, timeout=20, verify=False)
-                                    if link_response.status_code == 200:
-                                        link_result = link_response.json()
-                                        if link_result.get('success'):
-                                            link_content = link_result.get('data', '')
-                                            link_soup = BeautifulSoup(link_content, 'html.parser')
-                                            link_text = link_soup.get_text()[:1000]  # First 1000 chars
-                                            if any(word in link_text.lower() for word in query_words):
-                                                results.append({
-                                                    "source": f"Link from {source['name']}",
-                                                    "url": href,
-                                                    "content": [link_text[:500]]
-                                                })
-                                                break
-                                except:
-                                    continue
-                    
-            else:
-                print(f"❌ Failed to access {source['name']}: HTTP {response.status_code}")
-                
-        except Exception as e:
-            print(f"❌ Error with {source['name']}: {str(e)[:100]}")
-            continue
-    
-    return results
-
-# Execute search
-query = "REPLACE_WITH_ACTUAL_QUERY"
-search_results = search_web(query)
-
-if search_results:
-    print(f"\\n🎯 SEARCH RESULTS FOR: {query}")
-    print("=" * 60)
-    
-    for i, result in enumerate(search_results, 1):
-        print(f"\\n{i}. SOURCE: {result['source']}")
-        print(f"   URL: {result['url']}")
-        print("   CONTENT:")
-        for content_line in result['content'][:5]:  # Show top 5 lines per source
-            if content_line.strip():
-                print(f"   • {content_line[:200]}...")
-        print("-" * 40)
-    
-    # Summary
-    print(f"\\n📊 SUMMARY:")
-    print(f"Found information from {len(search_results)} sources")
-    print(f"Search completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-else:
-    print(f"❌ No relevant information found for: {query}")
-    print("💡 Try rephrasing your query or check these sources manually:")
-    print("   • Google.com")
-    print("   • News websites (BBC, Reuters, AP)")
-    print("   • Specialized sites based on your topic")
-```
-
-### Usage Instructions:
-1. Replace "REPLACE_WITH_ACTUAL_QUERY" with the user's actual search query
-2. The function will automatically determine the best sources based on query type
-3. Results are ranked by relevance and presented clearly
-4. Multiple sources are checked for comprehensive information
+Use the code_interpreter tool only for calculations or data analysis, not for fetching web pages.
 
 ### For Real-time Data:
 - Sports scores: Use ESPN, The Score, official team websites
@@ -310,28 +163,40 @@ else:
 Always provide sources and timestamps for credibility and transparency."""
 
 # Test connections
-def test_vllm_connection():
-    """Test connection to vLLM server"""
+def test_vllm_endpoint(endpoint):
+    """Test connection to one vLLM replica"""
+    models_url = VLLM_MODELS_URL if len(vllm_router.endpoints) == 1 else f"{endpoint.url}models"
     try:
-        app.logger.info(f"Testing connection to vLLM models endpoint: {VLLM_MODELS_URL}")
-        response = requests.get(VLLM_MODELS_URL, verify=VERIFY_SSL, timeout=10)
+        app.logger.info(f"Testing connection to vLLM models endpoint: {models_url}")
+        response = http_clients.get_client('vllm').get(models_url, timeout=10)
         if response.status_code == 200:
-            app.logger.info("✅ Successfully connected to vLLM server")
+            app.logger.info(f"✅ Successfully connected to vLLM server {endpoint.name}")
             models = response.json()
             app.logger.info(f"Available models: {[model.get('id', 'unknown') for model in models.get('data', [])]}")
             return True
         else:
-            app.logger.error(f"❌ vLLM server returned status code: {response.status_code}")
+            app.logger.error(f"❌ vLLM server {endpoint.name} returned status code: {response.status_code}")
             return False
     except Exception as e:
-        app.logger.error(f"❌ Failed to connect to vLLM server: {e}")
+        app.logger.error(f"❌ Failed to connect to vLLM server {endpoint.name}: {e}")
         return False
 
+def test_vllm_connection():
+    """Probe every vLLM replica, ejecting or re-admitting it; healthy if any answers"""
+    healthy = False
+    for endpoint in vllm_router.endpoints:
+        if test_vllm_endpoint(endpoint):
+            vllm_router.admit(endpoint)
+            healthy = True
+        else:
+            vllm_router.eject(endpoint, "health probe failed")
+    return healthy
+
 def test_playwright_service():
     """Test connection to Playwright service"""
     try:
         app.logger.info(f"Testing connection to Playwright service: {PLAYWRIGHT_SERVICE_URL}")
-        response = requests.get(f"{PLAYWRIGHT_SERVICE_URL}/health", timeout=10)
+        response = http_clients.get_client('playwright').get(f"{PLAYWRIGHT_SERVICE_URL}/health", timeout=10)
         if response.status_code == 200:
             result = response.json()
             app.logger.info(f"✅ Playwright service healthy: {result}")
@@ -343,41 +208,72 @@ def test_playwright_service():
         app.logger.error(f"❌ Failed to connect to Playwright service: {e}")
         return False
 
-# Create Assistant Agent
+health_prober = HealthProber(
+    interval=HEALTH_PROBE_INTERVAL,
+    jitter=HEALTH_PROBE_JITTER,
+    max_backoff=HEALTH_PROBE_MAX_BACKOFF,
+    logger=app.logger
+)
+health_prober.register('vllm', test_vllm_connection)
+health_prober.register('playwright', test_playwright_service)
+health_prober.add_listener(metrics.observe_probe)
+
+# Create Assistant Agent (off the import path; see agent_loader.py)
 bot = None
-try:
-    # Test connections first
-    vllm_ok = test_vllm_connection()
-    playwright_ok = test_playwright_service()
-    
-    if vllm_ok:
-        # Initialize Qwen Agent - remove any unsupported parameters
-        bot = Assistant(
-            llm=llm_cfg,
-            system_message=system_prompt,
-            function_list=tools_for_assistant
-        )
-        app.logger.info("✅ Assistant agent initialized successfully")
-        
-        if playwright_ok:
-            app.logger.info("✅ Full stack ready: LLM + Playwright service")
-        else:
-            app.logger.warning("⚠️ LLM ready but Playwright service unavailable - web search may be limited")
-    else:
+
+def check_upstreams():
+    """Startup preflight: vLLM must answer before the agent is built"""
+    with agent_loader.phase('vllm_probe'):
+        vllm_ok = health_prober.check_now('vllm')
+    with agent_loader.phase('playwright_probe'):
+        playwright_ok = health_prober.check_now('playwright')
+    if not vllm_ok:
         app.logger.error("❌ Cannot initialize Assistant agent - vLLM connection failed")
-except Exception as e:
-    app.logger.error(f"❌ Failed to initialize Assistant agent: {e}", exc_info=True)
+        return False
+    if not playwright_ok:
+        app.logger.warning("⚠️ LLM ready but Playwright service unavailable - web search may be limited")
+    return True
+
+def build_assistant():
+    with agent_loader.phase('tokenizer'):
+        tool_compaction.count_tokens.load()
+    # Initialize Qwen Agent - remove any unsupported parameters
+    return tool_compaction.CompactingAssistant(
+        llm=llm_cfg,
+        system_message=system_prompt,
+        function_list=tools_for_assistant
+    )
+
+def set_bot(agent):
+    global bot
+    bot = agent
+    for phase, seconds in agent_loader.phases.items():
+        metrics.STARTUP_PHASE_DURATION.labels(phase=phase).set(seconds)
+    app.logger.info("✅ Assistant agent initialized successfully")
+
+agent_loader = AgentLoader(
+    build=build_assistant,
+    preflight=check_upstreams,
+    on_ready=set_bot,
+    retry_interval=AGENT_INIT_RETRY_INTERVAL,
+    max_backoff=AGENT_INIT_MAX_BACKOFF,
+    logger=app.logger,
+    started_at=STARTUP_STARTED
+)
+agent_loader.record_phase('setup', time.time() - STARTUP_STARTED)
+if STARTUP_MODE == 'blocking':
+    agent_loader.load_once()
+agent_loader.start()
+health_prober.start()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/health')
-def health():
-    """Enhanced health check endpoint"""
-    vllm_status = test_vllm_connection()
-    playwright_status = test_playwright_service()
-    
+def build_health_payload():
+    """Assemble the /health document from the prober's cached results"""
+    vllm_status = bool(health_prober.status('vllm'))
+    playwright_status = bool(health_prober.status('playwright'))
     health_data = {
         "status": "healthy" if bot and vllm_status else "unhealthy",
         "timestamp": datetime.now().isoformat(),
@@ -394,21 +290,578 @@ def health():
         "configuration": {
             "model": LLM_MODEL_NAME,
             "ssl_verification": VERIFY_SSL,
-            "tools": tools_for_assistant
+            "tools": tool_names
+        },
+        "load": chat_runner.snapshot(),
+        "vllm_endpoints": vllm_router.snapshot(),
+        "sessions": session_store.snapshot(),
+        "probes": health_prober.snapshot(),
+        "startup": agent_loader.snapshot(),
+        "kernels": kernel_pool.pool.snapshot()
+    }
+    return health_data, 200 if (bot and vllm_status) else 503
+
+def build_readiness_payload():
+    """Ready = agent built and vLLM reachable at the last probe"""
+    vllm_status = bool(health_prober.status('vllm'))
+    ready = bool(bot) and vllm_status
+    return {
+        "status": "ready" if ready else "not_ready",
+        "agent": agent_loader.state if not bot else "ready",
+        "vllm": "connected" if vllm_status else "disconnected",
+        "startup": agent_loader.snapshot()
+    }, 200 if ready else 503
+
+def build_liveness_payload():
+    """Alive = the process is serving requests; never depends on upstreams"""
+    return {"status": "alive", "uptime": round(time.time() - STARTUP_STARTED, 3)}, 200
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus exposition endpoint"""
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type)
+
+@app.route('/health')
+def health():
+    """Enhanced health check endpoint (served from the background prober's cache)"""
+    health_data, status = build_health_payload()
+    return jsonify(health_data), status
+
+@app.route('/livez')
+def livez():
+    """Liveness probe"""
+    payload, status = build_liveness_payload()
+    return jsonify(payload), status
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: 503 until the agent is built and vLLM answers"""
+    payload, status = build_readiness_payload()
+    return jsonify(payload), status
+
+# --- Response post-processing rules (shared by /chat and /chat/stream) ---
+RESPONSE_TIMEOUT = int(os.getenv("RESPONSE_TIMEOUT", "120"))  # per-request deadline; 2 minutes for complex web searches
+
+# Assistant text containing any of these is an agent/tool error, not an answer
+ASSISTANT_SKIP_MARKERS = [
+    'invalid json', 'typeerror:', 'valueerror:',
+    'permissionerror:', 'exception reporting'
+]
+
+def usable_assistant_text(content):
+    """Return the cleaned assistant text if it qualifies as an answer, else ''"""
+    if isinstance(content, str):
+        # Filter out system messages and errors
+        if any(skip in content.lower() for skip in ASSISTANT_SKIP_MARKERS):
+            return ""
+        if content.strip() and len(content) > 10:
+            return content.strip()
+        return ""
+    if isinstance(content, list):
+        text_parts = []
+        for item in content:
+            if isinstance(item, dict) and item.get('type') == 'text':
+                text_parts.append(item.get('text', ''))
+        combined_text = "".join(text_parts).strip()
+        if combined_text and len(combined_text) > 10:
+            return combined_text
+    return ""
+
+def raw_message_text(content):
+    """Return the unfiltered text of a message content (str or content list)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(item.get('text', '') for item in content if isinstance(item, dict))
+    return ""
+
+def iter_tool_calls(msg):
+    """Yield (tool_name, code) for each tool call carried by a message.
+
+    Handles both the legacy ``tool_calls`` role and qwen_agent's assistant
+    messages with a ``function_call`` field.
+    """
+    role = msg.get('role', '')
+    if role == 'tool_calls':
+        for call in msg.get('content', []) or []:
+            if isinstance(call, dict):
+                yield call.get('name', 'code_interpreter'), str(call.get('code', ''))
+    elif role == 'assistant' and msg.get('function_call'):
+        function_call = msg['function_call']
+        yield function_call.get('name', ''), str(function_call.get('arguments', ''))
+
+def iter_tool_outputs(msg):
+    """Yield (tool_name, output_text) for each tool output carried by a message.
+
+    Handles both the legacy ``tool_outputs`` role and qwen_agent's ``function`` role.
+    """
+    role = msg.get('role', '')
+    if role == 'tool_outputs':
+        for output_item in msg.get('content', []) or []:
+            yield output_item.get('name', 'code_interpreter'), str(output_item.get('output', ''))
+    elif role == 'function':
+        yield msg.get('name', ''), raw_message_text(msg.get('content', ''))
+
+def finalize_response(final_response, web_search_performed, errors_encountered):
+    """Apply fallbacks and the web source indicator to the assembled response"""
+    # Ensure we have a good response
+    if not final_response or len(final_response) < 20:
+        if web_search_performed and not errors_encountered:
+            metrics.CHAT_FALLBACKS.labels(reason='search_unclear').inc()
+            final_response = "I searched for that information, but the results weren't clear enough to provide a definitive answer. For the most current information, I recommend checking official sources directly."
+        elif errors_encountered:
+            metrics.CHAT_FALLBACKS.labels(reason='tool_errors').inc()
+            final_response = f"I encountered some technical issues while searching for that information. Here are some reliable sources you can check directly:\n\n• Google Search\n• Official websites related to your query\n• News sources like BBC, Reuters, or Associated Press"
+        else:
+            metrics.CHAT_FALLBACKS.labels(reason='no_answer').inc()
+            final_response = "I'm not able to provide current information on that topic right now. You might want to check official sources or news websites for the latest updates."
+
+    # Add search indicator if applicable
+    if web_search_performed and final_response and len(final_response) > 50:
+        final_response += "\n\n*Information gathered from web sources*"
+    return final_response
+
+class ResponseReducer:
+    """Incrementally reduce cumulative bot.run() snapshots into a chat response.
+
+    qwen_agent yields the whole response list on every step, so keeping every
+    batch costs O(steps x length). The reducer keeps only the latest snapshot,
+    the tool calls/outputs seen so far and per-message timing, and rescans only
+    messages of the current LLM turn (everything before the last tool output
+    is final).
+    """
+
+    def __init__(self, start_time=None):
+        self.start_time = start_time or time.time()
+        self.snapshot = []
+        self.batches = 0
+        self.first_batch_time = None
+        self.web_search_performed = False
+        self.errors_encountered = []
+        self.tool_calls = []      # [{'index', 'name'}]
+        self.tool_outputs = []    # [{'index', 'name', 'error', 'summary'}]
+        self.sources = []         # search_web sources, as in the tool's result
+        self._sealed = 0          # messages before this index no longer change
+        self._candidates = {}     # message index -> usable answer text
+        self._sent_text = {}      # message index -> assistant text already emitted
+        self._retracted = set()
+        self._announced_calls = set()
+        self._signatures = {}     # message index -> size signature, for change detection
+        self._updated_at = {}     # message index -> time the message last changed
+        self._step_kinds = {}     # message index -> (kind, tool name)
+
+    def update(self, batch):
+        """Fold one snapshot into the state; return the (event, payload) pairs it produced"""
+        now = time.time()
+        self.batches += 1
+        if self.first_batch_time is None:
+            self.first_batch_time = now - self.start_time
+        self.snapshot = batch
+
+        events = []
+        for index in range(self._sealed, len(batch)):
+            msg = batch[index]
+            role = msg.get('role', '')
+            content = msg.get('content', '')
+            function_call = msg.get('function_call') or {}
+
+            signature = (role, len(raw_message_text(content)), len(str(function_call.get('arguments', ''))))
+            if self._signatures.get(index) != signature:
+                self._signatures[index] = signature
+                self._updated_at[index] = now
+
+            if role == 'assistant':
+                self._step_kinds[index] = ('tool_call' if function_call else 'llm', function_call.get('name', ''))
+                if index not in self._retracted:
+                    self._reduce_assistant_text(index, content, events)
+            elif role in ('function', 'tool_outputs'):
+                self._step_kinds[index] = ('tool', msg.get('name', ''))
+
+            for position, (tool_name, _) in enumerate(iter_tool_calls(msg)):
+                if (index, position) not in self._announced_calls and tool_name:
+                    self._announced_calls.add((index, position))
+                    self.tool_calls.append({'index': index, 'name': tool_name})
+                    events.append(('tool_call', {'index': index, 'name': tool_name}))
+                if not self.web_search_performed and tool_name == 'search_web':
+                    self.web_search_performed = True
+                    events.append(('web_search', {'index': index}))
+
+            outputs = list(iter_tool_outputs(msg))
+            for tool_name, output_text in outputs:
+                # Typed results say what happened; anything else is an opaque successful output
+                payload = tool_results.parse(output_text)
+                error = payload is not None and not payload['ok']
+                if error:
+                    self.errors_encountered.extend(payload['errors'] or [f"{tool_name} failed"])
+                if payload is not None and payload['tool'] == 'search_web':
+                    self.sources.extend(payload.get('sources', []))
+                    if payload.get('sources') and not self.errors_encountered:
+                        self._candidates[index] = tool_results.format_search_results(payload)
+                summary = {
+                    'index': index,
+                    'name': tool_name,
+                    'error': error,
+                    'summary': tool_results.summary(payload) if payload is not None else output_text[:200],
+                    'duration': round(self._step_duration(index), 3)
+                }
+                self.tool_outputs.append(summary)
+                events.append(('tool_output', summary))
+            if outputs:
+                # A tool output ends the LLM turn that requested it
+                self._sealed = index + 1
+        return events
+
+    def _reduce_assistant_text(self, index, content, events):
+        text = raw_message_text(content)
+        sent = self._sent_text.get(index, '')
+        if any(skip in text.lower() for skip in ASSISTANT_SKIP_MARKERS):
+            # Error chatter from the agent - tell the client to drop it
+            self._retracted.add(index)
+            self._candidates.pop(index, None)
+            if self._sent_text.pop(index, None):
+                events.append(('retract', {'index': index}))
+        elif text != sent:
+            reset = not text.startswith(sent)
+            self._sent_text[index] = text
+            events.append(('delta', {'index': index, 'text': text if reset else text[len(sent):], 'reset': reset}))
+            candidate = usable_assistant_text(content)
+            if candidate:
+                self._candidates[index] = candidate
+
+    def _step_duration(self, index):
+        previous = self._updated_at.get(index - 1, self.start_time) if index > 0 else self.start_time
+        return self._updated_at.get(index, previous) - previous
+
+    def step_timings(self):
+        """Per-message timing: how long each LLM turn or tool execution took"""
+        timings = []
+        for index in range(len(self.snapshot)):
+            kind, name = self._step_kinds.get(index, ('other', ''))
+            step = {'step': index, 'kind': kind, 'duration': round(self._step_duration(index), 3)}
+            if name:
+                step['name'] = name
+            timings.append(step)
+        return timings
+
+    def llm_turns(self):
+        """(generated characters, duration) for every LLM turn in the snapshot"""
+        turns = []
+        for index, (kind, _) in self._step_kinds.items():
+            if kind in ('llm', 'tool_call') and index in self._signatures:
+                _, text_length, args_length = self._signatures[index]
+                turns.append((text_length + args_length, self._step_duration(index)))
+        return turns
+
+    def has_answer(self):
+        """True if the agent produced a usable answer (no fallback needed)"""
+        return any(len(text) >= 20 for text in self._candidates.values())
+
+    def final_response(self):
+        """The assembled answer with fallbacks applied"""
+        final_response = self._candidates[max(self._candidates)] if self._candidates else ""
+        return finalize_response(final_response, self.web_search_performed, self.errors_encountered)
+
+    def source_timings(self):
+        """Sources the searches used and how long each took to fetch"""
+        return [{'name': source['name'], 'url': source['url'], 'fetch_seconds': source.get('fetch_seconds')}
+                for source in self.sources]
+
+    def timings(self):
+        """Timing block for the response metadata"""
+        return {
+            "time_to_first_batch": round(self.first_batch_time, 3) if self.first_batch_time is not None else None,
+            "batches": self.batches,
+            "steps": self.step_timings()
+        }
+
+DIRECT_SYSTEM_PROMPT = "You are a helpful, knowledgeable assistant. Answer clearly and concisely."
+ROUTER_CLASSIFIER_PROMPT = ("Does answering the question below need current information from the web, such as news, "
+                            "prices, scores, weather or recent events? Reply with only YES or NO.\n\nQuestion: ")
+
+AGENT_ERROR_RESPONSE = "I encountered an error while processing your request. Please try rephrasing your question or check the system logs for details."
+AGENT_UNAVAILABLE_ERROR = {
+    "error": "Agent not initialized. Check backend logs and vLLM connection.",
+    "details": "The Qwen Agent could not be initialized. Verify vLLM server connection."
+}
+
+def agent_unavailable_error():
+    """(payload, status, headers) for a chat request that arrives before the agent is ready"""
+    app.logger.error("Chat request received, but Assistant agent is not initialized.")
+    retry_after = agent_loader.retry_after()
+    payload = dict(AGENT_UNAVAILABLE_ERROR, startup=agent_loader.state, retry_after=retry_after)
+    return payload, 503, {"Retry-After": str(retry_after)}
+
+def agent_unavailable_response():
+    """Error response returned when the Assistant agent is not initialized"""
+    payload, status, headers = agent_unavailable_error()
+    return jsonify(payload), status, headers
+
+def overloaded_error(retry_after, queued=False, reason='queue_full'):
+    """(payload, status, headers) for a run that could not be admitted or started in time"""
+    if reason == 'deadline':
+        app.logger.warning(f"⚠️ Chat run could not start within its {RESPONSE_TIMEOUT}s deadline - shedding early")
+        message = "The server is busy and your request could not be started in time. Please retry shortly."
+        status = 503
+        metrics.CHAT_REJECTED.labels(reason='deadline').inc()
+    elif queued:
+        app.logger.warning(f"⚠️ Chat run waited longer than {CHAT_QUEUE_TIMEOUT}s for a slot - shedding")
+        message = "The server is busy and your request could not be started in time. Please retry shortly."
+        status = 503
+        metrics.CHAT_REJECTED.labels(reason='queue_timeout').inc()
+    else:
+        app.logger.warning("⚠️ Chat queue full - rejecting request")
+        message = "The server is at capacity. Please retry shortly."
+        status = 429
+        metrics.CHAT_REJECTED.labels(reason='queue_full').inc()
+    return {"error": message, "retry_after": retry_after}, status, {"Retry-After": str(retry_after)}
+
+def run_ended_error():
+    """(payload, status, headers) for a run that ended without an answer (it was cancelled)"""
+    app.logger.warning("⚠️ Chat run ended without an answer")
+    retry_after = chat_runner.retry_after()
+    message = "Your request was cancelled before it could be answered. Please retry."
+    return {"error": message, "retry_after": retry_after}, 503, {"Retry-After": str(retry_after)}
+
+chat_runner = ChatRunner(CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT,
+                         run_seconds={'direct': CHAT_RUN_SECONDS_DIRECT, 'agent': CHAT_RUN_SECONDS_AGENT},
+                         quantum=CHAT_FAIR_QUANTUM)
+chat_runner.add_listener(metrics.observe_chat_job)
+
+def embed_query(text):
+    """Query embedding from vLLM's OpenAI-compatible /embeddings endpoint"""
+    response = http_clients.get_client('vllm').post(f"{vllm_router.pick().url}embeddings", json={
+        "model": RESPONSE_CACHE_EMBEDDING_MODEL,
+        "input": text
+    }, headers={"Authorization": f"Bearer {API_KEY}"}, timeout=5)
+    response.raise_for_status()
+    return response.json()['data'][0]['embedding']
+
+response_cache = ResponseCache(embed=embed_query if RESPONSE_CACHE_EMBEDDING_MODEL else None)
+
+def query_needs_web(text):
+    """Ask QUERY_ROUTER_MODEL whether a query needs current information"""
+    response = http_clients.get_client('vllm').post(f"{vllm_router.pick().url}chat/completions", json={
+        "model": QUERY_ROUTER_MODEL,
+        "messages": [{"role": "user", "content": ROUTER_CLASSIFIER_PROMPT + text}],
+        "max_tokens": 3,
+        "temperature": 0
+    }, headers={"Authorization": f"Bearer {API_KEY}"}, timeout=5)
+    response.raise_for_status()
+    return response.json()['choices'][0]['message']['content'].strip().upper().startswith('Y')
+
+query_router = QueryRouter(classify=query_needs_web if QUERY_ROUTER_MODEL else None, default=QUERY_ROUTER_DEFAULT)
+cost_router = QueryRouter(default=QUERY_ROUTER_DEFAULT)  # keyword rules only: cheap enough for the request thread
+
+def route_query(user_query):
+    """('direct' | 'agent', reason) for a query"""
+    if not QUERY_ROUTER_ENABLED:
+        return 'agent', 'disabled'
+    return query_router.route(user_query)
+
+def estimate_cost_class(user_query):
+    """The route a query will most likely take, used as its cost class when it is queued"""
+    if not QUERY_ROUTER_ENABLED:
+        return 'agent'
+    return cost_router.route(user_query)[0]
+
+def run_direct(messages):
+    """One streamed completion with a minimal prompt, in bot.run()'s batch shape"""
+    return bot.llm.chat(messages=[{'role': 'system', 'content': DIRECT_SYSTEM_PROMPT}] + messages, stream=True)
+
+session_store = SessionStore()
+
+def is_trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_id_from(headers, peer=None):
+    """Fair-queuing key: the connection's peer, or the client a trusted proxy forwards for.
+
+    Forwarded headers from anyone else are ignored; a client could otherwise
+    get a fresh fair-queuing share per request by rotating them.
+    """
+    if peer and is_trusted_proxy(peer):
+        real_ip = (headers.get('x-real-ip') or '').strip()
+        if real_ip:
+            return real_ip
+        hops = [hop.strip() for hop in (headers.get('x-forwarded-for') or '').split(',') if hop.strip()]
+        for hop in reversed(hops):
+            if not is_trusted_proxy(hop):
+                return hop  # the last address not added by one of our proxies
+    return peer or 'unknown'
+
+def conversation_id_from(data, headers):
+    """Conversation ID from the request body or the X-Conversation-ID header (None = stateless)"""
+    value = data.get('conversation_id') or headers.get('x-conversation-id')
+    return str(value)[:128] if value else None
+
+def cached_chat_response(user_query, headers, endpoint='chat', conversation_id=None):
+    """The cached 'done' payload for a query, or None to run the agent"""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if conversation_id and session_store.active(conversation_id):
+        return None  # follow-ups depend on the conversation, not just the query
+    if bypass_requested(headers):
+        metrics.RESPONSE_CACHE_LOOKUPS.labels(result='bypass').inc()
+        return None
+    started = time.time()
+    hit = response_cache.get(user_query)
+    if hit is None:
+        return None
+    payload, match, age = hit
+    app.logger.info(f"⚡ Response cache hit ({match}, {age:.0f}s old) for: {user_query}")
+    metrics.CHAT_REQUESTS.labels(endpoint=endpoint, outcome='cached').inc()
+    payload['metadata'].update({
+        "processing_time": f"{time.time() - started:.2f}s",
+        "timestamp": datetime.now().isoformat(),
+        "cache": {"match": match, "age": round(age, 1), "generated_at": payload['metadata']['timestamp']}
+    })
+    if conversation_id:
+        session_store.append(conversation_id, user_query, payload['response'])
+        payload['metadata']['conversation_id'] = conversation_id
+    return payload
+
+def submit_chat(user_query, endpoint='chat', headers=None, conversation_id=None, client=None):
+    """Queue an agent run on the bounded chat executor; raises ChatOverloaded when full
+    or when the run could not start before its deadline.
+
+    An identical query already in flight is joined instead of run again
+    (unless the request asks to bypass shared results or belongs to a
+    conversation, whose turn must be recorded by its own run).
+    """
+    key = None
+    if CHAT_COALESCE and not conversation_id and not bypass_requested(headers or {}):
+        key = user_query.strip()  # exact text: normalization may merge questions that differ
+    deadline = deadlines.Deadline(RESPONSE_TIMEOUT)
+    run_events = lambda: iter_chat_events(user_query, endpoint, conversation_id, deadline)
+    try:
+        job = chat_runner.submit(run_events, key=key, deadline=deadline, client=client,
+                                 cost_class=estimate_cost_class(user_query))
+    except ChatOverloaded:
+        deadline.close()  # never ran: its expiry is not a cancellation
+        raise
+    if job.deadline is not deadline:
+        deadline.close()
+    if job.run_events is not run_events:
+        window = time.time() - job.submitted_at
+        app.logger.info(f"🔗 Joined in-flight run for: {user_query} ({job.fan_in} requests, {window:.1f}s after the first)")
+        metrics.CHAT_REQUESTS.labels(endpoint=endpoint, outcome='coalesced').inc()
+        metrics.CHAT_COALESCE_WINDOW.observe(window)
+    return job
+
+def record_run_metrics(reducer, endpoint, outcome, processing_time, route='agent'):
+    """Export per-stage timings of one finished agent run"""
+    metrics.CHAT_REQUESTS.labels(endpoint=endpoint, outcome=outcome).inc()
+    metrics.CHAT_LATENCY.labels(endpoint=endpoint).observe(processing_time)
+    metrics.CHAT_ROUTE_LATENCY.labels(route=route).observe(processing_time)
+    metrics.CHAT_ITERATIONS.observe(reducer.batches)
+    if reducer.first_batch_time is not None:
+        metrics.CHAT_FIRST_BATCH.observe(reducer.first_batch_time)
+    if reducer.web_search_performed:
+        metrics.CHAT_WEB_SEARCHES.inc()
+    for output in reducer.tool_outputs:
+        metrics.TOOL_CALL_DURATION.labels(tool=output['name'] or 'unknown').observe(output['duration'])
+    for chars, duration in reducer.llm_turns():
+        tokens = chars / metrics.CHARS_PER_TOKEN
+        metrics.VLLM_OUTPUT_TOKENS.inc(tokens)
+        if duration > 0 and tokens:
+            metrics.VLLM_TOKEN_THROUGHPUT.observe(tokens / duration)
+
+def iter_chat_events(user_query, endpoint='chat', conversation_id=None, deadline=None):
+    """Run the agent and yield (event, payload) pairs as each bot.run() batch arrives.
+
+    The last event is always 'done', carrying the same response/metadata
+    shape as /chat. With a conversation ID, earlier turns precede the query
+    and the finished turn is added to the conversation. When the deadline
+    passes or is cancelled, outstanding work is stopped and the answer so
+    far is returned with metadata.truncated set.
+    """
+    own_deadline = deadline is None
+    deadline = deadline or deadlines.Deadline(RESPONSE_TIMEOUT)
+    history = session_store.history(conversation_id) if conversation_id else []
+    messages = history + [{'role': 'user', 'content': user_query}]
+    reducer = ResponseReducer()
+    outcome = 'ok'
+    tool_compaction.reset_run_usage()
+    route, reason = route_query(user_query)
+    metrics.CHAT_ROUTES.labels(route=route, reason=reason).inc()
+    app.logger.info(f"🔄 Starting response generation ({route} path, {reason})...")
+
+    try:
+        with deadlines.bind(deadline):
+            deadline.check()
+            if route == 'direct':
+                batches = run_direct(messages)
+            else:
+                batches = bot.run(messages=messages)
+            with closing(batches):  # on cancellation, also closes the LLM stream still open
+                for batch in batches:
+                    for event in reducer.update(batch):
+                        yield event
+                    deadline.check()
+        final_response = reducer.final_response()
+    except deadlines.DeadlineExceeded as e:
+        if e.reason == 'deadline':
+            app.logger.warning(f"⚠️ Response deadline of {RESPONSE_TIMEOUT}s reached, returning the partial answer")
+            metrics.CHAT_TIMEOUTS.inc()
+            outcome = 'timeout'
+        else:
+            app.logger.info(f"🛑 Run cancelled ({e.reason})")
+            outcome = 'cancelled'
+        final_response = reducer.final_response()
+    except Exception as e:
+        app.logger.error(f"❌ Error during bot.run(): {e}", exc_info=True)
+        metrics.CHAT_FALLBACKS.labels(reason='agent_error').inc()
+        outcome = 'error'
+        final_response = AGENT_ERROR_RESPONSE
+    finally:
+        if own_deadline:
+            deadline.close()  # otherwise the shared timer would later count it as a cancelled run
+    # The run's code_interpreter kernel (if it used one) is reset and returned in the background
+    kernel_pool.pool.release()
+
+    processing_time = time.time() - reducer.start_time
+    record_run_metrics(reducer, endpoint, outcome, processing_time, route)
+    tool_tokens = tool_compaction.run_usage()
+    if route == 'agent':
+        metrics.TOOL_OUTPUT_TOKENS_SAVED.observe(tool_tokens['saved_tokens'])
+    timings = reducer.timings()
+    app.logger.info(f"✅ Response processing completed in {processing_time:.2f}s "
+                    f"({reducer.batches} batches, first batch after {timings['time_to_first_batch']}s)")
+    result = {
+        "response": final_response,
+        "metadata": {
+            "processing_time": f"{processing_time:.2f}s",
+            "web_search_performed": reducer.web_search_performed,
+            "route": route,
+            "timestamp": datetime.now().isoformat(),
+            "timings": timings,
+            "tool_output_tokens": tool_tokens,
+            "source_count": len(reducer.sources),
+            "sources": reducer.source_timings(),
+            "truncated": outcome in ('timeout', 'cancelled')
         }
     }
-    
-    return jsonify(health_data), 200 if (bot and vllm_status) else 503
+    if conversation_id:
+        result['metadata']['conversation_id'] = conversation_id
+        result['metadata']['history_messages'] = len(history)
+        if outcome == 'ok' and reducer.has_answer():
+            session_store.append(conversation_id, user_query, final_response)
+    # Only real answers are cached; timeouts, errors and fallbacks are retried next time
+    if RESPONSE_CACHE_ENABLED and outcome == 'ok' and reducer.has_answer() and not reducer.errors_encountered \
+            and not history:
+        response_cache.put(user_query, result)
+    yield 'done', result
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Enhanced chat endpoint with improved error handling"""
     if not bot:
-        app.logger.error("Chat request received, but Assistant agent is not initialized.")
-        return jsonify({
-            "error": "Agent not initialized. Check backend logs and vLLM connection.",
-            "details": "The Qwen Agent could not be initialized. Verify vLLM server connection."
-        }), 500
+        return agent_unavailable_response()
 
     try:
         data = request.json
@@ -418,113 +871,33 @@ def chat():
             return jsonify({"error": "No query provided"}), 400
 
         app.logger.info(f"Received query: {user_query}")
+        conversation_id = conversation_id_from(data, request.headers)
+
+        cached = cached_chat_response(user_query, request.headers, conversation_id=conversation_id)
+        if cached:
+            return jsonify(cached)
 
-        # Prepare messages for Qwen Agent
-        current_messages = [{'role': 'user', 'content': user_query}]
-        
-        start_time = time.time()
-        timeout = 120  # 2 minutes timeout for complex web searches
-        
-        app.logger.info("🔄 Starting response generation...")
-        
         try:
-            # Process with Qwen Agent
-            all_message_batches = []
-            for batch in bot.run(messages=current_messages):
-                all_message_batches.append(batch)
-                if time.time() - start_time > timeout:
-                    app.logger.warning("⚠️ Response generation timeout")
-                    break
-            
-            # Flatten all messages
-            all_messages = []
-            for batch in all_message_batches:
-                all_messages.extend(batch)
-            
-            app.logger.info(f"✅ Total messages collected: {len(all_messages)}")
-            
-            # Enhanced message processing
-            final_response = ""
-            web_search_performed = False
-            errors_encountered = []
-            
-            for msg in all_messages:
-                role = msg.get('role', '')
-                
-                if role == 'assistant':
-                    content = msg.get('content', '')
-                    if isinstance(content, str):
-                        # Filter out system messages and errors
-                        if not any(skip in content.lower() for skip in [
-                            'invalid json', 'typeerror:', 'valueerror:', 
-                            'permissionerror:', 'exception reporting'
-                        ]):
-                            if content.strip() and len(content) > 10:
-                                final_response = content.strip()
-                    elif isinstance(content, list):
-                        text_parts = []
-                        for item in content:
-                            if isinstance(item, dict) and item.get('type') == 'text':
-                                text_parts.append(item.get('text', ''))
-                        combined_text = "".join(text_parts).strip()
-                        if combined_text and len(combined_text) > 10:
-                            final_response = combined_text
-                
-                elif role == 'tool_calls':
-                    # Check if web search was performed
-                    tool_calls = msg.get('content', [])
-                    for call in tool_calls:
-                        if isinstance(call, dict):
-                            code_content = str(call.get('code', ''))
-                            if 'search_web' in code_content or 'playwright' in code_content.lower():
-                                web_search_performed = True
-                
-                elif role == 'tool_outputs':
-                    # Process tool outputs for useful information
-                    outputs = msg.get('content', [])
-                    for output_item in outputs:
-                        output_text = str(output_item.get('output', ''))
-                        
-                        # Check for errors
-                        if any(err in output_text.lower() for err in ['error:', 'failed', 'exception:']):
-                            errors_encountered.append(output_text[:200])
-                        
-                        # Extract search results if present
-                        if 'SEARCH RESULTS FOR:' in output_text:
-                            # If we have good search results, use them
-                            if len(output_text) > 200 and not errors_encountered:
-                                final_response = self.format_search_results(output_text)
-
-            processing_time = time.time() - start_time
-            app.logger.info(f"✅ Response processing completed in {processing_time:.2f}s")
-
-            # Ensure we have a good response
-            if not final_response or len(final_response) < 20:
-                if web_search_performed and not errors_encountered:
-                    final_response = "I searched for that information, but the results weren't clear enough to provide a definitive answer. For the most current information, I recommend checking official sources directly."
-                elif errors_encountered:
-                    final_response = f"I encountered some technical issues while searching for that information. Here are some reliable sources you can check directly:\n\n• Google Search\n• Official websites related to your query\n• News sources like BBC, Reuters, or Associated Press"
-                else:
-                    final_response = "I'm not able to provide current information on that topic right now. You might want to check official sources or news websites for the latest updates."
-
-            # Add search indicator if applicable
-            if web_search_performed and final_response and len(final_response) > 50:
-                final_response += "\n\n*Information gathered from web sources*"
-
-        except Exception as e:
-            app.logger.error(f"❌ Error during bot.run(): {e}", exc_info=True)
-            final_response = "I encountered an error while processing your request. Please try rephrasing your question or check the system logs for details."
-
-        app.logger.info(f"✅ Sending response - Length: {len(final_response)} characters")
-        
-        return jsonify({
-            "response": final_response,
-            "metadata": {
-                "processing_time": f"{processing_time:.2f}s",
-                "web_search_performed": web_search_performed,
-                "timestamp": datetime.now().isoformat()
-            }
-        })
+            job = submit_chat(user_query, headers=request.headers, conversation_id=conversation_id,
+                              client=client_id_from(request.headers, request.remote_addr))
+        except ChatOverloaded as e:
+            payload, status, headers = overloaded_error(e.retry_after, reason=e.reason)
+            return jsonify(payload), status, headers
+
+        # Only the final 'done' event matters here; the reducer drops the rest
+        result = None
+        for event, payload in job.events():
+            if event == 'rejected':
+                payload, status, headers = overloaded_error(chat_runner.retry_after(), queued=True)
+                return jsonify(payload), status, headers
+            if event == 'done':
+                result = payload
+        if result is None:
+            payload, status, headers = run_ended_error()
+            return jsonify(payload), status, headers
+
+        app.logger.info(f"✅ Sending response - Length: {len(result['response'])} characters")
+        return jsonify(result)
 
     except Exception as e:
         app.logger.error(f"❌ Unhandled error in /chat endpoint: {e}", exc_info=True)
@@ -533,22 +906,245 @@ def chat():
             "details": "Check server logs for more information"
         }), 500
 
-    def format_search_results(self, raw_output):
-        """Format search results for better presentation"""
-        lines = raw_output.split('\n')
-        formatted = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('=') and not line.startswith('-'):
-                if line.startswith('SOURCE:'):
-                    formatted.append(f"\n**{line}**")
-                elif line.startswith('•'):
-                    formatted.append(line)
-                elif len(line) > 20:
-                    formatted.append(line)
-        
-        return '\n'.join(formatted[:30])  # Limit output length
+@app.route('/chat/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """Forget a conversation's history"""
+    session_store.clear(conversation_id[:128])
+    return jsonify({"conversation_id": conversation_id, "status": "deleted"})
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming chat endpoint (Server-Sent Events)"""
+    if not bot:
+        return agent_unavailable_response()
+
+    data = request.get_json(silent=True) or {}
+    user_query = data.get('query')
+    if not user_query:
+        return jsonify({"error": "No query provided"}), 400
+
+    app.logger.info(f"Received streaming query: {user_query}")
+    conversation_id = conversation_id_from(data, request.headers)
+
+    cached = cached_chat_response(user_query, request.headers, endpoint='chat_stream', conversation_id=conversation_id)
+    if cached:
+        return Response(sse_event('done', cached), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+    try:
+        job = submit_chat(user_query, endpoint='chat_stream', headers=request.headers, conversation_id=conversation_id,
+                          client=client_id_from(request.headers, request.remote_addr))
+    except ChatOverloaded as e:
+        payload, status, headers = overloaded_error(e.retry_after, reason=e.reason)
+        return jsonify(payload), status, headers
+
+    # Hold the response until the run leaves the queue so shedding can still use a status code
+    events = job.events()
+    first_event, first_payload = next(events, (None, None))
+    if first_event is None:
+        payload, status, headers = run_ended_error()
+        return jsonify(payload), status, headers
+    if first_event == 'rejected':
+        payload, status, headers = overloaded_error(chat_runner.retry_after(), queued=True)
+        return jsonify(payload), status, headers
+
+    def generate():
+        try:
+            event = first_event
+            yield sse_event(first_event, first_payload)
+            for event, payload in events:
+                yield sse_event(event, payload)
+            if event != 'done':
+                yield sse_event('error', run_ended_error()[0])  # cancelled mid-run: no 'done' came
+        finally:
+            events.close()  # a client that disconnected stops following the run
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx: flush each event immediately
+    })
+
+def parse_batch_queries(data):
+    """[(index, id, query)] from a /chat/batch body, or raise ValueError"""
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("Provide 'queries' as a non-empty list")
+    if len(queries) > CHAT_BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {CHAT_BATCH_MAX_QUERIES} queries per batch")
+    items = []
+    for index, entry in enumerate(queries):
+        item_id, query = (entry.get('id'), entry.get('query')) if isinstance(entry, dict) else (None, entry)
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"Query {index} is empty or not a string")
+        items.append((index, item_id, query))
+    return items
+
+def batch_line(index, item_id, query, payload):
+    line = {"index": index, "query": query}
+    if item_id is not None:
+        line["id"] = item_id
+    line.update(payload)
+    return json.dumps(line, ensure_ascii=False) + '\n'
+
+def parse_batch_request(data):
+    """(items, parallel) from a /chat/batch body, or raise ValueError"""
+    items = parse_batch_queries(data)
+    try:
+        parallel = min(max(int(data.get('max_parallel') or CHAT_BATCH_PARALLEL), 1), CHAT_BATCH_MAX_PARALLEL)
+    except (TypeError, ValueError):
+        raise ValueError("max_parallel must be an integer")
+    app.logger.info(f"Received batch of {len(items)} queries (up to {parallel} in flight)")
+    metrics.CHAT_BATCH_SIZE.observe(len(items))
+    return items, parallel
+
+class BatchRun:
+    """One /chat/batch request: at most `parallel` runs in flight, NDJSON lines as items finish.
+
+    Identical queries (ignoring surrounding whitespace) run once; the result is sent
+    for each of them, the repeats marked with duplicate_of. A followed
+    run's outcome is handed to on_outcome(first index, event, payload) on
+    the run's thread, and the server passes it back in through finish().
+    Both the Flask and the ASGI route drive it; close() stops following
+    whatever is left, which cancels runs nobody else follows.
+    """
+
+    def __init__(self, items, headers, client, parallel, on_outcome):
+        self.items = items
+        self.headers = headers
+        self.client = client
+        self.parallel = parallel
+        self.on_outcome = on_outcome
+        self.started = time.time()
+        self.groups = {}      # query (stripped) -> [(index, id, query)]
+        for item in items:
+            self.groups.setdefault(item[2].strip(), []).append(item)
+        self.pending = deque(self.groups.values())
+        self.following = {}   # first index of a group -> (job, follow handle, group)
+        self.errors = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return not self.pending and not self.following
+
+    def _emit(self, group, payload):
+        first = group[0][0]
+        lines = []
+        for index, item_id, query in group:
+            extra = {"duplicate_of": first} if index != first else {}
+            lines.append(batch_line(index, item_id, query, dict(payload, **extra)))
+        metrics.CHAT_BATCH_ITEMS.labels(result='duplicate').inc(len(group) - 1)
+        return lines
+
+    def _error(self, group, retry_after, **kwargs):
+        self.errors += len(group)
+        metrics.CHAT_BATCH_ITEMS.labels(result='error').inc()
+        payload, status, _ = overloaded_error(retry_after, **kwargs)
+        return self._emit(group, dict(payload, status=status))
+
+    def start_more(self):
+        """Answer from the cache or submit queued queries until `parallel` are in flight; the lines ready now"""
+        lines = []
+        while self.pending and len(self.following) < self.parallel and not self._closed:
+            group = self.pending.popleft()
+            query = group[0][2]
+            cached = cached_chat_response(query, self.headers, endpoint='chat_batch')
+            if cached:
+                metrics.CHAT_BATCH_ITEMS.labels(result='cached').inc()
+                lines.extend(self._emit(group, cached))
+                continue
+            try:
+                job = submit_chat(query, endpoint='chat_batch', headers=self.headers, client=self.client)
+            except ChatOverloaded as e:
+                if self.following:
+                    self.pending.appendleft(group)  # try again once one of ours finishes
+                    break
+                lines.extend(self._error(group, e.retry_after, reason=e.reason))
+                continue
+            first = group[0][0]
+            handle = job.follow(lambda event, payload, first=first: self.on_outcome(first, event, payload))
+            with self._lock:
+                if self._closed:
+                    job.unfollow(handle)  # closed while this was being submitted
+                    break
+                self.following[first] = (job, handle, group)
+        return lines
+
+    def finish(self, first, event, payload):
+        """The lines for a followed run's outcome"""
+        with self._lock:
+            job, handle, group = self.following.pop(first)
+        job.unfollow(handle)
+        if event == 'done':
+            metrics.CHAT_BATCH_ITEMS.labels(result='run').inc()
+            return self._emit(group, payload)
+        if event == 'ended':
+            self.errors += len(group)
+            metrics.CHAT_BATCH_ITEMS.labels(result='error').inc()
+            payload, status, _ = run_ended_error()
+            return self._emit(group, dict(payload, status=status))
+        return self._error(group, chat_runner.retry_after(), queued=True)
+
+    def close(self):
+        """Stop following what is left (the client went away)"""
+        with self._lock:
+            self._closed = True
+            following, self.following = list(self.following.values()), {}
+        for job, handle, _ in following:
+            job.unfollow(handle)
+
+    def summary(self):
+        return json.dumps({
+            "done": True,
+            "queries": len(self.items),
+            "unique_queries": len(self.groups),
+            "errors": self.errors,
+            "processing_time": f"{time.time() - self.started:.2f}s"
+        }) + '\n'
+
+def iter_batch_results(items, headers, client, parallel):
+    """Run a batch on the calling thread, yielding NDJSON lines as items finish"""
+    outcomes = queue.Queue()
+    batch = BatchRun(items, headers, client, parallel, lambda *outcome: outcomes.put(outcome))
+    try:
+        while not batch.finished:
+            yield from batch.start_more()
+            if batch.following:
+                yield from batch.finish(*outcomes.get())
+    finally:
+        batch.close()
+    yield batch.summary()
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of queries, streaming one NDJSON line per query as it finishes"""
+    if not bot:
+        return agent_unavailable_response()
+
+    try:
+        items, parallel = parse_batch_request(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    results = iter_batch_results(items, request.headers, client_id_from(request.headers, request.remote_addr), parallel)
+    return Response(stream_with_context(results), mimetype='application/x-ndjson', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx: flush each line immediately
+    })
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    if SERVER_MODE == 'asgi':
+        import sys
+        import uvicorn
+        # asgi.py imports this module as 'app'; reuse the agent initialized above
+        sys.modules.setdefault('app', sys.modules[__name__])
+        from asgi import application
+        uvicorn.run(application, host='0.0.0.0', port=5001, log_level='info')
+    else:
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            # Only the reloader's serving child warms kernels, not the watching parent
+            kernel_pool.pool.start()
+        app.run(debug=True, host='0.0.0.0', port=5001, threaded=True)
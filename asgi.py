@@ -0,0 +1,238 @@
+"""
+ASGI entry point for the Qwen Agent chat service.
+
+/chat, /chat/stream, /chat/batch and /health are served natively async:
+agent runs go through the bounded chat executor and are awaited without
+holding a thread, so one process can keep many chats in flight. /health,
+/livez and /readyz only read cached state. Every other route falls through
+to the Flask app.
+
+A chat client that disconnects stops following its run; once no client is
+left, the run is cancelled (see chat_jobs.py). A batch client that
+disconnects stops its remaining queries the same way.
+
+Run with:  uvicorn asgi:application --host 0.0.0.0 --port 5001
+      or:  SERVER_MODE=asgi python app.py
+"""
+
+import asyncio
+import functools
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as chat_app
+from chat_jobs import ChatOverloaded
+
+flask_application = WsgiToAsgi(chat_app.app)
+
+async def read_json_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(body or b'{}')
+    except ValueError:
+        return None
+
+async def send_json(send, payload, status=200, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), str(value).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def cached_response(user_query, headers, endpoint, conversation_id):
+    """chat_app.cached_chat_response without blocking the event loop on a semantic lookup"""
+    lookup = functools.partial(chat_app.cached_chat_response, user_query, headers, endpoint=endpoint,
+                               conversation_id=conversation_id)
+    if chat_app.response_cache.needs_embedding(user_query):
+        # The embeddings call is a blocking HTTP request; exact matches are answered inline
+        return await asyncio.to_thread(lookup)
+    return lookup()
+
+async def wait_for_disconnect(receive):
+    """Return once the client has gone away (the request body is already read)"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def health(scope, receive, send):
+    """Cached health snapshot; no upstream I/O on the request path"""
+    health_data, status = chat_app.build_health_payload()
+    await send_json(send, health_data, status)
+
+async def probe(scope, receive, send):
+    """/livez and /readyz"""
+    if scope['path'] == '/livez':
+        payload, status = chat_app.build_liveness_payload()
+    else:
+        payload, status = chat_app.build_readiness_payload()
+    await send_json(send, payload, status)
+
+async def chat(scope, receive, send):
+    """Async /chat and /chat/stream"""
+    streaming = scope['path'] == '/chat/stream'
+    if not chat_app.bot:
+        await send_json(send, *chat_app.agent_unavailable_error())
+        return
+
+    data = await read_json_body(receive)
+    user_query = data.get('query') if isinstance(data, dict) else None
+    if not user_query:
+        await send_json(send, {"error": "No query provided"}, 400)
+        return
+
+    chat_app.app.logger.info(f"Received {'streaming ' if streaming else ''}query: {user_query}")
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+    conversation_id = chat_app.conversation_id_from(data, headers)
+    cached = await cached_response(user_query, headers, 'chat_stream' if streaming else 'chat', conversation_id)
+    if cached and streaming:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+        ]})
+        await send({'type': 'http.response.body', 'body': chat_app.sse_event('done', cached).encode('utf-8')})
+        return
+    if cached:
+        await send_json(send, cached)
+        return
+    try:
+        job = chat_app.submit_chat(user_query, endpoint='chat_stream' if streaming else 'chat', headers=headers,
+                                   conversation_id=conversation_id,
+                                   client=chat_app.client_id_from(headers, (scope.get('client') or [None])[0]))
+    except ChatOverloaded as e:
+        await send_json(send, *chat_app.overloaded_error(e.retry_after, reason=e.reason))
+        return
+
+    relay_task = asyncio.ensure_future(relay_job(job, send, streaming))
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    await asyncio.wait({relay_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    if relay_task.done():
+        disconnect_task.cancel()
+        relay_task.result()
+    else:
+        chat_app.app.logger.info(f"🔌 Client disconnected from query: {user_query}")
+        relay_task.cancel()
+        try:
+            await relay_task  # unsubscribes from the job, which cancels it if nobody else follows it
+        except asyncio.CancelledError:
+            pass
+
+async def relay_job(job, send, streaming):
+    """Send a job's events as SSE, or its 'done' payload as JSON"""
+    started = False
+    event = None
+    async for event, payload in job.aevents():
+        if event == 'rejected':
+            await send_json(send, *chat_app.overloaded_error(chat_app.chat_runner.retry_after(), queued=True))
+            return
+        if streaming:
+            if not started:
+                await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ]})
+                started = True
+            await send({'type': 'http.response.body',
+                        'body': chat_app.sse_event(event, payload).encode('utf-8'),
+                        'more_body': True})
+        elif event == 'done':
+            chat_app.app.logger.info(f"✅ Sending response - Length: {len(payload['response'])} characters")
+            await send_json(send, payload)
+            return
+    if not started:
+        await send_json(send, *chat_app.run_ended_error())  # the run was cancelled before it answered
+        return
+    if event != 'done':
+        await send({'type': 'http.response.body',
+                    'body': chat_app.sse_event('error', chat_app.run_ended_error()[0]).encode('utf-8'),
+                    'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def chat_batch(scope, receive, send):
+    """Async /chat/batch: NDJSON lines as queries finish"""
+    if not chat_app.bot:
+        await send_json(send, *chat_app.agent_unavailable_error())
+        return
+    try:
+        items, parallel = chat_app.parse_batch_request(await read_json_body(receive) or {})
+    except ValueError as e:
+        await send_json(send, {"error": str(e)}, 400)
+        return
+
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+    client = chat_app.client_id_from(headers, (scope.get('client') or [None])[0])
+    loop = asyncio.get_running_loop()
+    outcomes = asyncio.Queue()
+    batch = chat_app.BatchRun(items, headers, client, parallel,
+                              lambda *outcome: loop.call_soon_threadsafe(outcomes.put_nowait, outcome))
+    relay_task = asyncio.ensure_future(relay_batch(batch, outcomes, send))
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({relay_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        if relay_task.done():
+            disconnect_task.cancel()
+            relay_task.result()
+        else:
+            chat_app.app.logger.info(f"🔌 Client disconnected from a batch of {len(items)} queries")
+            relay_task.cancel()
+            try:
+                await relay_task
+            except asyncio.CancelledError:
+                pass
+    finally:
+        batch.close()  # runs of this batch that nobody else follows are cancelled
+
+async def relay_batch(batch, outcomes, send):
+    """Send a batch's NDJSON lines as its runs finish"""
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'application/x-ndjson'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+    while not batch.finished:
+        # Cache lookups may call the embedding endpoint, so submitting runs happens off the event loop
+        for line in await asyncio.to_thread(batch.start_more):
+            await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+        if batch.following:
+            for line in batch.finish(*await outcomes.get()):
+                await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': batch.summary().encode('utf-8')})
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            chat_app.kernel_pool.pool.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            chat_app.health_prober.stop()
+            chat_app.agent_loader.stop()
+            chat_app.chat_runner.executor.shutdown(wait=False)
+            chat_app.http_clients.close_all()
+            chat_app.kernel_pool.pool.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+        return
+    path = scope.get('path', '')
+    if scope['type'] == 'http' and scope['method'] == 'POST' and path in ('/chat', '/chat/stream'):
+        await chat(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and path == '/chat/batch':
+        await chat_batch(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and path == '/health':
+        await health(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and path in ('/livez', '/readyz'):
+        await probe(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: html_extract (lxml, streaming) vs the BeautifulSoup
+html.parser path search_web used before.
+
+Usage:
+    python benchmark_extract.py --corpus saved_pages/        # *.html files
+    python benchmark_extract.py --synthetic 5 --size-mb 2    # generated news-like pages
+    python benchmark_extract.py --save https://www.bbc.com/news --corpus saved_pages/
+
+--save fetches rendered pages through the Playwright service
+(PLAYWRIGHT_SERVICE_URL, default http://localhost:3000) into the corpus.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from html_extract import extract_text
+
+WORDS = ("market stock price rose fell today report government election team score season weather "
+         "forecast storm latest breaking analysis investors league coach city officials said").split()
+
+
+def beautifulsoup_extract(content):
+    """The previous search_web extraction, kept here as the baseline"""
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.decompose()
+    lines = [line.strip() for line in soup.get_text().splitlines() if line.strip()]
+    links = [{'href': link.get('href', ''), 'text': link.text} for link in soup.find_all('a', href=True)[:5]]
+    return {'lines': lines, 'links': links}
+
+
+def synthetic_page(size_bytes, rng):
+    """A news-homepage-like document: scripts, nav, many article teasers"""
+    parts = ["<html><head><title>Front page</title>",
+             "<style>" + "body{margin:0}" * 200 + "</style>",
+             "<script>" + "var x=1;" * 2000 + "</script></head><body>",
+             "<header><nav>" + "".join(f"<a href='/s{i}'>Section {i}</a>" for i in range(40)) + "</nav></header>"]
+    size = sum(len(p) for p in parts)
+    i = 0
+    while size < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+        block = (f"<article><h2><a href='https://example.com/story/{i}'>{sentence[:60]}</a></h2>"
+                 f"<div class='teaser'><p>{sentence}</p><span>{i} min ago</span></div>"
+                 f"<script>track({i})</script></article>\n")
+        parts.append(block)
+        size += len(block)
+        i += 1
+    parts.append("<footer>" + "<p>Copyright notice and links</p>" * 50 + "</footer></body></html>")
+    return ''.join(parts)
+
+
+def load_corpus(path):
+    pages = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(path, name), encoding='utf-8', errors='replace') as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def save_pages(urls, path):
+    import requests
+    playwright_url = os.getenv("PLAYWRIGHT_SERVICE_URL", "http://localhost:3000")
+    os.makedirs(path, exist_ok=True)
+    for url in urls:
+        response = requests.post(f"{playwright_url}/scrape", json={"url": url, "action": "content", "timeout": 30000},
+                                 timeout=60)
+        result = response.json()
+        if not result.get('success'):
+            print(f"❌ Could not fetch {url}")
+            continue
+        name = ''.join(c if c.isalnum() else '_' for c in url.split('://', 1)[-1])[:80] + '.html'
+        with open(os.path.join(path, name), 'w', encoding='utf-8') as f:
+            f.write(result.get('data', ''))
+        print(f"💾 Saved {url} -> {name}")
+
+
+def time_call(func, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(content)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved .html pages')
+    parser.add_argument('--synthetic', type=int, default=0, help='number of generated pages (default 5 without --corpus)')
+    parser.add_argument('--size-mb', type=float, default=2.0, help='size of each generated page')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=int, default=200000, help='character budget for the streaming extractor')
+    parser.add_argument('--save', nargs='+', metavar='URL', help='fetch pages through Playwright into --corpus')
+    args = parser.parse_args()
+
+    if args.save:
+        if not args.corpus:
+            parser.error('--save needs --corpus')
+        save_pages(args.save, args.corpus)
+
+    pages = load_corpus(args.corpus) if args.corpus else []
+    synthetic = args.synthetic or (0 if pages else 5)
+    rng = random.Random(42)
+    pages += [(f"synthetic-{i}", synthetic_page(int(args.size_mb * 1024 * 1024), rng)) for i in range(synthetic)]
+    if not pages:
+        print("No pages to benchmark")
+        return 1
+
+    print(f"{'page':<40} {'size':>8} {'bs4 ms':>9} {'lxml ms':>9} {'budget ms':>10} {'speedup':>8} {'lines':>12}")
+    totals = [0.0, 0.0, 0.0]
+    for name, content in pages:
+        bs4_time, bs4_result = time_call(beautifulsoup_extract, content, args.repeat)
+        lxml_time, lxml_result = time_call(extract_text, content, args.repeat)
+        budget_time, _ = time_call(lambda c: extract_text(c, max_chars=args.budget), content, args.repeat)
+        totals[0] += bs4_time
+        totals[1] += lxml_time
+        totals[2] += budget_time
+        print(f"{name[:40]:<40} {len(content) / 1024:>6.0f}KB {bs4_time * 1000:>9.1f} {lxml_time * 1000:>9.1f} "
+              f"{budget_time * 1000:>10.1f} {bs4_time / lxml_time:>7.1f}x "
+              f"{len(bs4_result['lines']):>5}/{len(lxml_result['lines']):<6}")
+
+    print(f"\nTotal: bs4 {totals[0] * 1000:.1f}ms, lxml {totals[1] * 1000:.1f}ms "
+          f"({totals[0] / totals[1]:.1f}x), lxml with {args.budget} char budget {totals[2] * 1000:.1f}ms "
+          f"({totals[0] / totals[2]:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Enterprise Qwen Agent Load and Latency Benchmark
+
+Drives /chat, /chat/stream and /health with a fixed number of queries at a
+given concurrency (closed loop) or with request-rate stages (open loop),
+then reports p50/p95/p99 latency, time to first byte, throughput and error
+rates per endpoint. Results can be written as JSON and compared against a
+previous run.
+
+With --fake, local stand-ins for vLLM and the Playwright service are
+started (fake_services.py) and app.py is launched against them, so the
+benchmark runs offline with no GPU.
+
+Examples:
+    python benchmark_system.py --queries 100 --concurrent 5
+    python benchmark_system.py --fake --profile 2:30,8:30 --concurrent 16 --output results.json
+    python benchmark_system.py --fake --queries 200 --compare baseline.json --max-regression 0.2
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from test_system_validation import BASE_URL, print_error, print_header, print_success, print_warning
+
+DEFAULT_QUERIES = [
+    "What is 2+2?",
+    "Explain quantum computing in simple terms",
+    "What are the benefits of renewable energy?",
+    "What's the current weather in New York?",
+    "Latest technology news today",
+    "Current stock price of Apple",
+]
+
+ENDPOINTS = {
+    'chat': ('POST', '/chat'),
+    'chat_stream': ('POST', '/chat/stream'),
+    'health': ('GET', '/health'),
+}
+
+
+def parse_profile(spec):
+    """'2:30,8:30' -> [(2.0 req/s, 30.0 s), (8.0 req/s, 30.0 s)]"""
+    stages = []
+    for part in spec.split(','):
+        rate, seconds = part.split(':')
+        stages.append((float(rate), float(seconds)))
+    return stages
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # round() first so float noise (0.07 * 100 = 7.000000000000001) cannot bump the rank
+    rank = max(0, min(len(ordered) - 1, math.ceil(round(fraction * len(ordered), 9)) - 1))
+    return ordered[rank]
+
+
+def summarize_timings(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    return {
+        'p50': round(percentile(values, 0.50), 4),
+        'p95': round(percentile(values, 0.95), 4),
+        'p99': round(percentile(values, 0.99), 4),
+        'mean': round(sum(values) / len(values), 4),
+        'max': round(max(values), 4),
+    }
+
+
+class Benchmark:
+    """Sends requests and records one sample per request"""
+
+    def __init__(self, base_url, timeout, bypass_cache=True, max_connections=64):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'X-Cache-Bypass': '1'} if bypass_cache else {}
+        self.client = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=max_connections,
+                                                                        max_keepalive_connections=max_connections))
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def send(self, endpoint, query, scheduled=None):
+        """One request; latency is measured from the scheduled start (open loop) to the last byte"""
+        method, path = ENDPOINTS[endpoint]
+        started = scheduled or time.perf_counter()
+        sample = {'endpoint': endpoint, 'status': None, 'error': None, 'latency': None, 'ttfb': None,
+                  'queued': time.perf_counter() - started}
+        kwargs = {'headers': self.headers}
+        if method == 'POST':
+            kwargs['json'] = {'query': query}
+        try:
+            with self.client.stream(method, f"{self.base_url}{path}", **kwargs) as response:
+                sample['status'] = response.status_code
+                size = 0
+                for chunk in response.iter_raw():
+                    if sample['ttfb'] is None:
+                        sample['ttfb'] = time.perf_counter() - started
+                    size += len(chunk)
+                sample['bytes'] = size
+            if sample['status'] >= 400:
+                sample['error'] = f"HTTP {sample['status']}"
+        except httpx.HTTPError as e:
+            sample['error'] = type(e).__name__
+        sample['latency'] = time.perf_counter() - started
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def run_closed_loop(self, endpoints, queries, total, concurrency):
+        work = zip(itertools.cycle(endpoints), itertools.cycle(queries))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for endpoint, query in itertools.islice(work, total):
+                pool.submit(self.send, endpoint, query)
+
+    def run_open_loop(self, endpoints, queries, stages, concurrency):
+        """Requests at a fixed rate per stage; late starts count toward latency"""
+        work = zip(itertools.cycle(endpoints), itertools.cycle(queries))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for rate, seconds in stages:
+                print(f"  ▶ {rate:g} req/s for {seconds:g}s")
+                stage_start = time.perf_counter()
+                count = int(rate * seconds)
+                for i in range(count):
+                    scheduled = stage_start + i / rate
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    endpoint, query = next(work)
+                    pool.submit(self.send, endpoint, query, scheduled)
+
+    def report(self, duration):
+        endpoints = {}
+        for name in sorted({sample['endpoint'] for sample in self.samples}):
+            samples = [sample for sample in self.samples if sample['endpoint'] == name]
+            ok = [sample for sample in samples if not sample['error']]
+            statuses = {}
+            for sample in samples:
+                key = str(sample['status'] or sample['error'])
+                statuses[key] = statuses.get(key, 0) + 1
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': len(samples) - len(ok),
+                'error_rate': round((len(samples) - len(ok)) / len(samples), 4),
+                'status_counts': statuses,
+                'throughput_rps': round(len(ok) / duration, 3) if duration else None,
+                'latency': summarize_timings([sample['latency'] for sample in ok]),
+                'ttfb': summarize_timings([sample['ttfb'] for sample in ok if sample['ttfb'] is not None]),
+            }
+        return endpoints
+
+
+def launch_fake_stack(args):
+    """Start fake vLLM/Playwright in-process and app.py as a subprocess pointed at them"""
+    import fake_services
+    vllm = fake_services.start_fake_vllm(tokens_per_second=args.tokens_per_second, latency=args.llm_latency)
+    playwright = fake_services.start_fake_playwright(pages_dir=args.pages, latency=args.scrape_latency)
+    print_success(f"Fake vLLM at {vllm.url}, fake Playwright at {playwright.url}")
+
+    env = dict(os.environ,
+               VLLM_BASE_URL=f"{vllm.url}/v1/",
+               VLLM_CHAT_COMPLETIONS_URL=f"{vllm.url}/v1/chat/completions",
+               VLLM_MODELS_URL=f"{vllm.url}/v1/models",
+               VLLM_MODEL='fake-qwen',
+               PLAYWRIGHT_SERVICE_URL=playwright.url,
+               SERVER_MODE=args.server_mode)
+    log = open(args.app_log, 'w') if args.app_log else subprocess.DEVNULL
+    app_process = subprocess.Popen([sys.executable, 'app.py'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 90
+    while time.time() < deadline:
+        if app_process.poll() is not None:
+            raise RuntimeError(f"app.py exited with code {app_process.returncode}")
+        try:
+            if httpx.get(f"{args.base_url}/health", timeout=2).status_code == 200:
+                print_success("app.py is up")
+                return app_process, (vllm, playwright)
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    app_process.terminate()
+    raise RuntimeError("app.py did not become healthy within 90s")
+
+
+def print_report(results):
+    print_header("BENCHMARK RESULTS")
+    print(f"\nDuration: {results['duration']:.1f}s")
+    print(f"\n{'endpoint':<12} {'reqs':>6} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttfb p50':>9} {'ttfb p95':>9}")
+    for name, stats in results['endpoints'].items():
+        latency, ttfb = stats['latency'], stats['ttfb']
+        fmt = lambda v: f"{v:.3f}" if v is not None else '-'
+        print(f"{name:<12} {stats['requests']:>6} {stats['error_rate'] * 100:>5.1f}% {stats['throughput_rps'] or 0:>7.2f} "
+              f"{fmt(latency['p50']):>8} {fmt(latency['p95']):>8} {fmt(latency['p99']):>8} "
+              f"{fmt(ttfb['p50']):>9} {fmt(ttfb['p95']):>9}")
+        if stats['errors']:
+            print_warning(f"  {name} status counts: {stats['status_counts']}")
+
+
+def compare(results, baseline, max_regression):
+    """Print p95/error-rate deltas against a baseline; False if anything regressed"""
+    print_header("COMPARISON WITH BASELINE")
+    ok = True
+    for name, stats in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            print_warning(f"{name}: not in baseline")
+            continue
+        old_p95, new_p95 = before['latency']['p95'], stats['latency']['p95']
+        if old_p95 and new_p95:
+            change = (new_p95 - old_p95) / old_p95
+            message = f"{name}: p95 {old_p95:.3f}s -> {new_p95:.3f}s ({change:+.1%})"
+            if change > max_regression:
+                print_error(message)
+                ok = False
+            else:
+                print_success(message)
+        error_change = stats['error_rate'] - before['error_rate']
+        if error_change > 0.01:
+            print_error(f"{name}: error rate {before['error_rate']:.1%} -> {stats['error_rate']:.1%}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--endpoints', default='chat,health', help=f"comma-separated: {', '.join(ENDPOINTS)}")
+    parser.add_argument('--queries', type=int, default=20, help='total requests (closed loop)')
+    parser.add_argument('--concurrent', type=int, default=5, help='concurrent requests (max in flight)')
+    parser.add_argument('--profile', help="open-loop rate stages 'req_per_s:seconds,...', e.g. 2:30,8:30")
+    parser.add_argument('--query-file', help='file with one query per line')
+    parser.add_argument('--timeout', type=float, default=180)
+    parser.add_argument('--allow-cache', action='store_true', help='do not send X-Cache-Bypass')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', help='baseline JSON results to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95 increase vs baseline')
+    parser.add_argument('--fake', action='store_true', help='run against fake vLLM/Playwright and a local app.py')
+    parser.add_argument('--server-mode', default='asgi', choices=['asgi', 'flask'])
+    parser.add_argument('--tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--scrape-latency', type=float, default=0.1)
+    parser.add_argument('--pages', help='saved .html pages for the fake Playwright service')
+    parser.add_argument('--app-log', help='file for the launched app.py output (--fake)')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {unknown}")
+    queries = DEFAULT_QUERIES
+    if args.query_file:
+        with open(args.query_file, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    print_header("QWEN AGENT LOAD BENCHMARK")
+    app_process = None
+    if args.fake:
+        try:
+            app_process, _ = launch_fake_stack(args)
+        except RuntimeError as e:
+            print_error(str(e))
+            return 1
+
+    bench = Benchmark(args.base_url, args.timeout, bypass_cache=not args.allow_cache,
+                      max_connections=max(args.concurrent, 1))
+    started = time.perf_counter()
+    try:
+        if args.profile:
+            print(f"\n⏱️  Open loop: {args.profile} against {', '.join(endpoints)}")
+            bench.run_open_loop(endpoints, queries, parse_profile(args.profile), args.concurrent)
+        else:
+            print(f"\n⏱️  Closed loop: {args.queries} requests, {args.concurrent} concurrent, against {', '.join(endpoints)}")
+            bench.run_closed_loop(endpoints, queries, args.queries, args.concurrent)
+    finally:
+        duration = time.perf_counter() - started
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=10)
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'base_url': args.base_url,
+        'fake': args.fake,
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'duration': round(duration, 3),
+        'endpoints': bench.report(duration),
+    }
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print_success(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
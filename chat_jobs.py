@@ -0,0 +1,376 @@
+"""
+Bounded execution of agent runs for the chat endpoints.
+
+bot.run() is a blocking generator (vLLM, code_interpreter, Playwright), so
+every run executes on a fixed-size thread pool instead of on the thread
+that accepted the HTTP request. Requests beyond the pool size wait in a
+bounded queue; beyond that they are rejected up front so the endpoint can
+answer 429 instead of stalling until nginx's proxy_read_timeout.
+
+The queue is fair across clients: each client has its own queue and the
+queues are served by deficit round-robin, weighted by each run's expected
+duration, so a few clients with many slow web-search runs cannot make
+everyone else's quick questions wait behind them. A request whose
+estimated wait already exceeds its deadline is rejected at once instead
+of being shed after it has waited.
+
+Runs submitted with a key (the query text) are single-flight: while
+a run for that key is in flight, an identical request subscribes to it
+instead of starting another, so a burst of the same question costs one
+agent run and needs no admission slot of its own. A run whose deadline
+was already cancelled is not joined; the request starts a fresh one.
+
+A job may carry the run's Deadline. When every subscriber has gone away
+before the run finishes (clients disconnected), the deadline is cancelled
+so the run stops instead of finishing for nobody.
+"""
+
+import asyncio
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import deadlines
+import metrics
+
+_END = object()
+DEFAULT_RUN_SECONDS = 10.0  # expected duration of a cost class with no runs observed yet
+
+
+class ChatOverloaded(Exception):
+    """Raised when a chat run cannot be admitted ('queue_full' or 'deadline')"""
+
+    def __init__(self, message, retry_after, reason='queue_full'):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ChatJob:
+    """One agent run on the chat executor, fanned out to any number of subscribers.
+
+    Events are (event, payload) tuples. Every event is kept for the life of
+    the job so a subscriber attaching late still sees the whole run.
+    """
+
+    def __init__(self, run_events, queue_timeout, key=None, deadline=None, client=None, cost_class='default',
+                 cost=DEFAULT_RUN_SECONDS):
+        self.run_events = run_events
+        self.queue_timeout = queue_timeout
+        self.key = key
+        self.deadline = deadline
+        self.client = client          # fair-queuing key
+        self.cost_class = cost_class
+        self.cost = cost              # expected run seconds
+        self.ran = False              # the run was started rather than shed or skipped
+        self.fan_in = 1        # requests served by this run
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished = threading.Event()
+        self._history = []
+        self._sinks = []
+        self._ended = False
+        self._lock = threading.Lock()
+
+    def _publish(self, item):
+        with self._lock:
+            self._history.append(item)
+            if item is _END:
+                self._ended = True
+            for sink in self._sinks:
+                sink(item)
+
+    def _subscribe(self, sink):
+        with self._lock:
+            for item in self._history:
+                sink(item)
+            self._sinks.append(sink)
+
+    def _unsubscribe(self, sink):
+        with self._lock:
+            self._sinks.remove(sink)
+            abandoned = not self._sinks and not self._ended
+        if abandoned and self.deadline is not None:
+            self.deadline.cancel('client_disconnect')
+
+    def follow(self, callback):
+        """Call callback(event, payload) once with the job's outcome: its 'done' or
+        'rejected' event, or ('ended', None) if it stopped without one.
+
+        Returns a handle for unfollow(); following counts as a subscriber.
+        """
+        fired = []
+
+        def sink(item):
+            if fired:
+                return
+            if item is _END:
+                fired.append(True)
+                callback('ended', None)
+            elif item[0] in ('done', 'rejected'):
+                fired.append(True)
+                callback(*item)
+
+        self._subscribe(sink)
+        return sink
+
+    def unfollow(self, handle):
+        self._unsubscribe(handle)
+
+    def events(self):
+        """Blocking iterator over the job's events"""
+        inbox = queue.Queue()
+        self._subscribe(inbox.put)
+        try:
+            while True:
+                item = inbox.get()
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self._unsubscribe(inbox.put)
+
+    async def aevents(self):
+        """Async iterator over the job's events; never blocks the event loop"""
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue()
+        sink = lambda item: loop.call_soon_threadsafe(inbox.put_nowait, item)
+        self._subscribe(sink)
+        try:
+            while True:
+                item = await inbox.get()
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self._unsubscribe(sink)
+
+    def run(self):
+        """Run the job on the calling (executor) thread"""
+        self.started_at = self.started_at or time.time()
+        queue_wait = self.started_at - self.submitted_at
+        try:
+            expired = self.deadline is not None and self.deadline.reason == 'deadline'
+            if queue_wait > self.queue_timeout or expired:
+                with self._lock:
+                    self._ended = True  # nothing left to cancel when subscribers leave
+                self._publish(('rejected', {'queue_wait': round(queue_wait, 3)}))
+                return
+            if self.deadline is not None and self.deadline.cancelled:
+                # Everyone waiting for it left while it was queued
+                deadlines.record_cancelled('queued_run')
+                return
+            self._publish(('started', {'queue_wait': round(queue_wait, 3)}))
+            self.ran = True
+            for item in self.run_events():
+                self._publish(item)
+        finally:
+            self._publish(_END)
+            self.finished.set()
+            if self.deadline is not None:
+                self.deadline.close()
+
+
+class FairQueue:
+    """Per-client FIFO queues served in deficit round-robin order.
+
+    Each time a client's turn comes up its deficit grows by quantum; it may
+    start its next job once the deficit covers the job's cost (expected run
+    seconds). Clients therefore share the workers by run time rather than
+    by request count, and one client's backlog cannot hold up everyone
+    else's first request.
+    """
+
+    def __init__(self, quantum):
+        self.quantum = quantum
+        self._queues = OrderedDict()   # client -> deque of jobs, in round-robin order
+        self._deficit = {}
+        self._topped_up = False        # the head client got its quantum for this turn
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def push(self, client, job):
+        if client not in self._queues:
+            self._queues[client] = deque()
+            self._deficit[client] = 0.0
+        self._queues[client].append(job)
+        self._length += 1
+
+    def pop(self):
+        """The next job to start (None when empty)"""
+        while self._queues:
+            client, jobs = next(iter(self._queues.items()))
+            if not self._topped_up:
+                self._deficit[client] += self.quantum
+                self._topped_up = True
+            if self._deficit[client] >= jobs[0].cost:
+                job = jobs.popleft()
+                self._deficit[client] -= job.cost
+                self._length -= 1
+                if not jobs:
+                    del self._queues[client]
+                    del self._deficit[client]
+                    self._topped_up = False
+                return job
+            self._queues.move_to_end(client)
+            self._topped_up = False
+        return None
+
+    def backlog(self):
+        """Queued cost per client"""
+        return {client: sum(job.cost for job in jobs) for client, jobs in self._queues.items()}
+
+    def depth(self):
+        """Queued jobs per cost class"""
+        depth = {}
+        for jobs in self._queues.values():
+            for job in jobs:
+                depth[job.cost_class] = depth.get(job.cost_class, 0) + 1
+        return depth
+
+
+class ChatRunner:
+    """Fixed-size executor plus admission control and fair queuing for chat runs.
+
+    Every admitted run takes one executor slot; when a slot frees up it
+    starts the next run chosen by FairQueue, not necessarily its own. A
+    run's cost is the running average duration of its cost class (e.g.
+    'direct' or 'agent'), seeded from run_seconds.
+    """
+
+    def __init__(self, max_concurrency, max_queue, queue_timeout, run_seconds=None, quantum=5.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bot-run')
+        self._lock = threading.Lock()
+        self._queue = FairQueue(quantum)
+        self._run_seconds = dict(run_seconds or {})
+        self._running_jobs = set()
+        self._admitted = 0
+        self._rejected = 0
+        self._coalesced = 0
+        self._inflight = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """listener(job) is called after every run finishes"""
+        self._listeners.append(listener)
+
+    def expected_seconds(self, cost_class):
+        return self._run_seconds.get(cost_class, DEFAULT_RUN_SECONDS)
+
+    def submit(self, run_events, key=None, deadline=None, client=None, cost_class='default'):
+        """Queue a run; raises ChatOverloaded when the queue is full or the
+        run could not start before its deadline.
+
+        With a key, an in-flight run for the same key is joined instead;
+        the returned job's run_events is then not the one passed in.
+        """
+        with self._lock:
+            if key is not None and key in self._inflight:
+                job = self._inflight[key]
+                if job.deadline is not None and job.deadline.cancelled:
+                    # Its clients left or it ran out of time: its answer would be missing or cut short
+                    del self._inflight[key]
+                else:
+                    job.fan_in += 1
+                    self._coalesced += 1
+                    return job
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                self._rejected += 1
+                raise ChatOverloaded("Chat capacity exhausted", self._retry_after_locked())
+            cost = self.expected_seconds(cost_class)
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None and self._estimated_wait_locked(client, cost) >= remaining:
+                self._rejected += 1
+                raise ChatOverloaded("Chat run could not start before its deadline", self._retry_after_locked(),
+                                     reason='deadline')
+            self._admitted += 1
+            job = ChatJob(run_events, self.queue_timeout, key, deadline, client, cost_class, cost)
+            self._queue.push(client, job)
+            if key is not None:
+                self._inflight[key] = job
+            self._update_gauges_locked()
+
+        self.executor.submit(self._dispatch)
+        return job
+
+    def _dispatch(self):
+        """Executor entry point: start whichever queued run is next in fair order"""
+        with self._lock:
+            job = self._queue.pop()
+            job.started_at = time.time()
+            self._running_jobs.add(job)
+            self._update_gauges_locked()
+        metrics.CHAT_QUEUE_WAIT.labels(cost_class=job.cost_class).observe(job.started_at - job.submitted_at)
+        self._execute(job)
+
+    def _execute(self, job):
+        try:
+            job.run()
+        finally:
+            duration = time.time() - job.started_at
+            with self._lock:
+                if job.key is not None and self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                self._running_jobs.discard(job)
+                self._admitted -= 1
+                if job.ran:
+                    # EWMA of run time per cost class: the cost of the next run and the basis of wait estimates
+                    previous = self.expected_seconds(job.cost_class)
+                    self._run_seconds[job.cost_class] = 0.8 * previous + 0.2 * duration
+                self._update_gauges_locked()
+            for listener in self._listeners:
+                listener(job)
+
+    def _running_remaining_locked(self, now):
+        return sum(max(job.cost - (now - job.started_at), 0.0) for job in self._running_jobs)
+
+    def _estimated_wait_locked(self, client, cost):
+        """Seconds until a new run of this client would start.
+
+        Under deficit round-robin every other client gets about as much run
+        time as this client has queued (including the new run) before it.
+        """
+        if len(self._running_jobs) + len(self._queue) < self.max_concurrency:
+            return 0.0
+        backlog = self._queue.backlog()
+        own = backlog.pop(client, 0.0)
+        ahead = own + sum(min(queued, own + cost) for queued in backlog.values())
+        return (ahead + self._running_remaining_locked(time.time())) / self.max_concurrency
+
+    def _retry_after_locked(self):
+        backlog = sum(self._queue.backlog().values()) + self._running_remaining_locked(time.time())
+        return max(1, math.ceil(backlog / self.max_concurrency))
+
+    def _update_gauges_locked(self):
+        depth = self._queue.depth()
+        for cost_class in set(depth) | set(self._run_seconds):
+            metrics.CHAT_QUEUE_DEPTH.labels(cost_class=cost_class).set(depth.get(cost_class, 0))
+        metrics.CHAT_QUEUE_CLIENTS.set(len(self._queue.backlog()))
+        metrics.CHAT_RUNNING.set(len(self._running_jobs))
+
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after_locked()
+
+    def snapshot(self):
+        """Current load, for /health"""
+        with self._lock:
+            return {
+                "running": len(self._running_jobs),
+                "queued": len(self._queue),
+                "queued_clients": len(self._queue.backlog()),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "expected_run_seconds": {name: round(seconds, 2) for name, seconds in self._run_seconds.items()},
+                "rejected_total": self._rejected,
+                "inflight_keys": len(self._inflight),
+                "coalesced_total": self._coalesced
+            }
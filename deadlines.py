@@ -0,0 +1,226 @@
+"""
+Per-request deadlines, carried through the whole agent run.
+
+A chat request gets one Deadline when it is accepted (RESPONSE_TIMEOUT).
+The run binds it to its thread, and everything the run waits on derives
+its own timeout from it: the vLLM HTTP call, the code_interpreter cell
+timer and every Playwright fetch. Checks between batches alone cannot stop
+a generation or a cell that never yields, so outstanding work also
+registers a cancel callback (close the LLM stream, interrupt the kernel,
+abandon queued fetches) that fires when the deadline passes or when every
+client waiting on the run has disconnected.
+
+Cancelled work is counted per kind, together with the time it could
+otherwise have kept running (its own timeout) that cancellation freed.
+
+Expiry is driven by one shared timer thread over a heap of deadlines, not
+a thread per request, so requests that are rejected or finish early cost
+no thread while their deadline would still be pending.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """Raised at a cancellation point once the run's deadline is cancelled"""
+
+    def __init__(self, reason):
+        super().__init__(f"Run cancelled ({reason})")
+        self.reason = reason
+
+
+class Deadline:
+    """A point in time after which a run's outstanding work is cancelled.
+
+    seconds=None never expires (but can still be cancelled).
+    """
+
+    def __init__(self, seconds=None):
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds if seconds is not None else None
+        self.reason = None      # 'deadline' or 'client_disconnect' once cancelled
+        self._callbacks = {}    # handle -> (callback, kind, until)
+        self._handles = itertools.count()
+        self._lock = threading.Lock()
+        self.closed = False
+        self._scheduled = False  # in the shared timer heap
+        if seconds is not None:
+            _timers.schedule(self)
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def remaining(self):
+        """Seconds left (None without a deadline, 0 once cancelled)"""
+        if self.cancelled:
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def timeout(self, default=None):
+        """default capped at the time left; the time left if default is None"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def check(self):
+        """Raise DeadlineExceeded if the run should stop"""
+        if not self.cancelled and self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.cancel('deadline')
+        if self.cancelled:
+            raise DeadlineExceeded(self.reason)
+
+    def cancel(self, reason='deadline'):
+        """Cancel the run and all outstanding work registered with cancelling()"""
+        now = time.monotonic()
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        metrics.CHAT_CANCELLATIONS.labels(reason=reason).inc()
+        if self.expires_at is not None:
+            metrics.CANCEL_RECLAIMED.labels(kind='run').inc(max(self.expires_at - now, 0.0))
+        for callback, kind, until in callbacks:
+            record_cancelled(kind, until - now if until is not None else 0.0)
+            try:
+                callback()
+            except Exception:
+                pass  # the work is being abandoned anyway
+
+    @contextmanager
+    def cancelling(self, callback, kind, until=None):
+        """Call callback() if the run is cancelled while the block runs.
+
+        until is the monotonic time the work would end on its own; the
+        difference is reported as reclaimed time.
+        """
+        with self._lock:
+            cancelled = self.reason is not None
+            if not cancelled:
+                handle = next(self._handles)
+                self._callbacks[handle] = (callback, kind, until)
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            if not cancelled:
+                with self._lock:
+                    self._callbacks.pop(handle, None)
+
+    def close(self):
+        """Stop the expiry timer once the run is over (or was never started)"""
+        if not self.closed:
+            self.closed = True
+            if self.expires_at is not None:
+                _timers.discard(self)
+
+
+class _TimerHeap:
+    """One daemon thread that cancels every scheduled Deadline when it expires.
+
+    Closed deadlines are dropped lazily when they reach the top, or all at
+    once when they make up more than half the heap.
+    """
+
+    def __init__(self):
+        self._heap = []         # (expires_at, sequence, deadline)
+        self._sequence = itertools.count()
+        self._closed = 0        # closed deadlines still in the heap
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap) - self._closed
+
+    def schedule(self, deadline):
+        with self._cond:
+            heapq.heappush(self._heap, (deadline.expires_at, next(self._sequence), deadline))
+            deadline._scheduled = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-timer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, deadline):
+        """Note that a deadline was closed; it will not fire"""
+        with self._cond:
+            if not deadline._scheduled:
+                return
+            self._closed += 1
+            if self._closed > len(self._heap) // 2:
+                kept = []
+                for entry in self._heap:
+                    if entry[2].closed:
+                        entry[2]._scheduled = False
+                    else:
+                        kept.append(entry)
+                self._heap = kept
+                heapq.heapify(self._heap)
+                self._closed = 0
+
+    def _next_expired(self):
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2].closed:
+                    heapq.heappop(self._heap)[2]._scheduled = False
+                    self._closed -= 1
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    deadline = heapq.heappop(self._heap)[2]
+                    deadline._scheduled = False
+                    return deadline
+                self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            deadline = self._next_expired()
+            if deadline.closed:
+                continue  # closed after it was taken off the heap
+            try:
+                deadline.cancel('deadline')
+            except Exception:
+                pass  # a failing cancel callback must not stop the timer for everyone else
+
+
+_timers = _TimerHeap()
+
+
+def record_cancelled(kind, reclaimed_seconds=0.0):
+    metrics.CANCELLED_WORK.labels(kind=kind).inc()
+    metrics.CANCEL_RECLAIMED.labels(kind=kind).inc(max(reclaimed_seconds, 0.0))
+
+
+_UNBOUNDED = Deadline()
+
+
+def current():
+    """The deadline bound to this thread's run (one that never expires outside a run)"""
+    return getattr(_local, 'deadline', None) or _UNBOUNDED
+
+
+@contextmanager
+def bind(deadline):
+    """Make deadline the calling thread's current() for the duration of the block"""
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for vLLM and the Playwright service, for offline benchmarks.
+
+Fake vLLM speaks the OpenAI-compatible API the agent uses (/v1/models,
+/v1/chat/completions with and without streaming, /v1/embeddings). It
+answers after a configurable first-token latency and streams at a
+configurable token rate. Questions about current information get a
+search_web tool call first (in qwen_agent's <tool_call> format), then an
+answer quoting the tool response.
+
+Fake Playwright serves /scrape from a directory of saved pages (picked by
+URL hash) or from generated news-like pages, and /health.
+
+Usage:
+    python fake_services.py --vllm-port 8000 --playwright-port 3000 --tokens-per-second 80 --latency 0.3
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEARCH_HINTS = ['news', 'latest', 'today', 'current', 'price', 'stock', 'weather', 'score', 'forecast']
+WORDS = ("market stock price rose fell today report government election team score season weather "
+         "forecast storm latest breaking analysis investors league coach city officials said").split()
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, settings):
+        super().__init__(address, handler)
+        self.settings = settings
+        self.requests_served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self):
+        with self.server.lock:
+            self.server.requests_served += 1
+
+
+def _message_text(message):
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        return ''.join(item.get('text', '') for item in content if isinstance(item, dict))
+    return content
+
+
+def fake_reply(messages):
+    """What the fake model says next: a search_web call or a final answer"""
+    last = _message_text(messages[-1]) if messages else ''
+    tools_offered = any('search_web' in _message_text(m) for m in messages if m.get('role') == 'system')
+    if '<tool_response>' in last:
+        response = last.split('<tool_response>')[-1].split('</tool_response>')[0].strip()
+        try:
+            sources = json.loads(response).get('sources') or []
+            excerpt = next(passage['text'] for source in sources for passage in source['passages'])
+        except (ValueError, AttributeError, KeyError, StopIteration):
+            excerpt = response[:160]
+        return (f"Based on the latest sources, here is what I found: {excerpt[:200]} "
+                "These figures come from the search results above and may change over the day.")
+    question = last.strip()
+    if tools_offered and any(hint in question.lower() for hint in SEARCH_HINTS):
+        call = json.dumps({'name': 'search_web', 'arguments': {'query': question[:100]}})
+        return f"<tool_call>\n{call}\n</tool_call>"
+    return (f"Here is a short answer to \"{question[:80]}\": this is a simulated response from the local "
+            "benchmark model, long enough to pass the response checks.")
+
+
+class FakeVLLMHandler(_Handler):
+
+    def do_GET(self):
+        self.count()
+        if self.path.rstrip('/').endswith('/models'):
+            self.send_json({'object': 'list', 'data': [{'id': self.server.settings['model'], 'object': 'model'}]})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        self.count()
+        request = self.read_json()
+        if self.path.rstrip('/').endswith('/embeddings'):
+            return self.embeddings(request)
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.send_json({'error': 'not found'}, 404)
+
+        settings = self.server.settings
+        time.sleep(settings['latency'])
+        reply = fake_reply(request.get('messages', []))
+        tokens = re.findall(r'\S+\s*|\s+', reply)
+        delay = 1.0 / settings['tokens_per_second'] if settings['tokens_per_second'] > 0 else 0
+        model = request.get('model', settings['model'])
+
+        if not request.get('stream'):
+            time.sleep(delay * len(tokens))
+            return self.send_json({
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': reply}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(tokens), 'total_tokens': len(tokens)}
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for token in tokens:
+            chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(delay)
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def embeddings(self, request):
+        inputs = request.get('input', '')
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            # Bag of hashed words: similar wording gives similar vectors
+            vector = [0.0] * 64
+            for word in str(text).lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+            data.append({'object': 'embedding', 'index': i, 'embedding': vector})
+        self.send_json({'object': 'list', 'data': data, 'model': request.get('model', 'fake')})
+
+
+def generated_page(url, size_bytes):
+    """A deterministic news-homepage-like page for a URL"""
+    rng = random.Random(url)
+    parts = ["<html><head><title>Front page</title><script>var tracking=1;</script></head><body>",
+             "<nav>" + "".join(f"<a href='/section/{i}'>Section {i}</a>" for i in range(20)) + "</nav>"]
+    size, i = 0, 0
+    while size < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+        block = (f"<article><h2><a href='https://example.com/story/{i}'>{sentence[:60]}</a></h2>"
+                 f"<p>{sentence}</p></article>\n")
+        parts.append(block)
+        size += len(block)
+        i += 1
+    parts.append("<footer><p>Copyright</p></footer></body></html>")
+    return ''.join(parts)
+
+
+class FakePlaywrightHandler(_Handler):
+
+    def do_GET(self):
+        self.count()
+        if self.path.rstrip('/') == '/health':
+            self.send_json({'status': 'healthy', 'metrics': {
+                'activeBrowsers': 0, 'maxBrowsers': 0, 'cacheSize': len(self.server.settings['pages']),
+                'uptime': time.time() - self.server.settings['started']}})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        self.count()
+        if self.path.rstrip('/') != '/scrape':
+            return self.send_json({'error': 'not found'}, 404)
+        request = self.read_json()
+        settings = self.server.settings
+        started = time.time()
+        time.sleep(settings['latency'])
+        url = request.get('url', '')
+        pages = settings['pages']
+        if pages:
+            page = pages[int(hashlib.md5(url.encode()).hexdigest(), 16) % len(pages)]
+        else:
+            page = generated_page(url, settings['page_size'])
+        data = page if request.get('action', 'content') == 'content' else 'Front page'
+        self.send_json({'success': True, 'data': data, 'processingTime': int((time.time() - started) * 1000)})
+
+
+def load_pages(path):
+    pages = []
+    if path and os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith(('.html', '.htm')):
+                with open(os.path.join(path, name), encoding='utf-8', errors='replace') as f:
+                    pages.append(f.read())
+    return pages
+
+
+def _serve(handler, port, settings, host='127.0.0.1'):
+    server = FakeServer((host, port), handler, settings)
+    threading.Thread(target=server.serve_forever, daemon=True, name=f'{handler.__name__}').start()
+    return server
+
+
+def start_fake_vllm(port=0, tokens_per_second=50.0, latency=0.2, model='fake-qwen', host='127.0.0.1'):
+    """Start a fake vLLM server in a background thread; returns the server (see .url)"""
+    return _serve(FakeVLLMHandler, port, {'tokens_per_second': tokens_per_second, 'latency': latency,
+                                          'model': model}, host)
+
+
+def start_fake_playwright(port=0, pages_dir=None, latency=0.1, page_size=200000, host='127.0.0.1'):
+    """Start a fake Playwright service in a background thread; returns the server (see .url)"""
+    return _serve(FakePlaywrightHandler, port, {'pages': load_pages(pages_dir), 'latency': latency,
+                                                'page_size': page_size, 'started': time.time()}, host)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--vllm-port', type=int, default=8000)
+    parser.add_argument('--playwright-port', type=int, default=3000)
+    parser.add_argument('--tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--latency', type=float, default=0.2, help='fake vLLM time to first token (seconds)')
+    parser.add_argument('--pages', help='directory of saved .html pages served by the fake Playwright')
+    parser.add_argument('--scrape-latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    vllm = start_fake_vllm(args.vllm_port, args.tokens_per_second, args.latency, host=args.host)
+    playwright = start_fake_playwright(args.playwright_port, args.pages, args.scrape_latency, host=args.host)
+    print(f"🤖 Fake vLLM:       {vllm.url}/v1/")
+    print(f"🎭 Fake Playwright: {playwright.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        vllm.shutdown()
+        playwright.shutdown()
+
+
+if __name__ == '__main__':
+    main()
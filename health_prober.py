@@ -0,0 +1,138 @@
+"""
+Background health prober for upstream services.
+
+Each registered probe runs on its own daemon thread on a jittered interval,
+backing off exponentially while it keeps failing. /health reads the cached
+results instead of hitting vLLM and Playwright on every request.
+"""
+
+import random
+import threading
+import time
+
+# Upper bounds (seconds) of the probe latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ProbeState:
+    """Latest result and latency history of one probe"""
+
+    def __init__(self, name, check):
+        self.name = name
+        self.check = check
+        self.ok = None
+        self.last_checked = None
+        self.last_latency = None
+        self.consecutive_failures = 0
+        self.next_check = None
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.count = 0
+
+    def record(self, ok, latency):
+        self.ok = ok
+        self.last_checked = time.time()
+        self.last_latency = latency
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+        self.latency_sum += latency
+        self.count += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+
+    def snapshot(self, now):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), self.bucket_counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "ok": self.ok,
+            "last_check_age": round(now - self.last_checked, 3) if self.last_checked else None,
+            "last_latency": round(self.last_latency, 4) if self.last_latency is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "next_check_in": round(max(self.next_check - now, 0), 3) if self.next_check else None,
+            "latency_histogram": {
+                "buckets": buckets,
+                "count": self.count,
+                "sum": round(self.latency_sum, 4)
+            }
+        }
+
+
+class HealthProber:
+    """Refreshes service status in the background with jitter and failure backoff"""
+
+    def __init__(self, interval=15.0, jitter=0.2, max_backoff=300.0, logger=None):
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self._probes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._listeners = []
+
+    def register(self, name, check):
+        """Add a probe; check() must return True when the service is healthy"""
+        self._probes[name] = ProbeState(name, check)
+
+    def add_listener(self, callback):
+        """callback(name, ok, latency) is invoked after every probe run"""
+        self._listeners.append(callback)
+
+    def check_now(self, name):
+        """Run one probe synchronously, record it and return its result"""
+        probe = self._probes[name]
+        started = time.perf_counter()
+        try:
+            ok = bool(probe.check())
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"❌ Health probe '{name}' raised: {e}")
+            ok = False
+        latency = time.perf_counter() - started
+        with self._lock:
+            probe.record(ok, latency)
+            probe.next_check = time.time() + self._next_delay(probe)
+        for callback in self._listeners:
+            callback(name, ok, latency)
+        return ok
+
+    def _next_delay(self, probe):
+        delay = self.interval
+        if probe.consecutive_failures:
+            delay = min(self.interval * (2 ** probe.consecutive_failures), self.max_backoff)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _loop(self, name):
+        while not self._stop.is_set():
+            probe = self._probes[name]
+            with self._lock:
+                due = probe.next_check or time.time()
+            if self._stop.wait(max(due - time.time(), 0)):
+                return
+            self.check_now(name)
+
+    def start(self):
+        for name in self._probes:
+            thread = threading.Thread(target=self._loop, args=(name,), name=f'health-probe-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self, name):
+        """Cached result of a probe (None if it has never run)"""
+        with self._lock:
+            return self._probes[name].ok
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {name: probe.snapshot(now) for name, probe in self._probes.items()}
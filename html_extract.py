@@ -0,0 +1,110 @@
+"""
+Streaming HTML-to-text extraction for the search tool.
+
+Pages are fed to lxml's C parser in chunks with an event target instead of
+being built into a BeautifulSoup tree. Boilerplate elements (script, style,
+nav, header, footer, ...) are skipped while parsing, text is split into
+blocks at block-level element boundaries, links are collected in the same
+pass, and parsing stops as soon as the character budget is met.
+"""
+
+from lxml import etree
+
+# Elements whose whole subtree is dropped
+SKIP_TAGS = {'script', 'style', 'nav', 'footer', 'header', 'noscript', 'template', 'svg'}
+
+# Elements that start a new text block
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'tr', 'td', 'th', 'table',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'aside', 'main',
+    'blockquote', 'pre', 'figure', 'figcaption', 'form', 'hr', 'title', 'body', 'option'
+}
+
+FEED_CHUNK = 64 * 1024
+
+
+class _TextTarget:
+    """lxml parser target collecting text blocks and links"""
+
+    def __init__(self, max_chars, max_links):
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.lines = []
+        self.links = []
+        self.chars = 0
+        self._skip_depth = 0
+        self._block = []
+        self._anchor = None     # {'href', 'text'} while inside an <a>
+
+    @property
+    def done(self):
+        return self.max_chars is not None and self.chars >= self.max_chars
+
+    def _flush(self):
+        if not self._block:
+            return
+        for line in ''.join(self._block).splitlines():
+            line = ' '.join(line.split())
+            if line and not self.done:
+                self.lines.append(line)
+                self.chars += len(line)
+        self._block = []
+
+    def start(self, tag, attrib):
+        if not isinstance(tag, str):
+            return
+        tag = tag.lower()
+        if self._skip_depth or tag in SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        elif tag == 'a' and 'href' in attrib and len(self.links) < self.max_links:
+            self._anchor = {'href': attrib.get('href', ''), 'text': ''}
+
+    def end(self, tag):
+        if not isinstance(tag, str):
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        tag = tag.lower()
+        if tag in BLOCK_TAGS:
+            self._flush()
+        elif tag == 'a' and self._anchor is not None:
+            self.links.append(self._anchor)
+            self._anchor = None
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        self._block.append(text)
+        if self._anchor is not None:
+            self._anchor['text'] += text
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._flush()
+        if self._anchor is not None and len(self.links) < self.max_links:
+            self.links.append(self._anchor)
+        return {'lines': self.lines, 'links': self.links}
+
+
+def extract_text(content, max_chars=None, max_links=5):
+    """Text blocks and the first max_links anchors of an HTML page, in one pass.
+
+    Returns {'lines': [...], 'links': [{'href', 'text'}]}. With max_chars,
+    parsing stops once that many characters of text were collected.
+    """
+    target = _TextTarget(max_chars, max_links)
+    parser = etree.HTMLParser(target=target, remove_comments=True, recover=True)
+    for offset in range(0, len(content), FEED_CHUNK):
+        parser.feed(content[offset:offset + FEED_CHUNK])
+        if target.done:
+            break
+    try:
+        return parser.close()
+    except etree.LxmlError:
+        return target.close()
@@ -0,0 +1,193 @@
+"""
+Managed, pooled HTTP clients for upstream services.
+
+Each upstream (vLLM, Playwright) gets one long-lived httpx.Client with its
+own connection pool, keep-alive settings and, for vLLM, optional HTTP/2.
+Everything that talks to an upstream (OpenAI client, health probes, search
+fetches) borrows that client, so TCP and TLS setup happen once per pooled
+connection instead of once per call.
+
+Connection reuse is exported through Prometheus: requests sent, TCP
+connections opened and TLS handshakes per upstream.
+"""
+
+import logging
+import os
+import threading
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Unread bytes drained from a response closed early before giving up its connection
+DRAIN_LIMIT = 64 * 1024
+
+# Pool defaults per upstream; each value can be overridden with
+# HTTP_POOL_<SETTING>_<UPSTREAM>, e.g. HTTP_POOL_MAX_CONNECTIONS_VLLM=128
+UPSTREAM_DEFAULTS = {
+    'vllm': {'max_connections': 64, 'max_keepalive': 32, 'timeout': 60.0},
+    'playwright': {'max_connections': 32, 'max_keepalive': 16, 'timeout': 30.0},
+}
+
+_clients = {}
+_settings = {}
+_transport_wrappers = []  # callables (upstream, transport) -> transport, e.g. trace recording
+_lock = threading.Lock()
+
+
+def _pool_setting(upstream, name, default):
+    value = os.getenv(f"HTTP_POOL_{name.upper()}_{upstream.upper()}")
+    return type(default)(value) if value is not None else default
+
+
+class _DrainOnClose(httpx.SyncByteStream):
+    """Finish reading a short response tail on close so the connection is reusable.
+
+    The OpenAI SDK closes streaming responses as soon as it sees [DONE],
+    before the terminating chunk is read; httpcore then discards the
+    connection instead of returning it to the pool. An aborted stream (a
+    cancelled call) is closed without draining: the upstream may still be
+    generating, and the closing thread must not wait on it.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._iterator = None
+        self._aborted = False
+
+    def __iter__(self):
+        self._iterator = iter(self._stream)
+        for chunk in self._iterator:
+            yield chunk
+
+    def abort(self):
+        self._aborted = True
+        self._stream.close()
+
+    def close(self):
+        if self._iterator is not None and not self._aborted:
+            drained = 0
+            try:
+                for chunk in self._iterator:
+                    drained += len(chunk)
+                    if drained > DRAIN_LIMIT:
+                        break
+            except Exception:
+                pass
+        self._stream.close()
+
+
+class _DrainingTransport(httpx.BaseTransport):
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        response = self._transport.handle_request(request)
+        stream = _DrainOnClose(response.stream)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=stream,
+            extensions=dict(response.extensions, drain_on_close=stream)
+        )
+
+    def close(self):
+        self._transport.close()
+
+
+def abort(response):
+    """Close a response without reading the rest of its body (drops the connection)"""
+    stream = response.extensions.get('drain_on_close')
+    if stream is not None:
+        stream.abort()
+    response.close()
+
+
+def _tracer(upstream):
+    def trace(event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            metrics.HTTP_CLIENT_CONNECTIONS.labels(upstream=upstream).inc()
+        elif event_name == 'connection.start_tls.complete':
+            metrics.HTTP_CLIENT_TLS_HANDSHAKES.labels(upstream=upstream).inc()
+
+    def on_request(request):
+        metrics.HTTP_CLIENT_REQUESTS.labels(upstream=upstream).inc()
+        request.extensions['trace'] = trace
+    return on_request
+
+
+def configure_upstream(upstream, verify=True, http2=False, **overrides):
+    """Set pool options for an upstream; takes effect for the next client built"""
+    with _lock:
+        _settings[upstream] = dict(verify=verify, http2=http2, **overrides)
+        stale = _clients.pop(upstream, None)
+    if stale is not None:
+        stale.close()
+
+
+def add_transport_wrapper(wrapper):
+    """Wrap the transport of every client built from now on; existing clients are rebuilt"""
+    with _lock:
+        _transport_wrappers.append(wrapper)
+        stale = list(_clients.values())
+        _clients.clear()
+    for client in stale:
+        client.close()
+
+
+def _build_client(upstream):
+    defaults = UPSTREAM_DEFAULTS.get(upstream, UPSTREAM_DEFAULTS['playwright'])
+    settings = _settings.get(upstream, {})
+    max_connections = settings.get('max_connections', _pool_setting(upstream, 'max_connections', defaults['max_connections']))
+    max_keepalive = settings.get('max_keepalive', _pool_setting(upstream, 'max_keepalive', defaults['max_keepalive']))
+    timeout = settings.get('timeout', _pool_setting(upstream, 'timeout', defaults['timeout']))
+    http2 = settings.get('http2', False)
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning(f"⚠️ HTTP/2 requested for {upstream} but the 'h2' package is missing - using HTTP/1.1")
+            http2 = False
+
+    logger.info(f"🔌 HTTP pool for {upstream}: max_connections={max_connections}, "
+                f"keepalive={max_keepalive}, http2={http2}")
+    transport = httpx.HTTPTransport(
+        verify=settings.get('verify', True),
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+    )
+    transport = _DrainingTransport(transport)
+    for wrapper in _transport_wrappers:
+        transport = wrapper(upstream, transport)
+    return httpx.Client(
+        transport=transport,
+        timeout=timeout,
+        event_hooks={'request': [_tracer(upstream)]}
+    )
+
+
+def get_client(upstream):
+    """The shared client for an upstream, built on first use"""
+    client = _clients.get(upstream)
+    if client is None:
+        with _lock:
+            client = _clients.get(upstream)
+            if client is None:
+                client = _clients[upstream] = _build_client(upstream)
+    return client
+
+
+def close_all():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,420 @@
+"""
+Pre-warmed Jupyter kernels for the code_interpreter tool.
+
+qwen_agent's CodeInterpreter starts a kernel on the first call of each tool
+instance, and the Assistant holds a single instance, so the first execution
+in a process (and the first after the kernel died) paid kernel startup plus
+the numpy/pandas/matplotlib imports of its init code, and concurrent runs
+shared one kernel. KernelPool keeps KERNEL_POOL_SIZE idle kernels started
+with the init code and KERNEL_WARM_IMPORTS already executed.
+
+Importing this module starts nothing: the serving process warms the pool
+at startup, and any other process that imports the app (tools, tests)
+only starts kernels if it actually runs code.
+
+A run checks a kernel out on its first code_interpreter call and keeps it
+until the run ends, so variables survive between calls of one run. The
+kernel then has its namespace reset in the background and goes back to the
+pool, unless it has served KERNEL_MAX_EXECUTIONS executions or its memory
+has grown by more than KERNEL_MAX_RSS_GROWTH_MB, in which case it is
+replaced by a fresh one.
+
+Cells run under the run's deadline: the cell timer is capped at the time
+left, and a cell still executing when the run is cancelled is interrupted.
+
+Results are typed (tool_results.py): whether the cell raised is taken from
+the kernel's execute reply, not from the printed output.
+"""
+
+import atexit
+import logging
+import math
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+
+import json5
+from qwen_agent.tools.base import BaseToolWithFileAccess, register_tool
+from qwen_agent.tools.code_interpreter import (ALIB_FONT_FILE, INIT_CODE_FILE, CodeInterpreter,
+                                               _fix_matplotlib_cjk_font_issue)
+from qwen_agent.utils.utils import extract_code
+
+import deadlines
+import metrics
+import tool_results
+
+logger = logging.getLogger(__name__)
+
+KERNEL_POOL_SIZE = int(os.getenv("KERNEL_POOL_SIZE", "2"))  # idle kernels kept warm
+KERNEL_POOL_MAX = int(os.getenv("KERNEL_POOL_MAX", "8"))  # kernels alive at once, busy and idle
+KERNEL_WAIT_TIMEOUT = float(os.getenv("KERNEL_WAIT_TIMEOUT", "30"))  # max seconds a run waits for a kernel
+KERNEL_MAX_EXECUTIONS = int(os.getenv("KERNEL_MAX_EXECUTIONS", "50"))  # executions before a kernel is replaced
+KERNEL_MAX_RSS_GROWTH_MB = float(os.getenv("KERNEL_MAX_RSS_GROWTH_MB", "512"))  # memory growth before it is replaced
+KERNEL_WARM_IMPORTS = [name.strip() for name in
+                       os.getenv("KERNEL_WARM_IMPORTS", "requests,bs4,datetime,statistics").split(",") if name.strip()]
+
+RESET_CODE = "plt.close('all')\n%reset -f"
+REPLY_TIMEOUT = 5  # seconds to wait for a cell's execute reply once its output is complete
+
+
+def _start_code():
+    """qwen_agent's kernel init code followed by the warm imports"""
+    with open(INIT_CODE_FILE) as f:
+        code = f.read().replace('{{M6_FONT_PATH}}', repr(ALIB_FONT_FILE)[1:-1])
+    code += '\n%xmode Minimal\n'
+    for module in KERNEL_WARM_IMPORTS:
+        code += f"try:\n    import {module}\nexcept ImportError:\n    pass\n"
+    return code
+
+
+class PooledKernel:
+    """One kernel process and its client"""
+
+    def __init__(self, kernel_id, client, process, files=()):
+        self.kernel_id = kernel_id
+        self.client = client
+        self.process = process
+        self.files = files     # connection file and launch script left in the work dir
+        self.executions = 0
+        self.last_reply = {}   # execute reply content of the last cell (status, ename, evalue)
+        self.base_rss_mb = self.rss_mb()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def rss_mb(self):
+        """Resident memory of the kernel process (None where /proc is unavailable)"""
+        try:
+            with open(f'/proc/{self.process.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def memory_growth_mb(self):
+        rss = self.rss_mb()
+        if rss is None or self.base_rss_mb is None:
+            return 0.0
+        return rss - self.base_rss_mb
+
+    def interrupt(self):
+        """Raise KeyboardInterrupt in the running cell"""
+        if self.alive():
+            os.kill(self.process.pid, signal.SIGINT)
+
+    def shutdown(self):
+        try:
+            self.client.shutdown()
+            self.client.stop_channels()
+        except Exception:
+            pass
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+        for path in self.files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class _ReplyTracker:
+    """Kernel client proxy that remembers the cell it sent, to read back its execute reply"""
+
+    def __init__(self, client):
+        self._client = client
+        self._msg_id = None
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def execute(self, code, *args, **kwargs):
+        self._msg_id = self._client.execute(code, *args, **kwargs)
+        return self._msg_id
+
+    def reply(self, timeout=REPLY_TIMEOUT):
+        """The cell's execute reply content ({} if none arrived); older unread replies are dropped"""
+        while self._msg_id is not None:
+            try:
+                message = self._client.get_shell_msg(timeout=timeout)
+            except queue.Empty:
+                break
+            if message['parent_header'].get('msg_id') == self._msg_id:
+                return message['content']
+        return {}
+
+
+class KernelPool:
+    """Pre-started kernels handed out per run (per thread) and recycled"""
+
+    def __init__(self, size=KERNEL_POOL_SIZE, max_kernels=KERNEL_POOL_MAX, max_executions=KERNEL_MAX_EXECUTIONS,
+                 max_rss_growth_mb=KERNEL_MAX_RSS_GROWTH_MB, wait_timeout=KERNEL_WAIT_TIMEOUT):
+        self.size = size
+        self.max_kernels = max(max_kernels, 1)
+        self.max_executions = max_executions
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.wait_timeout = wait_timeout
+        self._idle = deque()
+        self._total = 0        # kernels alive or starting
+        self._starting = 0
+        self._restarts = {}
+        self._closed = False
+        self._started = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._interpreter = None
+        self._start_code = None
+        self._setup_lock = threading.Lock()
+        self._background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='kernel-pool')
+
+    def _setup(self):
+        """The CodeInterpreter whose helpers start and drive kernels (created once)"""
+        with self._setup_lock:
+            if self._interpreter is None:
+                interpreter = CodeInterpreter()
+                _fix_matplotlib_cjk_font_issue()
+                interpreter._fix_secure_write_for_code_interpreter()
+                self._start_code = _start_code()
+                self._interpreter = interpreter
+            return self._interpreter
+
+    def _start_kernel(self):
+        interpreter = self._setup()
+        started = time.perf_counter()
+        kernel_id = f'pool_{uuid.uuid4().hex[:12]}_{os.getpid()}'
+        client, process = interpreter._start_kernel(kernel_id)
+        interpreter._execute_code(client, self._start_code)
+        duration = time.perf_counter() - started
+        metrics.KERNEL_START_DURATION.observe(duration)
+        logger.info(f"🐍 Kernel {kernel_id} warm in {duration:.2f}s")
+        files = [os.path.join(interpreter.work_dir, f'kernel_connection_file_{kernel_id}.json'),
+                 os.path.join(interpreter.work_dir, f'launch_kernel_{kernel_id}.py')]
+        return PooledKernel(kernel_id, client, process, files)
+
+    def _update_gauges(self):
+        idle = len(self._idle)
+        metrics.KERNEL_POOL_KERNELS.labels(state='idle').set(idle)
+        metrics.KERNEL_POOL_KERNELS.labels(state='starting').set(self._starting)
+        metrics.KERNEL_POOL_KERNELS.labels(state='busy').set(self._total - self._starting - idle)
+
+    def start(self):
+        """Warm the pool in the background; called by the serving process, or by the first acquire()"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self._replenish()
+
+    def _replenish(self):
+        with self._cond:
+            if self._closed or not self._started:
+                return
+            missing = min(self.size - len(self._idle) - self._starting, self.max_kernels - self._total)
+            for _ in range(max(missing, 0)):
+                self._total += 1
+                self._starting += 1
+                self._background.submit(self._warm_one)
+            self._update_gauges()
+
+    def _warm_one(self):
+        try:
+            kernel = self._start_kernel()
+        except Exception as e:
+            logger.error(f"❌ Failed to start a pooled kernel: {e}")
+            kernel = None
+        with self._cond:
+            self._starting -= 1
+            if kernel is None or self._closed:
+                self._total -= 1
+            else:
+                self._idle.append(kernel)
+            self._update_gauges()
+            self._cond.notify()
+        if kernel is not None and self._closed:
+            kernel.shutdown()
+
+    def acquire(self):
+        """The calling thread's kernel, checking one out of the pool if it has none"""
+        self.start()
+        kernel = getattr(self._local, 'kernel', None)
+        if kernel is not None:
+            if kernel.alive():
+                return kernel
+            self._local.kernel = None
+            self._retire(kernel, 'dead')
+
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.wait_timeout
+        start_here = False
+        dead = []
+        with self._cond:
+            while kernel is None:
+                if self._closed:
+                    raise RuntimeError("Code interpreter kernel pool is shut down")
+                while self._idle and kernel is None:
+                    candidate = self._idle.popleft()
+                    if candidate.alive():
+                        kernel = candidate
+                    else:
+                        dead.append(candidate)
+                if kernel is not None:
+                    break
+                if self._total - len(dead) < self.max_kernels:
+                    self._total += 1
+                    start_here = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"No code interpreter kernel became available within {self.wait_timeout:.0f}s")
+                self._cond.wait(remaining)
+            self._update_gauges()
+
+        for candidate in dead:
+            self._retire(candidate, 'dead')
+        if start_here:
+            try:
+                kernel = self._start_kernel()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._update_gauges()
+                    self._cond.notify()
+                raise
+        metrics.KERNEL_POOL_WAIT.observe(time.perf_counter() - started)
+        self._local.kernel = kernel
+        self._replenish()
+        return kernel
+
+    def execute(self, code, count=True):
+        """Run code on the calling thread's kernel and return the formatted output.
+
+        The kernel's execute reply is left in kernel.last_reply.
+        """
+        kernel = self.acquire()
+        client = _ReplyTracker(kernel.client)
+        result = self._interpreter._execute_code(client, code)
+        kernel.last_reply = client.reply()
+        if count:
+            kernel.executions += 1
+        return result
+
+    def release(self):
+        """Give the calling thread's kernel back; called when a run ends"""
+        kernel = getattr(self._local, 'kernel', None)
+        if kernel is None:
+            return
+        self._local.kernel = None
+        self._background.submit(self._recycle, kernel)
+
+    def _recycle(self, kernel):
+        if not kernel.alive():
+            return self._retire(kernel, 'dead')
+        if self.max_executions and kernel.executions >= self.max_executions:
+            return self._retire(kernel, 'executions')
+        if self.max_rss_growth_mb and kernel.memory_growth_mb() > self.max_rss_growth_mb:
+            return self._retire(kernel, 'memory')
+        try:
+            self._interpreter._execute_code(kernel.client, RESET_CODE)
+            self._interpreter._execute_code(kernel.client, self._start_code)
+        except Exception as e:
+            logger.warning(f"⚠️ Resetting kernel {kernel.kernel_id} failed: {e}")
+            return self._retire(kernel, 'reset_failed')
+        with self._cond:
+            # Kernels started for a burst are not kept beyond the warm target
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append(kernel)
+                self._update_gauges()
+                self._cond.notify()
+                return
+            self._total -= 1
+            self._update_gauges()
+            self._cond.notify()
+        kernel.shutdown()
+
+    def _retire(self, kernel, reason):
+        """Shut a kernel down and start a replacement if the pool is short"""
+        logger.info(f"♻️ Replacing kernel {kernel.kernel_id} ({reason}, {kernel.executions} executions)")
+        metrics.KERNEL_RESTARTS.labels(reason=reason).inc()
+        kernel.shutdown()
+        with self._cond:
+            self._total -= 1
+            self._restarts[reason] = self._restarts.get(reason, 0) + 1
+            self._update_gauges()
+            self._cond.notify()
+        self._replenish()
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for kernel in idle:
+            kernel.shutdown()
+        self._background.shutdown(wait=False)
+
+    def snapshot(self):
+        """Pool state, for /health"""
+        with self._cond:
+            return {
+                "size": self.size,
+                "max": self.max_kernels,
+                "idle": len(self._idle),
+                "busy": self._total - self._starting - len(self._idle),
+                "starting": self._starting,
+                "restarts": dict(self._restarts)
+            }
+
+
+pool = KernelPool()
+atexit.register(pool.shutdown)
+
+
+@register_tool('code_interpreter', allow_overwrite=True)
+class PooledCodeInterpreter(CodeInterpreter):
+    """code_interpreter that executes on the run's kernel from the shared pool"""
+
+    def call(self, params: Union[str, dict], files: List[str] = None, timeout: Optional[int] = 30, **kwargs) -> str:
+        started = time.monotonic()
+        BaseToolWithFileAccess.call(self, params=params, files=files)  # copy remote files to work_dir
+
+        try:
+            code = json5.loads(params)['code']
+        except Exception:
+            code = extract_code(params)
+        if not code.strip():
+            return tool_results.dumps(tool_results.result('code_interpreter', output=''))
+
+        deadline = deadlines.current()
+        kernel = pool.acquire()
+        if deadline.cancelled:
+            return tool_results.dumps(tool_results.failure('code_interpreter',
+                                                           'Cancelled: the request was cancelled before this code ran.'))
+        if timeout:
+            timeout = max(1, math.ceil(deadline.timeout(timeout)))
+            code = f'_M6CountdownTimer.start({timeout})\n{code}'
+        lines = []
+        for line in code.split('\n'):
+            lines.append(line)
+            if line.startswith('sns.set_theme('):
+                lines.append('plt.rcParams["font.family"] = _m6_font_prop.get_name()')
+        until = time.monotonic() + timeout if timeout else deadline.expires_at
+        with deadline.cancelling(kernel.interrupt, 'kernel_interrupt', until=until):
+            result = pool.execute('\n'.join(lines) + '\n\n')
+        reply = kernel.last_reply
+        if timeout:
+            pool.execute('_M6CountdownTimer.cancel()', count=False)
+        errors = [f"{reply.get('ename')}: {reply.get('evalue')}"] if reply.get('status') == 'error' else []
+        return tool_results.dumps(tool_results.result('code_interpreter', ok=not errors, errors=errors,
+                                                      elapsed=time.monotonic() - started,
+                                                      output=result if result.strip() else 'Finished execution.'))
@@ -0,0 +1,189 @@
+"""
+qwen_agent LLM backend that reuses the pooled vLLM HTTP client.
+
+qwen_agent's 'oai' model builds a new openai.OpenAI client, and with it a
+new connection pool, on every completion call. 'oai_pooled' keeps a single
+OpenAI client bound to the shared vLLM httpx.Client from http_clients.
+
+With a router configured (configure_router), every call is sent to the
+endpoint the router picks, keyed for stickiness on the conversation's
+opening messages; a call that fails to connect or gets a 5xx/429 before
+any output is retried once per remaining endpoint.
+
+Calls made within a run honour its deadline (deadlines.py): the request
+timeout is capped at the time left, and a stream still open when the run
+is cancelled is closed, which ends a generation stuck mid-output.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import time
+import weakref
+from contextlib import ExitStack
+
+import openai
+from qwen_agent.llm.base import register_llm
+from qwen_agent.llm.oai import TextChatAtOAI
+
+import deadlines
+import http_clients
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# OpenAI API v1 does not accept these as keyword arguments; they go in extra_body
+EXTRA_BODY_PARAMS = ['top_k', 'repetition_penalty']
+
+
+def to_openai_kwargs(kwargs):
+    """Translate qwen_agent generate_cfg keys into openai v1 call arguments"""
+    if any(k in kwargs for k in EXTRA_BODY_PARAMS):
+        kwargs['extra_body'] = copy.deepcopy(kwargs.get('extra_body', {}))
+        for k in EXTRA_BODY_PARAMS:
+            if k in kwargs:
+                kwargs['extra_body'][k] = kwargs.pop(k)
+    if 'request_timeout' in kwargs:
+        kwargs['timeout'] = kwargs.pop('request_timeout')
+    return kwargs
+
+
+# Errors worth trying on another replica; all but rate limiting also eject the endpoint
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.InternalServerError, openai.RateLimitError)
+
+router = None      # vllm_router.EndpointRouter, set by configure_router
+sticky = True      # route calls of one conversation to the same replica
+
+
+def configure_router(endpoint_router, sticky_routing=True):
+    global router, sticky
+    router = endpoint_router
+    sticky = sticky_routing
+
+
+def affinity_key(messages):
+    """Conversation identity: the system prompt and the first user message"""
+    opening = []
+    for message in messages or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        opening.append(content if isinstance(content, str) else json.dumps(content, sort_keys=True, default=str))
+        if isinstance(message, dict) and message.get('role') == 'user':
+            break
+    return hashlib.sha1('\x00'.join(opening).encode('utf-8')).hexdigest() if opening else None
+
+
+def _finish_call(stream, endpoint, scope, error=None):
+    scope.close()
+    stream.close()
+    router.finish(endpoint, error=error, eject=error is not None)
+
+
+class _TrackedStream:
+    """Keeps the endpoint's call open until the stream is consumed, closed, cancelled or dropped.
+
+    The call is finished exactly once. A stream that is dropped before it
+    is read (e.g. the deadline passed right after the request was sent) is
+    finished when it is garbage collected.
+    """
+
+    def __init__(self, stream, endpoint, deadline):
+        self._chunks = iter(stream)
+        self._deadline = deadline
+        scope = ExitStack()
+        # Runs on the shared deadline timer thread: close without draining the response tail
+        scope.enter_context(deadline.cancelling(lambda: http_clients.abort(stream.response), 'llm_call',
+                                                until=deadline.expires_at))
+        self._finalizer = weakref.finalize(self, _finish_call, stream, endpoint, scope)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            if self._deadline.cancelled:
+                # Closed by the cancellation, not the endpoint's fault
+                self.close()
+                raise deadlines.DeadlineExceeded(self._deadline.reason) from e
+            self.close(error=e)
+            raise
+
+    def close(self, error=None):
+        call = self._finalizer.detach()
+        if call is not None:
+            _, func, args, _ = call
+            func(*args, error=error)
+
+
+@register_llm('oai_pooled')
+class PooledChatAtOAI(TextChatAtOAI):
+
+    def __init__(self, cfg=None):
+        super().__init__(cfg)
+        cfg = cfg or {}
+        base_url = (cfg.get('api_base') or cfg.get('base_url') or cfg.get('model_server') or '').strip()
+        self.api_key = (cfg.get('api_key') or 'EMPTY').strip()
+        self.upstream = cfg.get('upstream', 'vllm')
+        self.client = self._client_for(base_url or None)
+        self._endpoint_clients = {}
+
+        def _chat_complete_create(*args, **kwargs):
+            return self._create(lambda client: client.chat.completions.create(*args, **kwargs), kwargs)
+
+        def _complete_create(*args, **kwargs):
+            return self._create(lambda client: client.completions.create(*args, **kwargs), kwargs)
+
+        self._chat_complete_create = _chat_complete_create
+        self._complete_create = _complete_create
+
+    def _client_for(self, base_url, max_retries=openai.DEFAULT_MAX_RETRIES):
+        return openai.OpenAI(base_url=base_url, api_key=self.api_key, max_retries=max_retries,
+                             http_client=http_clients.get_client(self.upstream))
+
+    def _create(self, call, kwargs):
+        to_openai_kwargs(kwargs)
+        deadline = deadlines.current()
+        deadline.check()
+        timeout = deadline.timeout(kwargs.get('timeout'))
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if router is None:
+            return call(self.client)
+
+        affinity = affinity_key(kwargs.get('messages')) if sticky else None
+        tried = []
+        while True:
+            endpoint = router.pick(affinity, exclude=tried)
+            if endpoint.url not in self._endpoint_clients:
+                # With other replicas to fail over to, the SDK's own retries only delay that
+                retries = 0 if len(router.endpoints) > 1 else openai.DEFAULT_MAX_RETRIES
+                self._endpoint_clients[endpoint.url] = self._client_for(endpoint.url, retries)
+            router.begin(endpoint)
+            started = time.perf_counter()
+            try:
+                response = call(self._endpoint_clients[endpoint.url])
+            except RETRYABLE_ERRORS as e:
+                if deadline.remaining() == 0:
+                    # Timed out or closed because the run's deadline passed
+                    router.finish(endpoint)
+                    deadline.check()
+                router.finish(endpoint, error=e, eject=not isinstance(e, openai.RateLimitError))
+                tried.append(endpoint)
+                if len(tried) >= len(router.endpoints):
+                    raise
+                logger.warning(f"🔁 vLLM call to {endpoint.name} failed ({type(e).__name__}), retrying on another replica")
+                metrics.VLLM_RETRIES.inc()
+                continue
+            except Exception as e:
+                router.finish(endpoint, error=e)
+                raise
+            router.first_response(endpoint, time.perf_counter() - started)
+            if kwargs.get('stream'):
+                return _TrackedStream(response, endpoint, deadline)
+            router.finish(endpoint)
+            return response
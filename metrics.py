@@ -0,0 +1,308 @@
+"""
+Prometheus metrics for the chat pipeline, exposed on /metrics.
+
+Stage latencies are split so a slow request can be attributed to the LLM
+(time to first batch, token throughput), the sandbox (tool call duration)
+or the scraper (Playwright latency).
+"""
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# vLLM does not report usage through qwen_agent's streaming path; output
+# tokens are estimated from generated characters.
+CHARS_PER_TOKEN = 4.0
+
+CHAT_LATENCY = Histogram(
+    'chat_request_duration_seconds',
+    'End-to-end agent run time per chat request',
+    ['endpoint'],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+)
+CHAT_ROUTES = Counter(
+    'chat_routes_total',
+    'Query router decisions: direct LLM completion or agent, with the rule that decided',
+    ['route', 'reason']
+)
+CHAT_ROUTE_LATENCY = Histogram(
+    'chat_route_duration_seconds',
+    'Chat run time per query route (direct or agent)',
+    ['route'],
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+)
+CHAT_FIRST_BATCH = Histogram(
+    'chat_time_to_first_batch_seconds',
+    'Time from run start until bot.run() yields its first batch',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+)
+CHAT_ITERATIONS = Histogram(
+    'chat_bot_run_iterations',
+    'Number of batches yielded by bot.run() per request',
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+CHAT_REQUESTS = Counter(
+    'chat_requests_total',
+    'Chat requests by endpoint and outcome',
+    ['endpoint', 'outcome']
+)
+CHAT_TIMEOUTS = Counter(
+    'chat_timeouts_total',
+    'Agent runs cut off by RESPONSE_TIMEOUT'
+)
+CHAT_FALLBACKS = Counter(
+    'chat_error_fallbacks_total',
+    'Responses replaced by a canned fallback, by reason',
+    ['reason']
+)
+CHAT_WEB_SEARCHES = Counter(
+    'chat_web_search_performed_total',
+    'Chat requests in which the agent performed a web search'
+)
+CHAT_REJECTED = Counter(
+    'chat_rejected_total',
+    'Chat requests shed by admission control',
+    ['reason']
+)
+CHAT_RUNNING = Gauge(
+    'chat_running_runs',
+    'Agent runs currently executing'
+)
+CHAT_QUEUE_DEPTH = Gauge(
+    'chat_queue_depth',
+    'Runs waiting for an executor slot, per cost class (direct or agent)',
+    ['cost_class']
+)
+CHAT_QUEUE_CLIENTS = Gauge(
+    'chat_queue_clients',
+    'Clients with at least one run waiting (fair-queuing flows)'
+)
+CHAT_QUEUE_WAIT = Histogram(
+    'chat_queue_wait_seconds',
+    'Time a run waited in the fair queue before it started, per cost class',
+    ['cost_class'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+)
+CHAT_BATCH_SIZE = Histogram(
+    'chat_batch_queries',
+    'Queries per /chat/batch request',
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500)
+)
+CHAT_BATCH_ITEMS = Counter(
+    'chat_batch_items_total',
+    'Batch queries by how they were answered (run, cached, duplicate of another query in the batch, error)',
+    ['result']
+)
+CHAT_COALESCE_WINDOW = Histogram(
+    'chat_coalesce_window_seconds',
+    'How long after the leading request an identical request joined its in-flight run',
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+)
+CHAT_COALESCE_FAN_IN = Histogram(
+    'chat_coalesce_fan_in',
+    'Requests served by one agent run (1 = not coalesced)',
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+CHAT_CANCELLATIONS = Counter(
+    'chat_cancellations_total',
+    'Agent runs cancelled before they finished, by cause (deadline or client_disconnect)',
+    ['reason']
+)
+CANCELLED_WORK = Counter(
+    'chat_cancelled_work_total',
+    'Outstanding work cancelled with its run (llm_call, kernel_interrupt, web_search, playwright_fetch, queued_run)',
+    ['kind']
+)
+CANCEL_RECLAIMED = Counter(
+    'chat_cancel_reclaimed_seconds_total',
+    'Time cancelled work could otherwise have kept running (up to its own timeout); kind=run is the unused run deadline',
+    ['kind']
+)
+
+TOOL_CALL_DURATION = Histogram(
+    'tool_call_duration_seconds',
+    'Tool execution time (e.g. code_interpreter cells)',
+    ['tool'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+TOOL_OUTPUT_TOKENS = Counter(
+    'tool_output_tokens_total',
+    'Tool result tokens as returned by the tool (raw) and as fed back to the LLM (compacted); '
+    'estimated at 4 characters per token unless TOOL_OUTPUT_TOKENIZER is set',
+    ['tool', 'stage']
+)
+TOOL_OUTPUT_TOKENS_SAVED = Histogram(
+    'tool_output_tokens_saved',
+    'Prompt tokens removed from tool results by compaction per chat request; '
+    'estimated unless TOOL_OUTPUT_TOKENIZER is set',
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+PLAYWRIGHT_LATENCY = Histogram(
+    'playwright_request_duration_seconds',
+    'Playwright service call latency',
+    ['action'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 20, 30)
+)
+
+VLLM_OUTPUT_TOKENS = Counter(
+    'vllm_output_tokens_total',
+    'Estimated tokens generated by vLLM'
+)
+VLLM_TOKEN_THROUGHPUT = Histogram(
+    'vllm_output_tokens_per_second',
+    'Estimated vLLM generation throughput per LLM turn',
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+)
+
+VLLM_ENDPOINT_INFLIGHT = Gauge(
+    'vllm_endpoint_inflight_requests',
+    'LLM calls currently outstanding per vLLM endpoint',
+    ['endpoint']
+)
+VLLM_ENDPOINT_LATENCY = Histogram(
+    'vllm_endpoint_first_response_seconds',
+    'Time from sending an LLM call to its first response, per vLLM endpoint',
+    ['endpoint'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+VLLM_ENDPOINT_FAILURES = Counter(
+    'vllm_endpoint_failures_total',
+    'Failed LLM calls per vLLM endpoint',
+    ['endpoint']
+)
+VLLM_ENDPOINT_UP = Gauge(
+    'vllm_endpoint_up',
+    'Whether a vLLM endpoint is in rotation (0 = ejected until its next successful probe)',
+    ['endpoint']
+)
+VLLM_RETRIES = Counter(
+    'vllm_retries_total',
+    'LLM calls retried on another vLLM endpoint after a failure'
+)
+
+HTTP_CLIENT_REQUESTS = Counter(
+    'http_client_requests_total',
+    'Requests sent through the pooled upstream HTTP clients',
+    ['upstream']
+)
+HTTP_CLIENT_CONNECTIONS = Counter(
+    'http_client_connections_opened_total',
+    'New TCP connections opened by the pooled upstream HTTP clients (reuse = 1 - opened/requests)',
+    ['upstream']
+)
+HTTP_CLIENT_TLS_HANDSHAKES = Counter(
+    'http_client_tls_handshakes_total',
+    'TLS handshakes performed by the pooled upstream HTTP clients',
+    ['upstream']
+)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    'response_cache_lookups_total',
+    'Chat response cache lookups by result (hit_exact, hit_normalized, hit_semantic, miss, bypass)',
+    ['result']
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    'response_cache_evictions_total',
+    'Chat responses evicted from the cache to stay within its size bound'
+)
+RESPONSE_CACHE_ENTRIES = Gauge(
+    'response_cache_entries',
+    'Chat responses currently cached'
+)
+
+PAGE_CACHE_LOOKUPS = Counter(
+    'page_cache_lookups_total',
+    'Scraped page cache lookups by result (fresh, stale, miss)',
+    ['result']
+)
+PAGE_CACHE_EVICTIONS = Counter(
+    'page_cache_evictions_total',
+    'Pages evicted from the scraped page cache to stay within its byte bound',
+    ['store']
+)
+PAGE_FETCH_JOINED = Counter(
+    'page_fetches_joined_total',
+    'Page cache misses served by waiting for a fetch of the same page already in flight'
+)
+PAGE_CACHE_BYTES = Gauge(
+    'page_cache_bytes',
+    'Encoded size of the pages held in the in-process page cache'
+)
+
+KERNEL_POOL_KERNELS = Gauge(
+    'kernel_pool_kernels',
+    'code_interpreter kernels in the pool by state (idle, busy, starting)',
+    ['state']
+)
+KERNEL_POOL_WAIT = Histogram(
+    'kernel_pool_wait_seconds',
+    'Time a run waited to check a kernel out of the pool (includes cold starts)',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30)
+)
+KERNEL_START_DURATION = Histogram(
+    'kernel_start_duration_seconds',
+    'Kernel startup including init code and warm imports',
+    buckets=(0.5, 1, 2, 3, 5, 10, 20, 30)
+)
+KERNEL_RESTARTS = Counter(
+    'kernel_restarts_total',
+    'Pooled kernels replaced, by reason (executions, memory, dead, reset_failed)',
+    ['reason']
+)
+
+SESSIONS_ACTIVE = Gauge(
+    'chat_sessions_active',
+    'Conversations with history held in the session store'
+)
+SESSION_HISTORY_BYTES = Gauge(
+    'chat_session_history_bytes',
+    'Conversation history text held in the session store'
+)
+SESSION_EVICTIONS = Counter(
+    'chat_session_evictions_total',
+    'Conversations dropped from the session store, by reason (ttl, lru)',
+    ['reason']
+)
+SESSION_COMPACTIONS = Counter(
+    'chat_session_compactions_total',
+    'Conversation histories compacted to stay within the token budget'
+)
+SESSION_PREFIX_REUSE = Counter(
+    'chat_session_prefix_reuse_total',
+    'Follow-up prompts whose history extends the previous prompt unchanged (hit) or was rewritten by compaction (miss)',
+    ['result']
+)
+
+STARTUP_PHASE_DURATION = Gauge(
+    'startup_phase_duration_seconds',
+    'Duration of each startup phase of the last successful agent initialization',
+    ['phase']
+)
+
+UPSTREAM_UP = Gauge(
+    'upstream_up',
+    'Last health probe result per upstream service (1 = healthy)',
+    ['service']
+)
+UPSTREAM_PROBE_LATENCY = Histogram(
+    'upstream_probe_duration_seconds',
+    'Background health probe latency per upstream service',
+    ['service'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+
+def observe_chat_job(job):
+    """ChatRunner listener"""
+    if job.key is not None:
+        CHAT_COALESCE_FAN_IN.observe(job.fan_in)
+
+
+def observe_probe(service, ok, latency):
+    """HealthProber listener"""
+    UPSTREAM_UP.labels(service=service).set(1 if ok else 0)
+    UPSTREAM_PROBE_LATENCY.labels(service=service).observe(latency)
+
+
+def render():
+    """(body, content type) for the /metrics endpoint"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,219 @@
+"""
+Local cache of scraped pages for the search tool.
+
+Entries hold the extracted, cleaned text of a page (not its HTML), keyed by
+a hash of action + URL, so a homepage fetched for one request is neither
+transferred nor parsed again for the next. Entries are fresh for
+PAGE_CACHE_TTL seconds and may then be served stale for PAGE_CACHE_STALE_TTL
+more while a single background refresh replaces them. Concurrent misses
+for the same page share one fetch (load), so a burst of searches hitting
+the same homepages, e.g. a batch of news questions, fetches each page once.
+
+The in-process store is LRU-bounded by bytes. With PAGE_CACHE_PATH set, a
+SQLite file (WAL, memory-mapped) backs it so several worker processes share
+what any of them fetched.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "120"))  # seconds an entry is fresh
+PAGE_CACHE_STALE_TTL = float(os.getenv("PAGE_CACHE_STALE_TTL", "600"))  # extra seconds it may be served while refreshing
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "")  # SQLite file shared across workers; empty = in-process only
+PAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("PAGE_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def page_key(url, action='content'):
+    return hashlib.sha256(f"{action}\x00{url}".encode('utf-8')).hexdigest()
+
+
+class SqlitePageStore:
+    """Byte-bounded page store in a SQLite file, safe to share between processes"""
+
+    def __init__(self, path, max_bytes=PAGE_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(max_bytes)}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages ("
+                           "key TEXT PRIMARY KEY, value BLOB NOT NULL, stored REAL NOT NULL, size INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_stored ON pages (stored)")
+
+    def get(self, key):
+        """(encoded value, stored time) or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored FROM pages WHERE key = ?", (key,)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def put(self, key, value, stored):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO pages (key, value, stored, size) VALUES (?, ?, ?, ?)",
+                               (key, value, stored, len(value)))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute("SELECT key, size FROM pages ORDER BY stored LIMIT 16").fetchall()
+                if not oldest:
+                    break
+                evicted = []
+                for evicted_key, evicted_size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    total -= evicted_size
+                self._conn.executemany("DELETE FROM pages WHERE key = ?", evicted)
+                metrics.PAGE_CACHE_EVICTIONS.labels(store='disk').inc(len(evicted))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PageCache:
+    """Byte-bounded LRU of extracted pages with TTL and stale-while-revalidate.
+
+    Values must be JSON-serializable; their encoded size is what counts
+    against max_bytes.
+    """
+
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL, stale_ttl=PAGE_CACHE_STALE_TTL,
+                 path=PAGE_CACHE_PATH):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()   # key -> (value, stored, size)
+        self._bytes = 0
+        self._refreshing = set()
+        self._loading = {}   # key -> Future of the fetch in flight
+        self._lock = threading.Lock()
+        self.store = None
+        if path:
+            try:
+                self.store = SqlitePageStore(path)
+                logger.info(f"🗄️ Page cache backed by {path}")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Could not open page cache at {path}, using memory only: {e}")
+
+    def _remember(self, key, value, stored, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, stored, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                metrics.PAGE_CACHE_EVICTIONS.labels(store='memory').inc()
+            metrics.PAGE_CACHE_BYTES.set(self._bytes)
+
+    def get(self, key):
+        """(value, 'fresh' | 'stale') or (None, 'miss')"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.store is not None:
+            try:
+                row = self.store.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Page cache read failed: {e}")
+                row = None
+            if row is not None:
+                encoded, stored = row
+                entry = (json.loads(encoded), stored, len(encoded))
+                self._remember(key, *entry)
+
+        state = 'miss'
+        if entry is not None:
+            age = now - entry[1]
+            if age < self.ttl:
+                state = 'fresh'
+            elif age < self.ttl + self.stale_ttl:
+                state = 'stale'
+        metrics.PAGE_CACHE_LOOKUPS.labels(result=state).inc()
+        return (entry[0], state) if state != 'miss' else (None, state)
+
+    def put(self, key, value):
+        stored = time.time()
+        encoded = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        self._remember(key, value, stored, len(encoded))
+        if self.store is not None:
+            try:
+                self.store.put(key, encoded, stored)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Page cache write failed: {e}")
+
+    def load(self, key, loader, timeout=None):
+        """Fetch a missing entry with loader(), or wait up to timeout for the fetch already in flight.
+
+        Returns the loaded value (None if loading failed or timed out).
+        """
+        with self._lock:
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._loading[key] = Future()
+        if not leader:
+            metrics.PAGE_FETCH_JOINED.inc()
+            try:
+                return future.result(timeout)
+            except FutureTimeout:
+                return None
+
+        value = None
+        try:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            future.set_result(value)
+        return value
+
+    def refresh(self, key, loader, executor):
+        """Reload a stale entry in the background; at most one refresh per key at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = loader()
+                if value is not None:
+                    self.put(key, value)
+            except Exception as e:
+                logger.warning(f"⚠️ Background page refresh failed: {str(e)[:100]}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        try:
+            executor.submit(run)
+        except RuntimeError:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            metrics.PAGE_CACHE_BYTES.set(0)
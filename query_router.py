@@ -0,0 +1,82 @@
+"""
+Cheap routing of chat queries to the agent or to a single LLM completion.
+
+Every query used to go through the Assistant, whose system prompt (search
+guidelines plus tool descriptions) costs thousands of prompt tokens and
+invites tool round trips even for "What is 2+2?". Queries that need no
+current information now take the 'direct' path: one chat completion with
+a minimal prompt. Time-sensitive queries, and ones that need computation
+over data, keep the 'agent' path with search_web and code_interpreter.
+
+Keyword heuristics (search_web's query classes plus broader recency cues)
+decide most queries. The rest go to an optional small-model classifier, or
+to the agent when there is none.
+"""
+
+import re
+from datetime import datetime
+
+from search_tool import classify_query
+
+# Cues that the answer depends on current information (matched as whole words/phrases)
+TIME_SENSITIVE_TERMS = [
+    'current', 'currently', 'now', 'right now', 'recent', 'recently', 'tonight', 'yesterday', 'tomorrow',
+    'this week', 'this month', 'this year', 'last night', 'upcoming', 'live', 'price', 'prices', 'rate',
+    'rates', 'election', 'polls', 'won', 'winner', 'release date', 'released', 'announced', 'update',
+    'updates', 'trending', 'headlines', 'schedule', 'standings', 'shares', 'crypto', 'bitcoin', 'search',
+    'look up', 'google', 'website', 'open now', 'traffic', 'outage'
+]
+# Cues that the agent's code_interpreter is needed
+TOOL_TERMS = [
+    'plot', 'chart', 'graph', 'csv', 'dataset', 'spreadsheet', 'dataframe', 'regression', 'simulate',
+    'run this code', 'execute', 'python code'
+]
+# Openers of questions that general knowledge answers
+EVERGREEN_PATTERNS = [
+    r"^(what|who) (is|are|was|were) ", r"^what does ", r"^(define|definition of|meaning of) ", r"^explain ",
+    r"^describe ", r"^how (do|does|did|to|can|is|are) ", r"^why ", r"^(summarize|translate|write|rewrite) ",
+    r"^(tell me|teach me) about ", r"difference between ", r"benefits of ", r"pros and cons", r"examples of ",
+    r"history of ", r"^(hi|hello|hey|thanks|thank you)\b"
+]
+
+URL_RE = re.compile(r"https?://|www\.")
+YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+
+_time_sensitive_re = re.compile(r"\b(" + "|".join(re.escape(term) for term in TIME_SENSITIVE_TERMS) + r")\b")
+_tool_re = re.compile(r"\b(" + "|".join(re.escape(term) for term in TOOL_TERMS) + r")\b")
+_evergreen_re = re.compile("|".join(EVERGREEN_PATTERNS))
+
+
+class QueryRouter:
+    """Decides 'direct' or 'agent' per query, returning (route, reason).
+
+    classify, if given, maps an ambiguous query to True when it needs the
+    web; without it (or when it fails) ambiguous queries take the default.
+    """
+
+    def __init__(self, classify=None, default='agent'):
+        self.classify = classify
+        self.default = default
+
+    def route(self, query):
+        text = ' '.join(query.lower().split())
+        if classify_query(text):
+            return 'agent', 'query_class'
+        if URL_RE.search(text) or _time_sensitive_re.search(text) or self._recent_year(text):
+            return 'agent', 'time_sensitive'
+        if _tool_re.search(text):
+            return 'agent', 'tool'
+        if _evergreen_re.search(text):
+            return 'direct', 'evergreen'
+        if self.classify is not None:
+            try:
+                return ('agent' if self.classify(query) else 'direct'), 'model'
+            except Exception:
+                pass
+        return self.default, 'default'
+
+    @staticmethod
+    def _recent_year(text):
+        """A year from last year on, e.g. 'who won in 2025'"""
+        this_year = datetime.now().year
+        return any(int(match.group(0)) >= this_year - 1 for match in YEAR_RE.finditer(text))
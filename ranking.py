@@ -0,0 +1,169 @@
+"""
+BM25 passage ranking for search results.
+
+Passages (extracted text lines) from every source of one search are
+tokenized once into a per-request inverted index and scored with BM25
+using NumPy, plus optional boosts when query terms appear as a phrase or
+close together. Near-identical passages from different sources are
+collapsed so the same teaser is not handed to the model twice.
+"""
+
+import re
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'how', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'were', 'what', 'when', 'where', 'which',
+    'who', 'why', 'will', 'with', 'about', 'me', 'tell', 'please', 'current', 'latest'
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+PHRASE_BOOST = 0.5       # added per adjacent query-term pair found in order, scaled by the best term score
+PROXIMITY_BOOST = 0.3    # scaled by how tightly all matched query terms cluster
+DEDUPE_SIMILARITY = 0.8  # Jaccard similarity of word shingles above which passages are duplicates
+BOOST_CANDIDATES = 200   # phrase/proximity boosts are computed for this many top BM25 passages
+
+
+def stem(token):
+    """Light suffix stripping so 'prices'/'price' and 'scores'/'score' match"""
+    for suffix in ('ings', 'ing', 'edly', 'ed', 'ies', 'es', 's', 'ly'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == 'ies':
+                return token[:-3] + 'y'
+            if suffix == 'es' and not token.endswith(('ses', 'xes', 'zes', 'ches', 'shes')):
+                return token[:-1]
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+def query_terms(query):
+    """Stemmed query tokens without stopwords (all tokens if only stopwords)"""
+    tokens = TOKEN_RE.findall(query.lower())
+    terms = [stem(token) for token in tokens if token not in STOPWORDS]
+    return terms or [stem(token) for token in tokens]
+
+
+class BM25Index:
+    """Inverted index over pre-tokenized passages"""
+
+    def __init__(self, passages_tokens, k1=BM25_K1, b=BM25_B):
+        self.tokens = passages_tokens
+        self.k1 = k1
+        self.b = b
+        self.size = len(passages_tokens)
+        self.lengths = np.array([len(tokens) for tokens in passages_tokens], dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if self.size else 0.0
+        postings = {}
+        for doc, tokens in enumerate(passages_tokens):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, ([], []))
+                postings[token][0].append(doc)
+                postings[token][1].append(count)
+        self.postings = {token: (np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                         for token, (docs, tfs) in postings.items()}
+
+    def idf(self, term):
+        df = len(self.postings[term][0]) if term in self.postings else 0
+        return float(np.log(1 + (self.size - df + 0.5) / (df + 0.5)))
+
+    def scores(self, terms):
+        """BM25 score of every passage for the query terms"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        if not self.size:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / max(self.avg_length, 1e-6))
+        for term in set(terms):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            scores[docs] += self.idf(term) * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        return scores
+
+    def boosts(self, doc, terms):
+        """Phrase and proximity bonus (multiplier - 1) for one passage"""
+        tokens = self.tokens[doc]
+        wanted = set(terms)
+        positions = [i for i, token in enumerate(tokens) if token in wanted]
+        if len(wanted) < 2 or len(positions) < 2:
+            return 0.0
+        bonus = 0.0
+        pairs = set(zip(terms, terms[1:]))
+        if pairs:
+            found = sum(1 for i in range(len(tokens) - 1) if (tokens[i], tokens[i + 1]) in pairs)
+            bonus += PHRASE_BOOST * min(found, len(pairs)) / len(pairs)
+        # Smallest window containing every distinct matched term
+        matched = {tokens[i] for i in positions}
+        if len(matched) > 1:
+            best, counts, left = len(tokens), {}, 0
+            for right in positions:
+                counts[tokens[right]] = counts.get(tokens[right], 0) + 1
+                while len(counts) == len(matched):
+                    start = positions[left]
+                    best = min(best, right - start + 1)
+                    counts[tokens[start]] -= 1
+                    if not counts[tokens[start]]:
+                        del counts[tokens[start]]
+                    left += 1
+            bonus += PROXIMITY_BOOST * (len(matched) / len(wanted)) * len(matched) / best
+        return bonus
+
+
+def _shingles(tokens, size=3):
+    if len(tokens) <= size:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def iter_ranked_passages(query, passages_tokens, boosts=True, dedupe=True):
+    """Yield (index, score) of matching passages, best first.
+
+    Passages that match no query term are left out; with dedupe, a passage
+    too similar to a better-ranked one is skipped. Lazy, so callers that
+    need only the top few stop early.
+    """
+    terms = query_terms(query)
+    index = BM25Index(passages_tokens)
+    scores = index.scores(terms)
+    candidates = np.flatnonzero(scores > 0)
+    if boosts and len(candidates):
+        top = candidates[np.argsort(-scores[candidates], kind='stable')[:BOOST_CANDIDATES]]
+        for doc in top:
+            scores[doc] *= 1 + index.boosts(doc, terms)
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    kept_sizes = []
+    shingle_owners = {}     # shingle -> positions in kept_sizes of kept passages containing it
+    for doc in order:
+        if dedupe:
+            shingles = _shingles(passages_tokens[doc])
+            shared = {}
+            for shingle in shingles:
+                for kept in shingle_owners.get(shingle, ()):
+                    shared[kept] = shared.get(kept, 0) + 1
+            if any(n / (len(shingles) + kept_sizes[kept] - n) >= DEDUPE_SIMILARITY for kept, n in shared.items()):
+                continue
+            for shingle in shingles:
+                shingle_owners.setdefault(shingle, []).append(len(kept_sizes))
+            kept_sizes.append(len(shingles))
+        yield int(doc), float(scores[doc])
+
+
+def rank_passages(query, passages_tokens, limit=None, boosts=True, dedupe=True):
+    """The best matching passages as a list of (index, score) pairs"""
+    ranked = []
+    for item in iter_ranked_passages(query, passages_tokens, boosts, dedupe):
+        ranked.append(item)
+        if limit is not None and len(ranked) >= limit:
+            break
+    return ranked
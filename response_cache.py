@@ -0,0 +1,188 @@
+"""
+Response cache in front of the agent for repeated chat queries.
+
+Lookups try, in order: the exact query, a normalized form of it (case,
+sentence punctuation, filler words and whitespace removed) and, when an embedding
+function is configured, the most similar cached query of the same query
+class. Entries expire after a TTL chosen by query class (reusing the
+search tool's news/sports/finance/weather keywords), and the cache is
+LRU-bounded by entry count.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+from search_tool import classify_query
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() in ['true', '1', 'yes', 'on']
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))  # min cosine for a semantic hit
+
+# Seconds a cached answer stays fresh, per query class (None = evergreen)
+CLASS_TTLS = {
+    'finance': float(os.getenv("RESPONSE_CACHE_TTL_FINANCE", "60")),
+    'sports': float(os.getenv("RESPONSE_CACHE_TTL_SPORTS", "120")),
+    'news': float(os.getenv("RESPONSE_CACHE_TTL_NEWS", "300")),
+    'weather': float(os.getenv("RESPONSE_CACHE_TTL_WEATHER", "900")),
+    None: float(os.getenv("RESPONSE_CACHE_TTL_DEFAULT", "3600")),
+}
+
+# Request headers that force a fresh agent run (the new answer is still cached)
+BYPASS_HEADERS = ['x-cache-bypass']
+
+# Metadata of the conversation a response was produced in; never handed to another requester
+SESSION_FIELDS = ('conversation_id', 'history_messages')
+
+# Stripped from the ends of words; anything else ('2+2', 'c++', 'c#', '3.5%') is part of the question
+SENTENCE_PUNCTUATION = ',;:!?"\'()[]{}'
+
+FILLER_WORDS = {'please', 'hey', 'hi', 'hello', 'can', 'could', 'would', 'you', 'tell', 'me', 'the', 'a', 'an'}
+
+
+def normalize_query(query):
+    """Lowercased query without sentence punctuation, filler words or extra whitespace.
+
+    Symbols inside words are kept, so "2+2" and "2*2" or "C++" and "C#"
+    stay different questions.
+    """
+    text = unicodedata.normalize('NFKC', query).lower()
+    words = [word.strip(SENTENCE_PUNCTUATION).rstrip('.') for word in text.split()]
+    words = [word for word in words if word]
+    return ' '.join(word for word in words if word not in FILLER_WORDS) or ' '.join(words) or text.strip()
+
+
+def bypass_requested(headers):
+    """True if the request asks to skip the cache (X-Cache-Bypass or Cache-Control: no-cache)"""
+    for name in BYPASS_HEADERS:
+        value = headers.get(name)
+        if value and value.lower() not in ('0', 'false', 'no', 'off'):
+            return True
+    cache_control = (headers.get('cache-control') or '').lower()
+    return 'no-cache' in cache_control or 'no-store' in cache_control
+
+
+class ResponseCache:
+    """Thread-safe LRU of chat 'done' payloads keyed by normalized query.
+
+    embed, if given, maps a query to a vector; it enables similarity lookup
+    over the cached queries of the same class.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, embed=None, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity = similarity
+        self._entries = OrderedDict()   # normalized query -> entry
+        self._lock = threading.Lock()
+
+    def _embedding(self, query):
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(self.embed(query), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"⚠️ Query embedding failed, similarity lookup skipped: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] <= now:
+            del self._entries[key]
+            metrics.RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+            return None
+        return entry
+
+    def _semantic_match(self, query_class, vector, now):
+        best_key, best_score = None, self.similarity
+        for key, entry in list(self._entries.items()):
+            if entry['vector'] is None or entry['class'] != query_class:
+                continue
+            score = float(np.dot(entry['vector'], vector))
+            if score >= best_score and self._live(key, now):
+                best_key, best_score = key, score
+        return best_key
+
+    def needs_embedding(self, query):
+        """True if get(query) would call the embedding endpoint (no exact or normalized entry)"""
+        if self.embed is None:
+            return False
+        with self._lock:
+            return self._live(normalize_query(query), time.time()) is None
+
+    def get(self, query):
+        """(payload copy, match kind, age in seconds) or None"""
+        now = time.time()
+        normalized = normalize_query(query)
+        with self._lock:
+            entry = self._live(normalized, now)
+            key = normalized if entry else None
+            kind = 'exact' if entry and entry['query'] == query else 'normalized'
+
+        if key is None and self.embed is not None:
+            vector = self._embedding(query)
+            if vector is not None:
+                with self._lock:
+                    key, kind = self._semantic_match(classify_query(query), vector, now), 'semantic'
+
+        if key is None:
+            metrics.RESPONSE_CACHE_LOOKUPS.labels(result='miss').inc()
+            return None
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                metrics.RESPONSE_CACHE_LOOKUPS.labels(result='miss').inc()
+                return None
+            self._entries.move_to_end(key)
+            payload = copy.deepcopy(entry['payload'])
+            age = now - entry['stored']
+        metrics.RESPONSE_CACHE_LOOKUPS.labels(result=f'hit_{kind}').inc()
+        return payload, kind, age
+
+    def put(self, query, payload):
+        """Cache a finished response under the query's class TTL, without its SESSION_FIELDS"""
+        now = time.time()
+        query_class = classify_query(query)
+        ttl = CLASS_TTLS.get(query_class, CLASS_TTLS[None])
+        if ttl <= 0:
+            return
+        normalized = normalize_query(query)
+        vector = self._embedding(query)
+        payload = copy.deepcopy(payload)
+        for field in SESSION_FIELDS:
+            payload.get('metadata', {}).pop(field, None)
+        with self._lock:
+            self._entries.pop(normalized, None)
+            self._entries[normalized] = {
+                'query': query,
+                'class': query_class,
+                'payload': payload,
+                'stored': now,
+                'expires': now + ttl,
+                'vector': vector,
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.RESPONSE_CACHE_EVICTIONS.inc()
+            metrics.RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            metrics.RESPONSE_CACHE_ENTRIES.set(0)
+
+    def __len__(self):
+        return len(self._entries)
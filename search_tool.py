@@ -0,0 +1,339 @@
+"""
+Native web search tool for the Qwen agent.
+
+The search routine used to live in the system prompt as code the model had
+to re-emit and run through code_interpreter on every query. It now runs in
+the server process as a registered qwen_agent tool: the model sends a short
+JSON call ({"query": ...}) and gets the ranked results back as a typed
+tool result (see tool_results.py).
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from urllib.parse import quote
+
+from qwen_agent.tools.base import BaseTool, register_tool
+
+import deadlines
+import http_clients
+import metrics
+import tool_results
+from html_extract import extract_text
+from page_cache import PageCache, page_key
+from ranking import iter_ranked_passages, query_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLAYWRIGHT_URL = os.getenv("PLAYWRIGHT_SERVICE_URL", "http://playwright-service:3000")
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "30"))  # seconds per search_web call
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "16"))  # concurrent fetches, shared by all searches
+LINK_FOLLOW_FANOUT = int(os.getenv("LINK_FOLLOW_FANOUT", "2"))  # links followed in parallel per search engine
+PAGE_TEXT_BUDGET = int(os.getenv("PAGE_TEXT_BUDGET", "200000"))  # characters of text extracted per source page
+LINK_EXCERPT_CHARS = 1000  # characters of a followed link that are checked and quoted
+PASSAGES_PER_SOURCE = 5  # ranked lines kept per source
+PASSAGE_CHARS = 200  # characters of a ranked line handed to the model
+
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix='search-fetch')
+page_cache = PageCache()
+
+# Query classes and the keywords that select them
+QUERY_CLASS_KEYWORDS = {
+    'news': ['news', 'breaking', 'latest', 'today'],
+    'sports': ['sports', 'game', 'score', 'nfl', 'nba', 'nhl', 'mlb'],
+    'finance': ['stock', 'market', 'finance', 'trading'],
+    'weather': ['weather', 'forecast', 'temperature'],
+}
+
+# Domain-specific sources per query class
+DOMAIN_SOURCES = {
+    'news': [
+        {"name": "BBC News", "url": "https://www.bbc.com/news"},
+        {"name": "Reuters", "url": "https://www.reuters.com"},
+        {"name": "Associated Press", "url": "https://apnews.com"}
+    ],
+    'sports': [
+        {"name": "ESPN", "url": "https://www.espn.com"},
+        {"name": "The Score", "url": "https://www.thescore.com"},
+        {"name": "Sports Illustrated", "url": "https://www.si.com"}
+    ],
+    'finance': [
+        {"name": "Yahoo Finance", "url": "https://finance.yahoo.com"},
+        {"name": "MarketWatch", "url": "https://www.marketwatch.com"},
+        {"name": "CNBC", "url": "https://www.cnbc.com"}
+    ],
+    'weather': [
+        {"name": "Weather.com", "url": "https://weather.com"},
+        {"name": "AccuWeather", "url": "https://www.accuweather.com"}
+    ],
+}
+
+
+def classify_query(query):
+    """Return the query class ('news', 'sports', 'finance', 'weather') or None"""
+    query_lower = query.lower()
+    for query_class, keywords in QUERY_CLASS_KEYWORDS.items():
+        if any(term in query_lower for term in keywords):
+            return query_class
+    return None
+
+
+def build_search_sources(query):
+    """Multi-source search strategy: general engines plus domain sources for the query class"""
+    search_sources = [
+        {
+            "name": "Google Search",
+            "url": f"https://www.google.com/search?q={quote(query)}&num=10",
+            "extract_links": True
+        },
+        {
+            "name": "DuckDuckGo",
+            "url": f"https://duckduckgo.com/?q={quote(query)}",
+            "extract_links": True
+        }
+    ]
+    query_class = classify_query(query)
+    if query_class:
+        search_sources.extend(DOMAIN_SOURCES[query_class])
+    return search_sources
+
+
+def fetch_page(playwright_url, url, timeout_ms, request_timeout, stop=None):
+    """Fetch rendered page content through the Playwright service; None on failure"""
+    if stop is not None and stop.is_set():
+        return None
+    payload = {
+        "url": url,
+        "action": "content",
+        "timeout": min(timeout_ms, int(request_timeout * 1000))  # the page load must end before our request does
+    }
+    started = time.perf_counter()
+    try:
+        response = http_clients.get_client('playwright').post(f"{playwright_url}/scrape", json=payload,
+                                                              timeout=request_timeout)
+    finally:
+        metrics.PLAYWRIGHT_LATENCY.labels(action='content').observe(time.perf_counter() - started)
+    if response.status_code != 200:
+        logger.warning(f"❌ Failed to access {url}: HTTP {response.status_code}")
+        return None
+    result = response.json()
+    if not result.get('success'):
+        return None
+    return result.get('data', '')
+
+
+def load_page(playwright_url, url, timeout_ms, request_timeout, stop=None, max_chars=PAGE_TEXT_BUDGET):
+    """Extracted page ({'lines', 'links'}) from the page cache or Playwright; None on failure.
+
+    Stale entries are returned immediately and refreshed in the background;
+    a page another search is already fetching is waited for, not fetched again.
+    """
+    key = page_key(url, f'text:{max_chars}')
+    page, state = page_cache.get(key)
+    if state == 'stale':
+        page_cache.refresh(key, lambda: _fetch_extracted(playwright_url, url, timeout_ms, request_timeout,
+                                                         max_chars=max_chars), _search_executor)
+    if page is not None:
+        return page
+    return page_cache.load(key, lambda: _fetch_extracted(playwright_url, url, timeout_ms, request_timeout, stop,
+                                                         max_chars), timeout=request_timeout)
+
+
+def _fetch_extracted(playwright_url, url, timeout_ms, request_timeout, stop=None, max_chars=PAGE_TEXT_BUDGET):
+    content = fetch_page(playwright_url, url, timeout_ms, request_timeout, stop)
+    return extract_text(content, max_chars=max_chars) if content is not None else None
+
+
+def _scan_source(source, terms, playwright_url, request_timeout, stop):
+    """Fetch one source; return (result or None, candidate links to follow).
+
+    The result carries its candidate lines, tokenized, under 'candidates';
+    they are ranked against all other sources once the search completes.
+    """
+    logger.info(f"📡 Checking {source['name']}...")
+    started = time.monotonic()
+    page = load_page(playwright_url, source["url"], 20000, request_timeout, stop)
+    fetch_seconds = time.monotonic() - started
+    if page is None:
+        return None, []
+
+    # Meaningful lines that mention at least one query term
+    candidates = []
+    for line in page['lines']:
+        if len(line) > 20:
+            tokens = tokenize(line)
+            if terms.intersection(tokens):
+                candidates.append((line, tokens))
+
+    result = None
+    if candidates:
+        result = {
+            "name": source["name"],
+            "url": source["url"],
+            "fetch_seconds": round(fetch_seconds, 3),
+            "passages": [],
+            "candidates": candidates
+        }
+        logger.info(f"✅ Found relevant content from {source['name']}")
+
+    # Links for further exploration if specified
+    links = []
+    if source.get("extract_links"):
+        for link in page['links']:
+            href = link['href']
+            if href.startswith('http') and terms.intersection(tokenize(link['text'])):
+                links.append(href)
+    return result, links[:LINK_FOLLOW_FANOUT]
+
+
+def _follow_link(source, href, terms, playwright_url, request_timeout, stop):
+    """Fetch a linked page; return a result if it mentions the query"""
+    started = time.monotonic()
+    page = load_page(playwright_url, href, 15000, request_timeout, stop, max_chars=LINK_EXCERPT_CHARS)
+    if not page:
+        return None
+    link_text = '\n'.join(page['lines'])[:LINK_EXCERPT_CHARS]
+    if terms.intersection(tokenize(link_text)):
+        excerpt = link_text[:500]
+        return {
+            "name": f"Link from {source['name']}",
+            "url": href,
+            "fetch_seconds": round(time.monotonic() - started, 3),
+            "passages": [],
+            "candidates": [(excerpt, tokenize(excerpt))]
+        }
+    return None
+
+
+def search_web(query, max_results=3, playwright_url=DEFAULT_PLAYWRIGHT_URL, deadline=None):
+    """Enterprise web search using the Playwright service.
+
+    All sources are fetched concurrently and link follow-ups are scheduled
+    as soon as their search page is parsed. Results are merged as they
+    complete; once max_results are in, or the per-query deadline passes,
+    queued fetches are cancelled and in-flight ones are abandoned. The
+    per-query deadline never extends past the run's, and cancelling the
+    run ends the search with the results collected so far.
+
+    Returns a typed search_web result (tool_results.py). Sources that
+    failed or were still outstanding at the end are listed in its errors;
+    it is not ok only when nothing was found and something failed.
+    """
+    logger.info(f"🔍 Searching for: {query}")
+    run_deadline = deadlines.current()
+    deadline = run_deadline.timeout(SEARCH_DEADLINE if deadline is None else deadline)
+    started = time.monotonic()
+    stop = threading.Event()
+    cancelled = Future()
+    terms = set(query_terms(query))
+
+    def remaining():
+        return deadline - (time.monotonic() - started)
+
+    pending = {}
+    for order, source in enumerate(build_search_sources(query)):
+        future = _search_executor.submit(_scan_source, source, terms, playwright_url,
+                                         min(25, remaining()), stop)
+        pending[future] = ('source', order, source)
+
+    collected = []  # (source order, is link, result)
+    errors = []
+    linked_sources = set()
+    try:
+        with run_deadline.cancelling(lambda: cancelled.set_result(None), 'web_search', until=started + deadline):
+            while pending and len(collected) < max_results:
+                if remaining() <= 0:
+                    logger.warning(f"⏱️ Search deadline of {deadline:.0f}s reached with {len(pending)} fetches outstanding")
+                    errors.append(f"Search deadline of {deadline:.0f}s reached with {len(pending)} fetches outstanding")
+                    break
+                done, _ = wait(list(pending) + [cancelled], timeout=remaining(), return_when=FIRST_COMPLETED)
+                if cancelled.done():
+                    logger.warning(f"🛑 Search cancelled ({run_deadline.reason}) with {len(pending)} fetches outstanding")
+                    errors.append(f"Search cancelled ({run_deadline.reason}) with {len(pending)} fetches outstanding")
+                    break
+                for future in done:
+                    kind, order, source = pending.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        logger.warning(f"❌ Error with {source['name']}: {str(e)[:100]}")
+                        errors.append(f"{source['name']}: {str(e)[:100]}")
+                        continue
+
+                    if kind == 'source':
+                        result, links = outcome
+                        if result:
+                            collected.append((order, 1, result))
+                        for href in links:
+                            if remaining() <= 0:
+                                break
+                            link_future = _search_executor.submit(_follow_link, source, href, terms,
+                                                                  playwright_url, min(20, remaining()), stop)
+                            pending[link_future] = ('link', order, source)
+                    elif outcome and order not in linked_sources:
+                        # Only the first matching link per source is kept
+                        linked_sources.add(order)
+                        collected.append((order, 2, outcome))
+    finally:
+        stop.set()
+        for future in pending:
+            if future.cancel() and run_deadline.cancelled:
+                deadlines.record_cancelled('playwright_fetch', remaining())
+
+    collected.sort(key=lambda item: (item[0], item[1]))
+    sources = rank_results(query, [result for _, _, result in collected[:max_results]])
+    # Nothing found is a valid answer; nothing found because every fetch failed is not
+    return tool_results.result('search_web', ok=bool(sources) or not errors, errors=errors,
+                               elapsed=time.monotonic() - started, query=query,
+                               searched_at=datetime.now().isoformat(timespec='seconds'), sources=sources)
+
+
+def rank_results(query, results):
+    """Fill each source's passages with its best BM25-ranked lines and their scores.
+
+    Lines from all sources share one index, so IDF reflects the whole
+    search, and a line near-identical to a better-ranked one (from any
+    source) is dropped. Sources left without content are removed.
+    """
+    passages, owners = [], []
+    for position, result in enumerate(results):
+        for line, tokens in result.pop('candidates', []):
+            passages.append((line, tokens))
+            owners.append(position)
+
+    open_slots = PASSAGES_PER_SOURCE * len(results)
+    for doc, score in iter_ranked_passages(query, [tokens for _, tokens in passages]):
+        kept = results[owners[doc]]['passages']
+        if len(kept) < PASSAGES_PER_SOURCE:
+            kept.append({"text": passages[doc][0][:PASSAGE_CHARS], "score": round(float(score), 3)})
+            open_slots -= 1
+            if not open_slots:
+                break
+    return [result for result in results if result['passages']]
+
+
+@register_tool('search_web')
+class SearchWeb(BaseTool):
+    description = ('Search the web for current information (news, sports scores, stock prices, weather, '
+                   'recent events). Returns ranked excerpts with their source names and URLs.')
+    parameters = [
+        {'name': 'query', 'type': 'string', 'description': 'The search query, in plain words.', 'required': True},
+        {'name': 'max_results', 'type': 'integer', 'description': 'Maximum number of sources to check (default 3).'}
+    ]
+
+    def __init__(self, cfg=None):
+        super().__init__(cfg)
+        self.playwright_url = self.cfg.get('playwright_url', DEFAULT_PLAYWRIGHT_URL)
+
+    def call(self, params, **kwargs):
+        started = time.monotonic()
+        try:
+            params = self._verify_json_format_args(params)
+            payload = search_web(params['query'], int(params.get('max_results') or 3), self.playwright_url)
+        except Exception as e:
+            logger.error(f"❌ search_web failed: {e}")
+            payload = tool_results.failure('search_web', f"{type(e).__name__}: {e}", time.monotonic() - started)
+        return tool_results.dumps(payload)
@@ -0,0 +1,173 @@
+"""
+Multi-turn conversation sessions for the chat endpoints.
+
+A request that carries a conversation ID gets that conversation's earlier
+turns in front of its query. Histories live in a memory-bounded, LRU store
+(SESSION_MAX_COUNT conversations, SESSION_MAX_BYTES of text in total);
+conversations idle for SESSION_TTL seconds are dropped.
+
+Each history is kept under SESSION_HISTORY_TOKENS. Turns are only ever
+appended, so consecutive prompts of a conversation share a byte-identical
+prefix (system prompt plus earlier turns) that vLLM's automatic prefix
+caching can skip re-prefilling. When a history outgrows the budget it is
+compacted in one step, not slid turn by turn: the oldest turns are folded
+into a short note and the newest ones kept to half the budget, which
+leaves room for several more turns before the prefix changes again.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))  # conversations kept
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))  # history text kept, all conversations
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))  # seconds a conversation may sit idle
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "3000"))  # history budget per prompt
+SUMMARY_QUESTION_CHARS = 160   # characters of each earlier question kept in the compaction note
+SUMMARY_ANSWER_CHARS = 240     # characters of each earlier answer kept in the compaction note
+SUMMARY_ACK = "Noted, I will keep that context in mind."
+
+
+def _tokens(text):
+    return len(text) / metrics.CHARS_PER_TOKEN
+
+
+class Session:
+    """History of one conversation"""
+
+    def __init__(self, session_id, now):
+        self.session_id = session_id
+        self.summary = None     # compaction note for turns no longer kept verbatim
+        self.turns = []         # [(user text, assistant text)]
+        self.last_used = now
+        self.size = 0
+        self.compacted = False  # the history prefix changed since the last prompt was built
+
+    def messages(self):
+        messages = []
+        if self.summary:
+            messages.append({'role': 'user', 'content': self.summary})
+            messages.append({'role': 'assistant', 'content': SUMMARY_ACK})
+        for question, answer in self.turns:
+            messages.append({'role': 'user', 'content': question})
+            messages.append({'role': 'assistant', 'content': answer})
+        return messages
+
+    def _measure(self):
+        self.size = len((self.summary or '').encode('utf-8')) + sum(
+            len(question.encode('utf-8')) + len(answer.encode('utf-8')) for question, answer in self.turns)
+
+    def history_tokens(self):
+        return _tokens(self.summary or '') + sum(_tokens(q) + _tokens(a) for q, a in self.turns)
+
+    def compact(self, budget_tokens):
+        """Fold the oldest turns into the summary note until the history fits half the budget"""
+        kept, used = [], 0.0
+        for question, answer in reversed(self.turns):
+            cost = _tokens(question) + _tokens(answer)
+            if kept and used + cost > budget_tokens / 2:
+                break
+            kept.append((question, answer))
+            used += cost
+        kept.reverse()
+        dropped = self.turns[:len(self.turns) - len(kept)]
+        lines = self.summary.splitlines()[1:] if self.summary else []
+        for question, answer in dropped:
+            lines.append(f"- Q: {question[:SUMMARY_QUESTION_CHARS]} A: {answer[:SUMMARY_ANSWER_CHARS]}")
+        # The note itself stays within a quarter of the budget, oldest lines go first
+        while lines and _tokens('\n'.join(lines)) > budget_tokens / 4:
+            lines.pop(0)
+        self.summary = "Earlier in this conversation:\n" + '\n'.join(lines) if lines else None
+        self.turns = kept
+        self.compacted = True
+
+
+class SessionStore:
+    """Thread-safe, LRU/TTL-evicted conversation histories"""
+
+    def __init__(self, max_sessions=SESSION_MAX_COUNT, max_bytes=SESSION_MAX_BYTES, ttl=SESSION_TTL,
+                 history_tokens=SESSION_HISTORY_TOKENS):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self._sessions = OrderedDict()   # session id -> Session, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _live(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_used > self.ttl:
+            self._drop(session_id, 'ttl')
+            return None
+        return session
+
+    def _drop(self, session_id, reason):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+        metrics.SESSION_EVICTIONS.labels(reason=reason).inc()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used > self.ttl:
+                self._drop(session_id, 'ttl')
+            elif len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                self._drop(session_id, 'lru')
+            else:
+                break
+        metrics.SESSIONS_ACTIVE.set(len(self._sessions))
+        metrics.SESSION_HISTORY_BYTES.set(self._bytes)
+
+    def active(self, session_id):
+        """True if the conversation has history"""
+        with self._lock:
+            return self._live(session_id, time.time()) is not None
+
+    def history(self, session_id):
+        """Earlier turns of a conversation as chat messages ([] for a new one)"""
+        now = time.time()
+        with self._lock:
+            session = self._live(session_id, now)
+            if session is None:
+                return []
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            if session.turns or session.summary:
+                # Appending keeps the previous prompt a prefix of this one; compaction rewrites it
+                metrics.SESSION_PREFIX_REUSE.labels(result='miss' if session.compacted else 'hit').inc()
+                session.compacted = False
+            return session.messages()
+
+    def append(self, session_id, question, answer):
+        """Record a finished turn, compacting the history if it outgrew its budget"""
+        now = time.time()
+        with self._lock:
+            session = self._live(session_id, now)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id, now)
+            session.turns.append((question, answer))
+            if session.history_tokens() > self.history_tokens:
+                session.compact(self.history_tokens)
+                metrics.SESSION_COMPACTIONS.inc()
+            previous = session.size
+            session._measure()
+            self._bytes += session.size - previous
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def clear(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                session = self._sessions.pop(session_id)
+                self._bytes -= session.size
+                metrics.SESSIONS_ACTIVE.set(len(self._sessions))
+                metrics.SESSION_HISTORY_BYTES.set(self._bytes)
+
+    def snapshot(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "history_bytes": self._bytes}
@@ -0,0 +1,30 @@
+"""
+Unit tests for the benchmark's latency summaries.
+"""
+
+from benchmark_system import percentile, summarize_timings
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(100, 0, -1))  # 1..100, unsorted
+
+    assert percentile(samples, 0.50) == 50
+    assert percentile(samples, 0.95) == 95
+    assert percentile(samples, 0.99) == 99
+    assert percentile(samples, 1.0) == 100
+    assert percentile(samples, 0.07) == 7
+    assert percentile(samples, 0.0) == 1
+
+
+def test_percentile_of_small_samples():
+    assert percentile([], 0.95) is None
+    assert percentile([3.5], 0.99) == 3.5
+    assert percentile([1, 2, 3, 4], 0.5) == 2
+    assert percentile([1, 2, 3, 4], 0.95) == 4
+
+
+def test_summarize_timings():
+    summary = summarize_timings([float(n) for n in range(1, 21)])
+
+    assert (summary['p50'], summary['p95'], summary['max']) == (10.0, 19.0, 20.0)
+    assert summarize_timings([])['p99'] is None
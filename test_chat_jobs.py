@@ -0,0 +1,163 @@
+"""
+Unit tests for chat run scheduling: deficit round-robin order in FairQueue
+and admission control (queue bound, deadline shedding) in ChatRunner.
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from chat_jobs import ChatOverloaded, ChatRunner, FairQueue
+from deadlines import Deadline
+
+
+def job(name, cost, cost_class='default'):
+    return SimpleNamespace(name=name, cost=cost, cost_class=cost_class)
+
+
+def drain(fair_queue):
+    order = []
+    while True:
+        popped = fair_queue.pop()
+        if popped is None:
+            return order
+        order.append(popped.name)
+
+
+def test_fair_queue_alternates_clients_with_equal_costs():
+    fair_queue = FairQueue(quantum=5.0)
+    for name in ('a1', 'a2', 'a3'):
+        fair_queue.push('a', job(name, 5.0))
+    for name in ('b1', 'b2'):
+        fair_queue.push('b', job(name, 5.0))
+
+    assert len(fair_queue) == 5
+    assert drain(fair_queue) == ['a1', 'b1', 'a2', 'b2', 'a3']
+    assert len(fair_queue) == 0
+
+
+def test_fair_queue_shares_by_run_time_not_request_count():
+    fair_queue = FairQueue(quantum=5.0)
+    fair_queue.push('slow', job('s1', 10.0))
+    fair_queue.push('slow', job('s2', 10.0))
+    for name in ('q1', 'q2', 'q3', 'q4'):
+        fair_queue.push('quick', job(name, 2.5))
+
+    # Each turn is worth 5 seconds: two quick runs per turn, one slow run every other turn
+    assert drain(fair_queue) == ['q1', 'q2', 's1', 'q3', 'q4', 's2']
+
+
+def test_fair_queue_new_client_is_not_stuck_behind_a_backlog():
+    fair_queue = FairQueue(quantum=5.0)
+    for index in range(10):
+        fair_queue.push('busy', job(f'busy{index}', 5.0))
+    assert fair_queue.pop().name == 'busy0'
+    fair_queue.push('newcomer', job('first', 5.0))
+
+    assert fair_queue.pop().name == 'first'
+
+
+def test_fair_queue_backlog_and_depth():
+    fair_queue = FairQueue(quantum=5.0)
+    fair_queue.push('a', job('a1', 3.0, 'direct'))
+    fair_queue.push('a', job('a2', 20.0, 'agent'))
+    fair_queue.push('b', job('b1', 20.0, 'agent'))
+
+    assert fair_queue.backlog() == {'a': 23.0, 'b': 20.0}
+    assert fair_queue.depth() == {'direct': 1, 'agent': 2}
+    assert FairQueue(quantum=5.0).pop() is None
+
+
+@pytest.fixture
+def runner():
+    runner = ChatRunner(max_concurrency=1, max_queue=1, queue_timeout=60, run_seconds={'agent': 30.0})
+    release = threading.Event()
+    runner.release = release
+    yield runner
+    release.set()
+    runner.executor.shutdown(wait=True)
+
+
+def blocking_run(release):
+    def run_events():
+        release.wait(10)
+        yield ('done', {'response': 'ok'})
+    return run_events
+
+
+def test_submit_rejects_when_workers_and_queue_are_full(runner):
+    first = runner.submit(blocking_run(runner.release), client='a')
+    second = runner.submit(blocking_run(runner.release), client='b')
+
+    with pytest.raises(ChatOverloaded) as rejected:
+        runner.submit(blocking_run(runner.release), client='c')
+    assert rejected.value.reason == 'queue_full'
+    assert rejected.value.retry_after >= 1
+    assert runner.snapshot()['rejected_total'] == 1
+
+    runner.release.set()
+    assert first.finished.wait(5) and second.finished.wait(5)
+    assert [event for event, _ in first.events()] == ['started', 'done']
+    # Slots are returned once runs finish
+    third = runner.submit(blocking_run(runner.release), client='c')
+    assert third.finished.wait(5)
+
+
+def test_submit_sheds_a_run_that_cannot_start_before_its_deadline(runner):
+    runner.max_queue = 10
+    running = runner.submit(blocking_run(runner.release), client='a', cost_class='agent')
+
+    deadline = Deadline(5)
+    with pytest.raises(ChatOverloaded) as rejected:
+        runner.submit(blocking_run(runner.release), deadline=deadline, client='b', cost_class='agent')
+    deadline.close()
+    assert rejected.value.reason == 'deadline'
+
+    # Enough time left to wait out the running 30-second run: admitted
+    patient = Deadline(120)
+    queued = runner.submit(blocking_run(runner.release), deadline=patient, client='b', cost_class='agent')
+    runner.release.set()
+    assert running.finished.wait(5) and queued.finished.wait(5)
+    assert queued.ran
+    assert patient.closed and not patient.cancelled
+
+
+def test_submit_admits_immediately_with_a_free_worker(runner):
+    deadline = Deadline(0.5)
+    job = runner.submit(blocking_run(runner.release), deadline=deadline, client='a', cost_class='agent')
+    runner.release.set()
+
+    assert job.finished.wait(5)
+    assert job.ran
+
+
+def test_submit_joins_an_inflight_run_with_the_same_key(runner):
+    first = runner.submit(blocking_run(runner.release), key='what is python', client='a')
+    joined = runner.submit(blocking_run(runner.release), key='what is python', client='b')
+
+    assert joined is first
+    assert first.fan_in == 2
+    runner.release.set()
+    assert first.finished.wait(5)
+    assert runner.snapshot()['inflight_keys'] == 0
+
+
+def test_submit_does_not_join_a_run_whose_clients_left(runner):
+    running = runner.submit(blocking_run(runner.release), client='a')
+    runner.max_queue = 2
+    abandoned_deadline = Deadline(60)
+    abandoned = runner.submit(blocking_run(runner.release), key='what is python', deadline=abandoned_deadline,
+                              client='b')
+    abandoned.unfollow(abandoned.follow(lambda event, payload: None))
+    assert abandoned_deadline.reason == 'client_disconnect'
+
+    fresh = runner.submit(blocking_run(runner.release), key='what is python', deadline=Deadline(60), client='c')
+
+    assert fresh is not abandoned
+    assert abandoned.fan_in == 1
+    runner.release.set()
+    assert running.finished.wait(5) and abandoned.finished.wait(5) and fresh.finished.wait(5)
+    assert not abandoned.ran
+    assert [event for event, _ in fresh.events()] == ['started', 'done']
+    assert runner.snapshot()['inflight_keys'] == 0
@@ -0,0 +1,170 @@
+"""
+Unit tests for per-request deadlines: cancel callbacks, the shared expiry
+timer, and what is (and is not) counted as a cancellation.
+"""
+
+import threading
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+import deadlines
+from chat_jobs import ChatJob
+from deadlines import Deadline, DeadlineExceeded
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_cancel_runs_registered_callbacks_once():
+    deadline = Deadline()
+    calls = []
+    before = sample('chat_cancellations_total', reason='client_disconnect')
+    work_before = sample('chat_cancelled_work_total', kind='llm_call')
+
+    with deadline.cancelling(lambda: calls.append('stream'), 'llm_call'):
+        deadline.cancel('client_disconnect')
+        deadline.cancel('deadline')
+
+    assert calls == ['stream']
+    assert deadline.reason == 'client_disconnect'
+    assert sample('chat_cancellations_total', reason='client_disconnect') == before + 1
+    assert sample('chat_cancelled_work_total', kind='llm_call') == work_before + 1
+    with pytest.raises(DeadlineExceeded) as exceeded:
+        deadline.check()
+    assert exceeded.value.reason == 'client_disconnect'
+
+
+def test_cancelling_after_cancel_calls_back_at_once():
+    deadline = Deadline()
+    deadline.cancel()
+    calls = []
+
+    with deadline.cancelling(lambda: calls.append('interrupt'), 'kernel_interrupt'):
+        assert calls == ['interrupt']
+
+
+def test_finished_work_is_not_cancelled():
+    deadline = Deadline()
+    calls = []
+    with deadline.cancelling(lambda: calls.append('fetch'), 'playwright_fetch'):
+        pass
+    deadline.cancel()
+
+    assert calls == []
+
+
+def test_cancel_reports_reclaimed_time():
+    deadline = Deadline()
+    before = sample('chat_cancel_reclaimed_seconds_total', kind='web_search')
+
+    with deadline.cancelling(lambda: None, 'web_search', until=time.monotonic() + 10):
+        deadline.cancel()
+
+    reclaimed = sample('chat_cancel_reclaimed_seconds_total', kind='web_search') - before
+    assert 9 < reclaimed <= 10
+
+
+def test_failing_callback_does_not_stop_cancellation():
+    deadline = Deadline()
+    calls = []
+
+    def broken():
+        raise RuntimeError('already closed')
+
+    with deadline.cancelling(broken, 'llm_call'), deadline.cancelling(lambda: calls.append('kernel'), 'kernel_interrupt'):
+        deadline.cancel()
+
+    assert calls == ['kernel']
+
+
+def test_timer_cancels_an_expired_deadline():
+    fired = threading.Event()
+    deadline = Deadline(0.05)
+
+    with deadline.cancelling(fired.set, 'llm_call'):
+        assert fired.wait(2)
+
+    assert deadline.reason == 'deadline'
+    assert deadline.remaining() == 0.0
+
+
+def test_closed_deadline_never_counts_as_cancelled():
+    before = sample('chat_cancellations_total', reason='deadline')
+    pending = len(deadlines._timers)
+    deadline = Deadline(0.05)
+    assert len(deadlines._timers) == pending + 1
+
+    deadline.close()
+    deadline.close()
+    assert len(deadlines._timers) == pending
+    time.sleep(0.2)
+
+    assert not deadline.cancelled
+    assert sample('chat_cancellations_total', reason='deadline') == before
+
+
+def test_closed_deadlines_do_not_accumulate_in_the_timer_heap():
+    for _ in range(100):
+        Deadline(3600).close()
+
+    # At most as many closed entries are kept as there are pending deadlines
+    assert len(deadlines._timers._heap) <= 2 * len(deadlines._timers) + 1
+    # Later deadlines still fire
+    late = Deadline(0.05)
+    fired = threading.Event()
+    with late.cancelling(fired.set, 'llm_call'):
+        assert fired.wait(2)
+
+
+def test_timeout_is_capped_by_the_time_left():
+    assert Deadline().timeout(5) == 5
+    assert Deadline().remaining() is None
+    deadline = Deadline(1)
+    assert deadline.timeout(5) <= 1
+    assert deadline.timeout() <= 1
+    deadline.close()
+
+
+def test_bind_sets_the_current_deadline():
+    deadline = Deadline()
+    with deadlines.bind(deadline):
+        assert deadlines.current() is deadline
+    assert deadlines.current() is not deadline
+    assert deadlines.current().remaining() is None
+
+
+def test_job_cancels_its_run_when_every_subscriber_leaves():
+    deadline = Deadline(60)
+    job = ChatJob(lambda: iter(()), queue_timeout=60, deadline=deadline)
+    handle = job.follow(lambda event, payload: None)
+
+    job.unfollow(handle)
+
+    assert deadline.reason == 'client_disconnect'
+    deadline.close()
+
+
+def test_job_closes_its_deadline_when_the_run_ends():
+    deadline = Deadline(60)
+    job = ChatJob(lambda: iter([('done', {})]), queue_timeout=60, deadline=deadline)
+
+    job.run()
+
+    assert deadline.closed and not deadline.cancelled
+    assert [event for event, _ in job.events()] == ['started', 'done']
+
+
+def test_job_skips_a_run_abandoned_while_queued():
+    deadline = Deadline(60)
+    deadline.cancel('client_disconnect')
+    before = sample('chat_cancelled_work_total', kind='queued_run')
+    job = ChatJob(lambda: iter([('done', {})]), queue_timeout=60, deadline=deadline)
+
+    job.run()
+
+    assert not job.ran
+    assert sample('chat_cancelled_work_total', kind='queued_run') == before + 1
+    assert deadline.closed
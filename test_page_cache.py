@@ -0,0 +1,160 @@
+"""
+Unit tests for the scraped page cache: byte-bounded LRU, fresh/stale/miss
+by age, single background refresh and the shared SQLite store.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import page_cache
+from page_cache import PageCache, page_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(page_cache, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def evictions(store):
+    return REGISTRY.get_sample_value('page_cache_evictions_total', {'store': store}) or 0.0
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn):
+        self.submitted.append(fn)
+
+
+def test_page_key_depends_on_action_and_url():
+    assert page_key('https://example.com') == page_key('https://example.com', 'content')
+    assert page_key('https://example.com') != page_key('https://example.com', 'links')
+    assert page_key('https://example.com') != page_key('https://example.org')
+
+
+def test_least_recently_used_pages_are_evicted_by_bytes(clock):
+    page = 'x' * 100
+    cache = PageCache(max_bytes=2 * size(page) + 10, path='')
+    before = evictions('memory')
+    cache.put('a', page)
+    cache.put('b', page)
+    cache.get('a')
+
+    cache.put('c', page)
+
+    assert cache.get('b') == (None, 'miss')
+    assert cache.get('a') == (page, 'fresh')
+    assert cache.get('c') == (page, 'fresh')
+    assert cache._bytes == 2 * size(page)
+    assert evictions('memory') == before + 1
+
+
+def test_one_large_page_evicts_as_many_as_needed(clock):
+    cache = PageCache(max_bytes=300, path='')
+    for key in 'abc':
+        cache.put(key, 'x' * 80)
+
+    cache.put('big', 'y' * 250)
+
+    assert [cache.get(key)[1] for key in 'abc'] == ['miss', 'miss', 'miss']
+    assert cache.get('big')[1] == 'fresh'
+    assert cache._bytes == size('y' * 250)
+
+
+def test_page_larger_than_the_cache_is_not_stored(clock):
+    cache = PageCache(max_bytes=100, path='')
+    cache.put('small', 'x' * 10)
+
+    cache.put('huge', 'x' * 500)
+
+    assert cache.get('huge') == (None, 'miss')
+    assert cache.get('small')[1] == 'fresh'
+
+
+def test_replacing_a_page_keeps_the_byte_count(clock):
+    cache = PageCache(max_bytes=1000, path='')
+    cache.put('a', 'x' * 100)
+
+    cache.put('a', 'x' * 10)
+
+    assert cache._bytes == size('x' * 10)
+    assert cache.get('a') == ('x' * 10, 'fresh')
+
+
+def test_pages_go_stale_then_expire(clock):
+    cache = PageCache(max_bytes=1000, ttl=120, stale_ttl=600, path='')
+    cache.put('a', {'text': 'front page'})
+
+    clock.now += 119
+    assert cache.get('a') == ({'text': 'front page'}, 'fresh')
+    clock.now += 2
+    assert cache.get('a') == ({'text': 'front page'}, 'stale')
+    clock.now += 600
+    assert cache.get('a') == (None, 'miss')
+
+
+def test_refresh_runs_once_per_key_at_a_time(clock):
+    cache = PageCache(max_bytes=1000, path='')
+    cache.put('a', 'old')
+    executor = RecordingExecutor()
+
+    cache.refresh('a', lambda: 'new', executor)
+    cache.refresh('a', lambda: 'newer', executor)
+    assert len(executor.submitted) == 1
+
+    executor.submitted[0]()
+    assert cache.get('a') == ('new', 'fresh')
+    cache.refresh('a', lambda: 'newer', executor)
+    assert len(executor.submitted) == 2
+
+
+def test_failed_refresh_keeps_the_stale_page(clock):
+    cache = PageCache(max_bytes=1000, ttl=1, stale_ttl=600, path='')
+    cache.put('a', 'old')
+    clock.now += 5
+    executor = RecordingExecutor()
+
+    def broken():
+        raise TimeoutError('playwright timed out')
+
+    cache.refresh('a', broken, executor)
+    executor.submitted[0]()
+
+    assert cache.get('a') == ('old', 'stale')
+    cache.refresh('a', lambda: 'new', executor)
+    assert len(executor.submitted) == 2
+
+
+def test_sqlite_store_is_shared_between_caches(clock, tmp_path):
+    path = str(tmp_path / 'pages.db')
+    writer = PageCache(max_bytes=1000, path=path)
+    reader = PageCache(max_bytes=1000, path=path)
+
+    writer.put('a', {'text': 'front page'})
+
+    assert reader.get('a') == ({'text': 'front page'}, 'fresh')
+    writer.store.close()
+    reader.store.close()
+
+
+def test_sqlite_store_evicts_oldest_pages_by_bytes(tmp_path):
+    store = page_cache.SqlitePageStore(str(tmp_path / 'pages.db'), max_bytes=250)
+    before = evictions('disk')
+    for index, key in enumerate('abc'):
+        store.put(key, b'x' * 100, stored=1000.0 + index)
+
+    assert store.get('a') is None
+    assert store.get('b') is not None
+    assert store.get('c') == (b'x' * 100, 1002.0)
+    assert evictions('disk') == before + 1
+    store.close()
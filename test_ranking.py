@@ -0,0 +1,72 @@
+"""
+Unit tests for BM25 passage ranking: tokenization, scoring, phrase and
+proximity boosts, and near-duplicate collapsing.
+"""
+
+from ranking import BM25Index, query_terms, rank_passages, stem, tokenize
+
+
+def test_stem_and_query_terms():
+    assert stem('prices') == 'price'
+    assert stem('scores') == 'score'
+    assert stem('batteries') == 'battery'
+    assert stem('is') == 'is'
+    assert query_terms("What is the latest price of gold?") == ['price', 'gold']
+    # Only stopwords: keep them rather than match nothing
+    assert query_terms("what is it") == ['what', 'is', 'it']
+
+
+def test_rarer_terms_weigh_more():
+    index = BM25Index([tokenize("gold price"), tokenize("gold market"), tokenize("gold rally")])
+
+    assert index.idf('price') > index.idf('gold')
+    assert index.idf('absent') > index.idf('price')
+
+
+def test_non_matching_passages_are_left_out():
+    passages = [tokenize(text) for text in ("Weather is sunny", "Gold prices rose today", "Sports scores")]
+
+    assert [index for index, _ in rank_passages("gold price", passages)] == [1]
+    assert rank_passages("gold", []) == []
+
+
+def test_passages_with_more_query_terms_rank_first():
+    passages = [tokenize(text) for text in (
+        "Gold is a metal",
+        "Gold price hits record as market rallies",
+        "The price of oil fell",
+    )]
+
+    ranked = rank_passages("gold price", passages)
+
+    assert ranked[0][0] == 1
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+
+
+def test_phrase_match_outranks_scattered_terms():
+    passages = [tokenize(text) for text in (
+        "price rises for silver while gold dealers wait",
+        "gold price rises for silver while dealers wait",
+    )]
+
+    unboosted = rank_passages("gold price", passages, boosts=False)
+    assert unboosted[0][1] == unboosted[1][1]
+    assert rank_passages("gold price", passages)[0][0] == 1
+
+
+def test_near_duplicates_are_collapsed():
+    passages = [tokenize(text) for text in (
+        "Gold price hits a record high on Monday amid market turmoil",
+        "Gold price hits a record high on Monday amid market turmoil.",
+        "Analysts expect the gold price to keep rising this year",
+    )]
+
+    kept = [index for index, _ in rank_passages("gold price record", passages)]
+    assert len(kept) == 2 and 2 in kept
+    assert len(rank_passages("gold price record", passages, dedupe=False)) == 3
+
+
+def test_limit_stops_early():
+    passages = [tokenize(f"gold price report number {n} with distinct words w{n}") for n in range(10)]
+
+    assert len(rank_passages("gold price", passages, limit=3)) == 3
@@ -0,0 +1,197 @@
+"""
+Unit tests for the chat response cache: exact, normalized and semantic
+lookups, per-class TTLs and LRU eviction.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import response_cache
+from response_cache import ResponseCache, bypass_requested, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def evictions():
+    return REGISTRY.get_sample_value('response_cache_evictions_total') or 0.0
+
+
+def test_normalize_query_drops_case_punctuation_and_filler():
+    assert normalize_query("Hey, can you tell me: What is Python?") == 'what is python'
+    assert normalize_query("the a an") == 'the a an'
+    assert normalize_query("  Price of gold, today!!") == 'price of gold today'
+
+
+@pytest.mark.parametrize('first, second', [
+    ("What is 2+2?", "What is 2*2?"),
+    ("What is 2+2?", "what is 2-2"),
+    ("What is 2*2?", "what is 2/2"),
+    ("What is C++?", "What is C#?"),
+    ("Is 5% a lot?", "Is 5$ a lot?"),
+    ("x = 1", "x == 1"),
+])
+def test_symbols_keep_questions_apart(clock, first, second):
+    assert normalize_query(first) != normalize_query(second)
+    cache = ResponseCache()
+    cache.put(first, {'response': first})
+
+    assert cache.get(second) is None
+    assert cache.get(first.lower().rstrip('?'))[0] == {'response': first}
+
+
+def test_exact_and_normalized_hits(clock):
+    cache = ResponseCache()
+    cache.put("What is Python?", {'response': 'A language'})
+
+    payload, kind, age = cache.get("What is Python?")
+    assert (payload, kind, age) == ({'response': 'A language'}, 'exact', 0.0)
+    assert cache.get("please what is python")[1] == 'normalized'
+    assert cache.get("What is Rust?") is None
+
+
+def test_hits_are_copies(clock):
+    cache = ResponseCache()
+    cache.put("what is python", {'metadata': {'sources': []}})
+
+    cache.get("what is python")[0]['metadata']['sources'].append('mutated')
+
+    assert cache.get("what is python")[0] == {'metadata': {'sources': []}}
+
+
+def test_conversation_fields_are_not_shared(clock):
+    cache = ResponseCache()
+    result = {'response': 'A language', 'metadata': {'route': 'direct', 'conversation_id': 'alice-secret',
+                                                     'history_messages': 0}}
+
+    cache.put("What is Python?", result)
+
+    assert cache.get("what is python")[0] == {'response': 'A language', 'metadata': {'route': 'direct'}}
+    assert result['metadata']['conversation_id'] == 'alice-secret'
+
+
+def test_entries_expire_after_their_class_ttl(clock):
+    cache = ResponseCache()
+    cache.put("stock price of ACME", {'response': 'finance'})
+    cache.put("what is python", {'response': 'evergreen'})
+
+    clock.now += response_cache.CLASS_TTLS['finance'] - 1
+    assert cache.get("stock price of ACME")[2] == response_cache.CLASS_TTLS['finance'] - 1
+
+    clock.now += 2
+    assert cache.get("stock price of ACME") is None
+    assert len(cache) == 1
+    assert cache.get("what is python") is not None
+
+    clock.now += response_cache.CLASS_TTLS[None]
+    assert cache.get("what is python") is None
+    assert len(cache) == 0
+
+
+def test_class_with_zero_ttl_is_not_cached(clock, monkeypatch):
+    monkeypatch.setitem(response_cache.CLASS_TTLS, 'weather', 0.0)
+    cache = ResponseCache()
+
+    cache.put("weather in Paris", {'response': 'rain'})
+
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2)
+    before = evictions()
+    cache.put("what is python", {'response': 'python'})
+    cache.put("what is rust", {'response': 'rust'})
+    cache.get("what is python")
+
+    cache.put("what is go", {'response': 'go'})
+
+    assert len(cache) == 2
+    assert cache.get("what is rust") is None
+    assert cache.get("what is python") is not None
+    assert cache.get("what is go") is not None
+    assert evictions() == before + 1
+
+
+def test_storing_a_query_again_replaces_it(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.put("What is Python?", {'response': 'old'})
+    clock.now += 10
+
+    cache.put("what is python", {'response': 'new'})
+
+    assert len(cache) == 1
+    assert cache.get("what is python") == ({'response': 'new'}, 'exact', 0.0)
+
+
+VECTORS = {
+    "latest news on mars rover": [1.0, 0.0, 0.0],
+    "mars rover news today": [0.99, 0.1, 0.0],
+    "mars rover history": [0.99, 0.1, 0.0],
+    "best pasta recipe": [0.0, 1.0, 0.0],
+}
+
+
+def test_semantic_hit_within_the_same_class(clock):
+    cache = ResponseCache(embed=lambda query: VECTORS[query], similarity=0.95)
+    cache.put("latest news on mars rover", {'response': 'rover news'})
+
+    assert cache.needs_embedding("mars rover news today")
+    payload, kind, _ = cache.get("mars rover news today")
+    assert (payload, kind) == ({'response': 'rover news'}, 'semantic')
+    # Just as similar, but not a news query: a news answer must not be reused for it
+    assert cache.get("mars rover history") is None
+    assert cache.get("best pasta recipe") is None
+
+
+def test_semantic_match_skips_expired_entries(clock):
+    cache = ResponseCache(embed=lambda query: VECTORS[query])
+    cache.put("latest news on mars rover", {'response': 'rover news'})
+
+    clock.now += response_cache.CLASS_TTLS['news'] + 1
+
+    assert cache.get("mars rover news today") is None
+    assert len(cache) == 0
+
+
+def test_exact_entry_needs_no_embedding(clock):
+    calls = []
+
+    def embed(query):
+        calls.append(query)
+        return VECTORS[query]
+
+    cache = ResponseCache(embed=embed)
+    cache.put("latest news on mars rover", {'response': 'rover news'})
+    calls.clear()
+
+    assert not cache.needs_embedding("Latest news on Mars rover!")
+    assert cache.get("Latest news on Mars rover!")[1] == 'normalized'
+    assert calls == []
+    assert not ResponseCache().needs_embedding("anything")
+
+
+def test_failing_embedding_falls_back_to_a_miss(clock):
+    def embed(query):
+        raise ConnectionError('embedding endpoint down')
+
+    cache = ResponseCache(embed=embed)
+    cache.put("latest news on mars rover", {'response': 'rover news'})
+
+    assert cache.get("latest news on mars rover") is not None
+    assert cache.get("mars rover news today") is None
+
+
+def test_bypass_requested():
+    assert bypass_requested({'x-cache-bypass': '1'})
+    assert not bypass_requested({'x-cache-bypass': 'false'})
+    assert bypass_requested({'cache-control': 'no-cache'})
+    assert bypass_requested({'cache-control': 'No-Store'})
+    assert not bypass_requested({'cache-control': 'max-age=60'})
+    assert not bypass_requested({})
@@ -0,0 +1,76 @@
+"""
+Unit tests for ResponseReducer: how tool results in bot.run() snapshots turn
+into errors, sources and the final answer.
+"""
+
+import os
+
+# Importing app builds the agent in the background; point it at nothing reachable
+os.environ.setdefault('VLLM_BASE_URL', 'http://127.0.0.1:9/v1/')
+os.environ.setdefault('VLLM_MODELS_URL', 'http://127.0.0.1:9/v1/models')
+os.environ.setdefault('PLAYWRIGHT_SERVICE_URL', 'http://127.0.0.1:9')
+os.environ.setdefault('KERNEL_POOL_SIZE', '0')
+
+from qwen_agent.tools.base import BaseTool  # noqa: E402
+
+import tool_results  # noqa: E402
+from app import ResponseReducer  # noqa: E402
+from tool_compaction import CompactingAssistant  # noqa: E402
+
+LLM = {'model': 'test-model', 'model_server': 'http://127.0.0.1:9/v1', 'api_key': 'none'}
+
+
+class PoolExhaustedInterpreter(BaseTool):
+    name = 'code_interpreter'
+    description = 'Fails like a code_interpreter whose kernel pool is exhausted'
+    parameters = []
+
+    def call(self, params, **kwargs):
+        raise RuntimeError('No code_interpreter kernel became available within 30s')
+
+
+def tool_call(name):
+    return {'role': 'assistant', 'content': '', 'function_call': {'name': name, 'arguments': '{}'}}
+
+
+def tool_output(name, text):
+    return {'role': 'function', 'name': name, 'content': text}
+
+
+def test_raising_tool_is_reported_as_an_error():
+    assistant = CompactingAssistant(function_list=[PoolExhaustedInterpreter()], llm=LLM)
+    output = assistant._call_tool('code_interpreter', '{"code": "1/0"}')
+    reducer = ResponseReducer()
+
+    events = reducer.update([{'role': 'user', 'content': 'compute 1/0'}, tool_call('code_interpreter'),
+                             tool_output('code_interpreter', output)])
+
+    assert reducer.errors_encountered == ['RuntimeError: No code_interpreter kernel became available within 30s']
+    assert [payload['error'] for event, payload in events if event == 'tool_output'] == [True]
+    assert not reducer.has_answer()
+    assert reducer.final_response().startswith("I encountered some technical issues")
+
+
+def test_search_results_become_sources_and_a_fallback_answer():
+    search = tool_results.dumps(tool_results.result('search_web', query='gold price', sources=[
+        {'name': 'Reuters', 'url': 'https://reuters.example', 'fetch_seconds': 0.4,
+         'passages': [{'text': 'Gold price hits a record high of $2,500 an ounce', 'score': 3.2}]},
+    ]))
+    reducer = ResponseReducer()
+
+    reducer.update([{'role': 'user', 'content': 'gold price'}, tool_call('search_web'), tool_output('search_web', search)])
+
+    assert reducer.web_search_performed and reducer.errors_encountered == []
+    assert reducer.source_timings() == [{'name': 'Reuters', 'url': 'https://reuters.example', 'fetch_seconds': 0.4}]
+    assert reducer.has_answer()
+    assert 'Gold price hits a record high' in reducer.final_response()
+
+
+def test_untyped_output_is_an_opaque_success():
+    reducer = ResponseReducer()
+
+    events = reducer.update([{'role': 'user', 'content': 'hi'}, tool_call('other_tool'),
+                             tool_output('other_tool', 'plain text result')])
+
+    assert reducer.errors_encountered == []
+    assert [payload['summary'] for event, payload in events if event == 'tool_output'] == ['plain text result']
@@ -0,0 +1,154 @@
+"""
+Unit tests for tool output compaction: search result deduplication and
+budgets, head/tail capping of other tool output, and typed failures for
+tools that raise.
+"""
+
+import json
+
+from qwen_agent.tools.base import BaseTool
+
+import tool_results
+from tool_compaction import CompactingAssistant, TokenCounter, cap_tokens, compact_search_result, compact_tool_output
+
+
+def words(text):
+    """Token count stand-in: one token per whitespace-separated word"""
+    return len(text.split())
+
+
+def passage(text, score):
+    return {'text': text, 'score': score}
+
+
+def search_payload(*sources):
+    return tool_results.result('search_web', query='gold price', sources=[
+        {'name': name, 'url': f'https://{name}.example', 'fetch_seconds': 0.1, 'passages': list(passages)}
+        for name, passages in sources
+    ])
+
+
+def texts(payload):
+    return {source['name']: [p['text'] for p in source['passages']] for source in payload['sources']}
+
+
+def test_passages_repeated_across_sources_are_kept_once():
+    repeated = 'gold price hits a record high today'
+    payload = search_payload(
+        ('reuters', [passage(repeated, 3.0), passage('analysts expect further gains this year', 2.0)]),
+        ('bbc', [passage(repeated.upper(), 3.0), passage('central banks keep buying gold bars', 1.5)]),
+    )
+
+    compact_search_result(payload, source_budget=100, budget=1000, count=words)
+
+    assert texts(payload) == {
+        'reuters': [repeated, 'analysts expect further gains this year'],
+        'bbc': ['central banks keep buying gold bars'],
+    }
+
+
+def test_short_labels_are_never_deduplicated():
+    payload = search_payload(('a', [passage('Price:', 1.0)]), ('b', [passage('Price:', 1.0)]))
+
+    compact_search_result(payload, source_budget=100, budget=1000, count=words)
+
+    assert texts(payload) == {'a': ['Price:'], 'b': ['Price:']}
+
+
+def test_each_source_keeps_its_best_passages_within_its_budget():
+    payload = search_payload(('reuters', [
+        passage('one two three four five', 5.0),
+        passage('six seven eight nine ten eleven', 4.0),
+        passage('twelve thirteen', 3.0),
+    ]))
+
+    compact_search_result(payload, source_budget=8, budget=1000, count=words)
+
+    # The second passage would overflow the budget; the shorter third still fits
+    assert texts(payload) == {'reuters': ['one two three four five', 'twelve thirteen']}
+
+
+def test_lowest_scored_passages_are_dropped_to_fit_the_budget():
+    payload = search_payload(
+        ('reuters', [passage('alpha ' * 20, 9.0), passage('beta ' * 20, 1.0)]),
+        ('bbc', [passage('gamma ' * 20, 5.0), passage('delta ' * 20, 2.0)]),
+    )
+
+    full = words(tool_results.dumps(payload))
+    compact_search_result(payload, source_budget=1000, budget=full - 15, count=words)
+
+    assert words(tool_results.dumps(payload)) <= full - 15
+    assert texts(payload) == {'reuters': ['alpha ' * 20], 'bbc': ['gamma ' * 20, 'delta ' * 20]}
+
+
+def test_cap_tokens_keeps_head_and_tail():
+    text = '\n'.join(f'line {n}' for n in range(100))
+
+    capped = cap_tokens(text, 30, count=words)
+
+    lines = capped.splitlines()
+    assert lines[0] == 'line 0'
+    assert lines[-1] == 'line 99'
+    assert any('lines omitted' in line for line in lines)
+    assert words(capped) <= 33
+    assert cap_tokens('short output', 30, count=words) == 'short output'
+
+
+def test_cap_tokens_cuts_a_single_huge_line_by_characters():
+    capped = cap_tokens('x' * 10000, 10)
+
+    assert capped.startswith('x' * 40)
+    assert capped.endswith('characters omitted ...]')
+    assert len(capped) < 100
+
+
+def test_typed_results_stay_valid_json():
+    output = '\n'.join(f'row {n}: ' + 'value ' * 20 for n in range(2000))
+    text = tool_results.dumps(tool_results.result('code_interpreter', output=output))
+
+    compacted = compact_tool_output('code_interpreter', text)
+
+    payload = json.loads(compacted)
+    assert payload['ok'] and 'lines omitted' in payload['output']
+    assert len(compacted) < len(text)
+    assert compact_tool_output('other_tool', 'plain output') == 'plain output'
+
+
+class BrokenTool(BaseTool):
+    name = 'broken_tool'
+    description = 'Always fails'
+    parameters = []
+
+    def call(self, params, **kwargs):
+        raise RuntimeError('No code_interpreter kernel became available within 30s')
+
+
+class DictTool(BaseTool):
+    name = 'dict_tool'
+    description = 'Returns a plain dict'
+    parameters = []
+
+    def call(self, params, **kwargs):
+        return {'answer': 42}
+
+
+def test_tool_exceptions_become_typed_failures():
+    assistant = CompactingAssistant(function_list=[BrokenTool(), DictTool()],
+                                    llm={'model': 'test-model', 'model_server': 'http://127.0.0.1:9/v1', 'api_key': 'none'})
+
+    payload = tool_results.parse(assistant._call_tool('broken_tool', '{}'))
+
+    assert payload['tool'] == 'broken_tool' and not payload['ok']
+    assert payload['errors'] == ['RuntimeError: No code_interpreter kernel became available within 30s']
+    assert 'elapsed_seconds' in payload['timings']
+    assert not tool_results.parse(assistant._call_tool('missing_tool', '{}'))['ok']
+    assert json.loads(assistant._call_tool('dict_tool', '{}')) == {'answer': 42}
+
+
+def test_token_counts_are_estimates_without_a_local_tokenizer(tmp_path):
+    unset = TokenCounter()
+    missing = TokenCounter(str(tmp_path))  # no tokenizer.json in it, and nothing is downloaded
+
+    assert unset('x' * 40) == missing('x' * 40) == 10
+    assert unset.estimated and missing.estimated
+
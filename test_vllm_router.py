@@ -0,0 +1,101 @@
+"""
+Unit tests for vLLM endpoint selection: least outstanding and latency
+EWMA strategies, conversation affinity, and ejection.
+"""
+
+import pytest
+
+from vllm_router import EndpointRouter
+
+URLS = ['http://vllm-a:8000/v1', 'http://vllm-b:8000/v1', 'http://vllm-c:8000/v1']
+
+
+def load(router, endpoint, calls):
+    for _ in range(calls):
+        router.begin(endpoint)
+
+
+def test_rejects_unknown_strategy_and_empty_pool():
+    with pytest.raises(ValueError):
+        EndpointRouter(URLS, strategy='random')
+    with pytest.raises(ValueError):
+        EndpointRouter([])
+
+
+def test_least_outstanding_picks_the_least_busy_endpoint():
+    router = EndpointRouter(URLS)
+    a, b, c = router.endpoints
+    load(router, a, 3)
+    load(router, b, 1)
+    load(router, c, 2)
+
+    assert router.pick() is b
+    router.finish(a)
+    router.finish(a)
+    router.finish(a)
+    assert router.pick() is a
+
+
+def test_latency_ewma_weighs_load_by_latency():
+    router = EndpointRouter(URLS[:2], strategy='latency_ewma')
+    fast, slow = router.endpoints
+    router.first_response(fast, 0.1)
+    router.first_response(slow, 1.0)
+    load(router, fast, 3)
+
+    # 4 x 0.1s queued on the fast replica beats 1 x 1.0s on the idle slow one
+    assert router.pick() is fast
+    load(router, fast, 7)
+    assert router.pick() is slow
+
+
+def test_ewma_moves_towards_new_samples():
+    router = EndpointRouter(URLS[:1])
+    endpoint = router.endpoints[0]
+
+    router.first_response(endpoint, 1.0)
+    router.first_response(endpoint, 2.0)
+
+    assert endpoint.ewma == pytest.approx(1.3)
+
+
+def test_affinity_is_sticky_until_the_replica_is_much_busier():
+    router = EndpointRouter(URLS, sticky_slack=2)
+    sticky = router.pick(affinity='conversation-1')
+    assert all(router.pick(affinity='conversation-1') is sticky for _ in range(5))
+
+    load(router, sticky, 2)
+    assert router.pick(affinity='conversation-1') is sticky
+    load(router, sticky, 1)
+    assert router.pick(affinity='conversation-1') is not sticky
+
+
+def test_affinity_spreads_conversations():
+    router = EndpointRouter(URLS)
+
+    picked = {router.pick(affinity=f'conversation-{n}').url for n in range(50)}
+
+    assert picked == {endpoint.url for endpoint in router.endpoints}
+
+
+def test_ejected_endpoints_are_skipped_until_readmitted():
+    router = EndpointRouter(URLS[:2])
+    a, b = router.endpoints
+    router.begin(a)
+    router.finish(a, error=ConnectionError('refused'), eject=True)
+    load(router, b, 5)
+
+    assert router.pick() is b
+    assert a.failures == 1 and 'refused' in a.last_error
+    router.admit(a)
+    assert router.pick() is a
+
+
+def test_every_endpoint_ejected_tries_them_all():
+    router = EndpointRouter(URLS[:2])
+    for endpoint in router.endpoints:
+        router.eject(endpoint, 'down')
+
+    assert router.pick() is not None
+    assert router.pick(exclude=router.endpoints) is None
+    assert router.pick(exclude=[router.endpoints[0]]) is router.endpoints[1]
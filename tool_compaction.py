@@ -0,0 +1,212 @@
+"""
+Token-budgeted compaction of tool outputs before the next LLM turn.
+
+Tool results go back into the model's context and are prefilled on every
+following turn of the run. CompactingAssistant passes each result through
+compact_tool_output first:
+
+  * In search_web results, passages repeated across sources are kept
+    once, and each source is cut to TOOL_OUTPUT_SOURCE_TOKENS. Passages
+    arrive ranked best first, so the cut keeps the highest-ranked ones. If
+    the result is still over TOOL_OUTPUT_MAX_TOKENS, the lowest-scored
+    passages are dropped until it fits.
+  * Any other tool's result (the output field of a typed one) is capped at
+    TOOL_OUTPUT_MAX_TOKENS, keeping its head and tail around an omission
+    marker. Typed results stay valid JSON.
+
+Tokens are counted with the tokenizer.json that TOOL_OUTPUT_TOKENIZER points
+to (a local file, so startup never downloads one). Without it, or if it
+cannot be loaded, counts are estimated from the character count. Raw and
+compacted token counts of the current run are available from run_usage()
+on the run's thread, marked as estimated when they are.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from qwen_agent.agents import Assistant
+from qwen_agent.llm.schema import ContentItem
+from qwen_agent.tools.base import ToolServiceError
+from qwen_agent.tools.simple_doc_parser import DocParserError
+
+import metrics
+import tool_results
+
+logger = logging.getLogger(__name__)
+
+TOOL_OUTPUT_COMPACTION = os.getenv("TOOL_OUTPUT_COMPACTION", "True").lower() in ['true', '1', 'yes', 'on']
+TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "1500"))  # per tool result
+TOOL_OUTPUT_SOURCE_TOKENS = int(os.getenv("TOOL_OUTPUT_SOURCE_TOKENS", "200"))  # per search source
+TOOL_OUTPUT_TOKENIZER = os.getenv("TOOL_OUTPUT_TOKENIZER", "")  # local tokenizer.json (or its directory); empty = estimate
+DEDUPE_MIN_WORDS = 4  # shorter lines (labels like 'CONTENT:') are never treated as duplicates
+
+WORD_RE = re.compile(r"\w+")
+
+_local = threading.local()
+
+
+class TokenCounter:
+    """Counts tokens with a local Hugging Face tokenizer.json, or estimates them from characters"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """The tokenizer (None when estimating); loaded on first use"""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if self.path:
+                    path = self.path
+                    if os.path.isdir(path):
+                        path = os.path.join(path, 'tokenizer.json')
+                    try:
+                        from tokenizers import Tokenizer
+                        self._tokenizer = Tokenizer.from_file(path)
+                        logger.info(f"🔢 Counting tool output tokens with {path}")
+                    except Exception as e:
+                        logger.warning(f"⚠️ Tokenizer {path} unavailable ({e}); estimating tool output tokens")
+                else:
+                    logger.info("🔢 No TOOL_OUTPUT_TOKENIZER; estimating tool output tokens from characters")
+        return self._tokenizer
+
+    @property
+    def estimated(self):
+        """Whether counts are character-based estimates"""
+        return self.load() is None
+
+    def __call__(self, text):
+        tokenizer = self.load()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False).ids)
+        return int(len(text) / metrics.CHARS_PER_TOKEN + 0.5)
+
+
+count_tokens = TokenCounter(TOOL_OUTPUT_TOKENIZER or None)
+
+
+def _dedupe_key(line):
+    words = WORD_RE.findall(line.lower())
+    return ' '.join(words) if len(words) >= DEDUPE_MIN_WORDS else None
+
+
+def compact_search_result(payload, source_budget=TOOL_OUTPUT_SOURCE_TOKENS, budget=TOOL_OUTPUT_MAX_TOKENS,
+                          count=None):
+    """A search_web payload, deduplicated, with every source within source_budget and the whole within budget"""
+    count = count or count_tokens
+    seen = set()
+    for source in payload.get('sources', []):
+        kept, used = [], 0
+        for passage in source.get('passages', []):
+            key = _dedupe_key(passage['text'])
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            cost = count(passage['text'])
+            if used + cost > source_budget:
+                continue
+            kept.append(passage)
+            used += cost
+        source['passages'] = kept
+
+    # Still too long: drop the lowest-scored passages across all sources
+    ranked = sorted(((passage, source['passages']) for source in payload.get('sources', [])
+                     for passage in source['passages']), key=lambda item: item[0]['score'])
+    while ranked and count(tool_results.dumps(payload)) > budget:
+        passage, passages = ranked.pop(0)
+        passages.remove(passage)
+    return payload
+
+
+def cap_tokens(text, budget, count=None):
+    """Text cut to about budget tokens, keeping two thirds head and one third tail"""
+    count = count or count_tokens
+    if count(text) <= budget:
+        return text
+    lines = text.splitlines()
+    head, tail, used = [], [], 0
+    for line in lines:
+        cost = count(line) + 1
+        if used + cost > budget * 2 / 3:
+            break
+        head.append(line)
+        used += cost
+    for line in reversed(lines[len(head):]):
+        cost = count(line) + 1
+        if used + cost > budget:
+            break
+        tail.append(line)
+        used += cost
+    tail.reverse()
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single huge line: cut by characters instead
+        chars = int(budget * metrics.CHARS_PER_TOKEN)
+        return text[:chars] + f"\n[... {len(text) - chars} characters omitted ...]"
+    return '\n'.join(head + [f"[... {omitted} lines omitted ...]"] + tail)
+
+
+def compact_tool_output(tool_name, text):
+    """The text handed to the model for a tool result"""
+    payload = tool_results.parse(text)
+    if payload is None:
+        return cap_tokens(text, TOOL_OUTPUT_MAX_TOKENS)
+    if payload['tool'] == 'search_web':
+        compact_search_result(payload)
+    elif isinstance(payload.get('output'), str):
+        payload['output'] = cap_tokens(payload['output'], TOOL_OUTPUT_MAX_TOKENS)
+    return tool_results.dumps(payload)
+
+
+def reset_run_usage():
+    _local.usage = {'raw_tokens': 0, 'compacted_tokens': 0}
+
+
+def run_usage():
+    """Raw and compacted tool output tokens of the run on this thread, and whether they are estimates"""
+    usage = getattr(_local, 'usage', None) or {'raw_tokens': 0, 'compacted_tokens': 0}
+    return dict(usage, saved_tokens=usage['raw_tokens'] - usage['compacted_tokens'],
+                estimated=count_tokens.estimated)
+
+
+class CompactingAssistant(Assistant):
+    """Assistant whose tool results are compacted before the model sees them.
+
+    A tool that raises gets a typed failure as its result; qwen_agent's own
+    _call_tool would hand back a plain error string, which reads as success.
+    """
+
+    def _call_tool(self, tool_name, tool_args='{}', **kwargs):
+        if tool_name not in self.function_map:
+            return tool_results.dumps(tool_results.failure(tool_name, f"Tool {tool_name} does not exist."))
+        started = time.time()
+        try:
+            result = self.function_map[tool_name].call(tool_args, **kwargs)
+        except (ToolServiceError, DocParserError):
+            raise  # qwen_agent lets these end the run
+        except Exception as e:
+            logger.warning(f"⚠️ Tool {tool_name} raised {type(e).__name__}: {e}")
+            return tool_results.dumps(tool_results.failure(tool_name, f"{type(e).__name__}: {e}",
+                                                           elapsed=time.time() - started))
+        multimodal = isinstance(result, list) and all(isinstance(item, ContentItem) for item in result)
+        if not isinstance(result, str) and not multimodal:
+            result = json.dumps(result, ensure_ascii=False, indent=4)  # as qwen_agent formats other results
+        if not TOOL_OUTPUT_COMPACTION or not isinstance(result, str):
+            return result
+        compacted = compact_tool_output(tool_name, result)
+        raw_tokens, compacted_tokens = count_tokens(result), count_tokens(compacted)
+        metrics.TOOL_OUTPUT_TOKENS.labels(tool=tool_name, stage='raw').inc(raw_tokens)
+        metrics.TOOL_OUTPUT_TOKENS.labels(tool=tool_name, stage='compacted').inc(compacted_tokens)
+        usage = getattr(_local, 'usage', None)
+        if usage is not None:
+            usage['raw_tokens'] += raw_tokens
+            usage['compacted_tokens'] += compacted_tokens
+        return compacted
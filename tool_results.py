@@ -0,0 +1,75 @@
+"""
+Typed tool results shared by the tools, the agent and the response assembler.
+
+Tools used to return printed reports ('🎯 SEARCH RESULTS FOR: ...'). The
+response assembler then had to rescan them on every batch, guessing at
+errors from words like 'failed' and at search results from a banner. Tools
+now return one JSON object instead. The model reads that same object, and
+the assembler takes its facts from the fields:
+
+    {"tool": "search_web", "ok": true, "errors": [...], "timings": {...}, ...}
+
+  * ok is false when the tool failed as a whole. errors also lists partial
+    failures (a source that could not be fetched) that did not stop it.
+  * search_web adds query and sources, each with name, url, fetch_seconds
+    and passages ([{"text", "score"}], best first).
+  * code_interpreter adds output, the cell output as qwen_agent formats it.
+
+parse() returns None for anything else (other tools, replayed traces), and
+such output is treated as an opaque, successful result.
+"""
+
+import json
+
+SEARCH_PASSAGES_SHOWN = 5  # passages per source in the rendered answer
+
+
+def dumps(payload):
+    """The tool result text handed to the agent"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def parse(text):
+    """The payload of a typed tool result, or None"""
+    if not isinstance(text, str) or not text.startswith('{'):
+        return None
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or 'tool' not in payload:
+        return None
+    return payload
+
+
+def result(tool, ok=True, errors=None, elapsed=None, **fields):
+    """A typed result of tool; fields are the tool's own"""
+    payload = {'tool': tool, 'ok': ok, **fields, 'errors': list(errors or [])}
+    if elapsed is not None:
+        payload['timings'] = {'elapsed_seconds': round(elapsed, 3)}
+    return payload
+
+
+def failure(tool, message, elapsed=None):
+    """The result of a tool that could not do its job"""
+    return result(tool, ok=False, errors=[message], elapsed=elapsed)
+
+
+def summary(payload):
+    """One line describing a typed result, for tool_output events"""
+    if not payload['ok']:
+        return f"{payload['tool']} failed: {'; '.join(payload['errors'])}"[:200]
+    if payload['tool'] == 'search_web':
+        names = ', '.join(source['name'] for source in payload.get('sources', []))
+        return f"{len(payload.get('sources', []))} sources for {payload.get('query', '')!r}: {names}"[:200]
+    return str(payload.get('output', ''))[:200]
+
+
+def format_search_results(payload, passages=SEARCH_PASSAGES_SHOWN):
+    """Markdown answer built from a search_web result, used when the model gives none"""
+    blocks = []
+    for source in payload.get('sources', []):
+        lines = [f"**{source['name']}** ({source['url']})"]
+        lines.extend(f"• {passage['text']}" for passage in source.get('passages', [])[:passages])
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks)
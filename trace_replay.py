@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Record and replay the upstream traffic of agent runs.
+
+Recording captures, per chat query, every exchange with vLLM and the
+Playwright service (at the pooled HTTP client transport, including the
+arrival time of each streamed chunk) and every code_interpreter call, and
+writes them to a gzipped JSON-lines trace. Replaying runs the same queries
+through the real chat pipeline with those responses fed back, at the
+original pace (--speed 1), faster (--speed 10) or with no waiting at all
+(--speed 0), so CPU hot spots can be profiled and builds compared on
+identical traffic.
+
+Usage:
+    python trace_replay.py record --query "Latest technology news today" --out traces/news.jsonl.gz
+    python trace_replay.py replay traces/news.jsonl.gz --speed 0 --profile
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+TRACED_UPSTREAMS = ('vllm', 'playwright')
+TRACED_TOOLS = ('code_interpreter',)
+
+
+def _encode_body(data):
+    try:
+        return {'text': data.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(data).decode('ascii')}
+
+
+def _decode_body(body):
+    return body['text'].encode('utf-8') if 'text' in body else base64.b64decode(body['b64'])
+
+
+def request_key(method, url, content):
+    return hashlib.sha1(f"{method} {url}\n".encode('utf-8') + (content or b'')).hexdigest()[:16]
+
+
+class TraceRecorder:
+    """Collects upstream exchanges and tool calls; one trace can hold several runs"""
+
+    def __init__(self):
+        self.events = []
+        self.runs = []
+        self.run = 0
+        self._run_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def begin_run(self, query):
+        with self._lock:
+            self.run = len(self.runs)
+            self.runs.append({'run': self.run, 'query': query})
+            self._run_started = time.monotonic()
+
+    def end_run(self, result):
+        with self._lock:
+            self.runs[self.run].update(response=result.get('response'), metadata=result.get('metadata'),
+                                       duration=round(time.monotonic() - self._run_started, 4))
+
+    def offset(self):
+        return round(time.monotonic() - self._run_started, 4)
+
+    def add(self, event):
+        with self._lock:
+            event['run'] = self.run
+            self.events.append(event)
+
+    def wrap_transport(self, upstream, transport):
+        return _RecordingTransport(self, upstream, transport) if upstream in TRACED_UPSTREAMS else transport
+
+    def wrap_tools(self, bot):
+        for name in TRACED_TOOLS:
+            tool = bot.function_map.get(name)
+            if tool is None:
+                continue
+
+            def call(params, _call=tool.call, _name=name, **kwargs):
+                started = time.monotonic()
+                offset = self.offset()
+                result = _call(params, **kwargs)
+                self.add({'kind': 'tool', 'name': _name, 'offset': offset,
+                          'params': params if isinstance(params, str) else json.dumps(params),
+                          'result': result if isinstance(result, str) else json.dumps(result),
+                          'duration': round(time.monotonic() - started, 4)})
+                return result
+            tool.call = call
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'kind': 'header', 'version': TRACE_VERSION,
+                                'recorded_at': datetime.now().isoformat(), 'runs': self.runs}) + '\n')
+            for event in self.events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+class _RecordingStream(httpx.SyncByteStream):
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self.chunks = []
+        self._started = time.monotonic()
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self.chunks.append((round(time.monotonic() - self._started, 4), chunk))
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+        self._on_close(self.chunks)
+
+
+class _RecordingTransport(httpx.BaseTransport):
+
+    def __init__(self, recorder, upstream, transport):
+        self.recorder = recorder
+        self.upstream = upstream
+        self._transport = transport
+
+    def handle_request(self, request):
+        content = request.read()
+        offset = self.recorder.offset()
+        started = time.monotonic()
+        response = self._transport.handle_request(request)
+        latency = round(time.monotonic() - started, 4)
+
+        def finish(chunks):
+            self.recorder.add({
+                'kind': 'http', 'upstream': self.upstream, 'offset': offset,
+                'method': request.method, 'url': str(request.url),
+                'key': request_key(request.method, str(request.url), content),
+                'status': response.status_code,
+                'headers': [[name, value] for name, value in response.headers.items()
+                            if name.lower() not in ('content-length', 'transfer-encoding', 'content-encoding')],
+                'latency': latency,
+                'chunks': [[at, _encode_body(chunk)] for at, chunk in chunks],
+            })
+
+        return httpx.Response(status_code=response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, finish), extensions=response.extensions)
+
+    def close(self):
+        self._transport.close()
+
+
+def load_trace(path):
+    """(header, events) from a trace file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f if line.strip()]
+    if header.get('kind') != 'header' or header.get('version') != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace")
+    return header, events
+
+
+class TraceReplayer:
+    """Serves recorded responses back to the pipeline.
+
+    Requests are matched by method, URL and body; when bodies differ (e.g.
+    prompts containing timestamps) the next unused exchange with the same
+    method and URL, then with the same upstream, is used. speed scales the
+    recorded waits: 1 = original pace, 0 = no waiting.
+    """
+
+    def __init__(self, events, speed=1.0):
+        self.speed = speed
+        self.run = 0
+        self.misses = 0
+        self._events = events
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def begin_run(self, run):
+        with self._lock:
+            self.run = run
+
+    def _wait(self, seconds):
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def _take(self, matches):
+        for position, event in matches:
+            if position not in self._used:
+                self._used.add(position)
+                return event
+        return None
+
+    def match_http(self, upstream, method, url, key):
+        with self._lock:
+            candidates = [(i, e) for i, e in enumerate(self._events)
+                          if e['kind'] == 'http' and e['upstream'] == upstream and e['run'] == self.run]
+            same_url = [(i, e) for i, e in candidates if e['method'] == method and e['url'] == url]
+            event = (self._take([(i, e) for i, e in same_url if e['key'] == key])
+                     or self._take(same_url)
+                     or self._take([(i, e) for i, e in candidates if e['method'] == method]))
+            if event is None and same_url and method == 'GET':
+                event = same_url[-1][1]     # health probes may poll more often than during recording
+            if event is None:
+                self.misses += 1
+            return event
+
+    def match_tool(self, name, params):
+        with self._lock:
+            candidates = [(i, e) for i, e in enumerate(self._events)
+                          if e['kind'] == 'tool' and e['name'] == name and e['run'] == self.run]
+            event = self._take([(i, e) for i, e in candidates if e['params'] == params]) or self._take(candidates)
+            if event is None:
+                self.misses += 1
+            return event
+
+    def wrap_transport(self, upstream, transport):
+        return _ReplayTransport(self, upstream) if upstream in TRACED_UPSTREAMS else transport
+
+    def wrap_tools(self, bot):
+        for name in TRACED_TOOLS:
+            tool = bot.function_map.get(name)
+            if tool is None:
+                continue
+
+            def call(params, _name=name, **kwargs):
+                event = self.match_tool(_name, params if isinstance(params, str) else json.dumps(params))
+                if event is None:
+                    return f"error: no recorded {_name} output for this call"
+                self._wait(event['duration'])
+                return event['result']
+            tool.call = call
+
+
+class _ReplayStream(httpx.SyncByteStream):
+
+    def __init__(self, replayer, chunks):
+        self.replayer = replayer
+        self.chunks = chunks
+
+    def __iter__(self):
+        previous = 0.0
+        for at, body in self.chunks:
+            self.replayer._wait(at - previous)
+            previous = at
+            yield _decode_body(body)
+
+
+class _ReplayTransport(httpx.BaseTransport):
+
+    def __init__(self, replayer, upstream):
+        self.replayer = replayer
+        self.upstream = upstream
+
+    def handle_request(self, request):
+        content = request.read()
+        url = str(request.url)
+        event = self.replayer.match_http(self.upstream, request.method, url,
+                                         request_key(request.method, url, content))
+        if event is None:
+            logger.warning(f"⚠️ No recorded {self.upstream} response for {request.method} {url}")
+            return httpx.Response(502, json={'error': 'not in trace'})
+        self.replayer._wait(event['latency'])
+        return httpx.Response(status_code=event['status'], headers=event['headers'],
+                              stream=_ReplayStream(self.replayer, event['chunks']))
+
+
+class InlineExecutor:
+    """Executor that runs tasks in the calling thread, so a profiler sees them"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _load_app(wrapper):
+    """Import app with traced upstream clients and caches that would hide upstream calls disabled"""
+    os.environ.setdefault('RESPONSE_CACHE_ENABLED', 'false')
+    import http_clients
+    http_clients.add_transport_wrapper(wrapper.wrap_transport)
+    import app
+    if not app.agent_loader.wait(timeout=60):
+        raise RuntimeError("Assistant agent could not be initialized")
+    app.health_prober.stop()
+    wrapper.wrap_tools(app.bot)
+    return app
+
+
+def run_query(app, query):
+    """Run one query through the chat pipeline; returns the 'done' payload"""
+    import search_tool
+    search_tool.page_cache.clear()
+    result = None
+    for event, payload in app.iter_chat_events(query, endpoint='replay'):
+        if event == 'done':
+            result = payload
+    return result
+
+
+def record(args):
+    recorder = TraceRecorder()
+    app = _load_app(recorder)
+    queries = list(args.query or [])
+    if args.query_file:
+        with open(args.query_file, encoding='utf-8') as f:
+            queries += [line.strip() for line in f if line.strip()]
+    for query in queries:
+        recorder.begin_run(query)
+        result = run_query(app, query)
+        recorder.end_run(result)
+        print(f"🎙️  Recorded run {recorder.run}: {query!r} in {recorder.runs[-1]['duration']:.2f}s")
+    recorder.save(args.out)
+    print(f"💾 {len(recorder.events)} exchanges written to {args.out}")
+    return 0
+
+
+def replay(args):
+    header, events = load_trace(args.trace)
+    replayer = TraceReplayer(events, speed=args.speed)
+    app = _load_app(replayer)
+
+    profiler = None
+    if args.profile or args.profile_out:
+        import cProfile
+        import search_tool
+        profiler = cProfile.Profile()
+        # cProfile only sees the thread it runs in; fetch, parse and rank pages inline
+        search_tool._search_executor = InlineExecutor()
+
+    identical = 0
+    for run in header['runs']:
+        replayer.begin_run(run['run'])
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        result = run_query(app, run['query'])
+        if profiler:
+            profiler.disable()
+        duration = time.perf_counter() - started
+        same = result['response'] == run.get('response')
+        identical += same
+        print(f"▶️  Run {run['run']}: {run['query']!r} replayed in {duration:.3f}s "
+              f"(recorded {run.get('duration', 0):.3f}s) - response {'identical' if same else 'DIFFERS'}")
+
+    print(f"\n{identical}/{len(header['runs'])} responses identical, {replayer.misses} unmatched upstream calls")
+    if profiler:
+        import pstats
+        if args.profile_out:
+            profiler.dump_stats(args.profile_out)
+            print(f"📊 Profile written to {args.profile_out}")
+        if args.profile:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile_limit)
+    return 0 if identical == len(header['runs']) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='run queries against the live upstreams and save a trace')
+    record_parser.add_argument('--query', action='append', help='query to run (repeatable)')
+    record_parser.add_argument('--query-file', help='file with one query per line')
+    record_parser.add_argument('--out', required=True, help='trace file (.jsonl.gz)')
+
+    replay_parser = commands.add_parser('replay', help='run the recorded queries against the trace')
+    replay_parser.add_argument('trace')
+    replay_parser.add_argument('--speed', type=float, default=0.0,
+                               help='1 = recorded pace, 10 = ten times faster, 0 = no waiting (default)')
+    replay_parser.add_argument('--profile', action='store_true', help='print cProfile stats of the replayed runs')
+    replay_parser.add_argument('--profile-limit', type=int, default=30)
+    replay_parser.add_argument('--profile-out', help='write cProfile stats to this file')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == 'record' and not (args.query or args.query_file):
+        parser.error('record needs --query or --query-file')
+    return record(args) if args.command == 'record' else replay(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Routing of LLM calls across several OpenAI-compatible vLLM replicas.
+
+Each call goes to the healthy endpoint with the fewest outstanding requests
+('least_outstanding') or the lowest expected wait, outstanding requests
+times the EWMA of time to first response ('latency_ewma'). Calls that share
+an affinity key (one conversation) prefer the same replica, chosen by
+rendezvous hashing, so vLLM's prefix cache keeps hitting; the preference
+yields when that replica is more than sticky_slack requests busier than
+the least loaded one.
+
+Endpoints that fail are ejected until the health prober sees them answer
+again. If every endpoint is ejected, all of them are tried anyway.
+"""
+
+import hashlib
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+STRATEGIES = ('least_outstanding', 'latency_ewma')
+EWMA_ALPHA = 0.3  # weight of the newest latency sample
+
+
+class Endpoint:
+    """One vLLM replica and its live load"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/') + '/'
+        self.name = urlparse(self.url).netloc or self.url
+        self.inflight = 0
+        self.ewma = None
+        self.healthy = True
+        self.ejected_at = None
+        self.last_error = None
+        self.requests = 0
+        self.failures = 0
+
+    def snapshot(self, now):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "latency_ewma": round(self.ewma, 4) if self.ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected_for": round(now - self.ejected_at, 1) if self.ejected_at else None,
+            "last_error": self.last_error
+        }
+
+
+def _rendezvous(key, endpoint):
+    return hashlib.sha1(f"{key}\x00{endpoint.url}".encode('utf-8')).digest()
+
+
+class EndpointRouter:
+    """Picks an endpoint per call and tracks in-flight counts, latency and ejections"""
+
+    def __init__(self, urls, strategy='least_outstanding', sticky_slack=4, logger=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown vLLM routing strategy '{strategy}' (expected one of {STRATEGIES})")
+        self.endpoints = [Endpoint(url) for url in urls]
+        if not self.endpoints:
+            raise ValueError("At least one vLLM endpoint is required")
+        self.strategy = strategy
+        self.sticky_slack = sticky_slack
+        self.logger = logger
+        self._lock = threading.Lock()
+        for endpoint in self.endpoints:
+            metrics.VLLM_ENDPOINT_UP.labels(endpoint=endpoint.name).set(1)
+
+    def _load(self, endpoint):
+        if self.strategy == 'latency_ewma':
+            known = [e.ewma for e in self.endpoints if e.ewma is not None]
+            expected = endpoint.ewma if endpoint.ewma is not None else (min(known) if known else 1.0)
+            return (endpoint.inflight + 1) * expected, endpoint.inflight
+        return endpoint.inflight, endpoint.ewma or 0.0
+
+    def pick(self, affinity=None, exclude=()):
+        """The endpoint for the next call (None once every endpoint was excluded)"""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.healthy]
+            candidates = healthy or candidates
+            if not candidates:
+                return None
+            best = min(candidates, key=self._load)
+            if affinity is not None and len(candidates) > 1:
+                sticky = max(candidates, key=lambda e: _rendezvous(affinity, e))
+                if sticky.inflight <= best.inflight + self.sticky_slack:
+                    return sticky
+            return best
+
+    def begin(self, endpoint):
+        with self._lock:
+            endpoint.inflight += 1
+            endpoint.requests += 1
+            metrics.VLLM_ENDPOINT_INFLIGHT.labels(endpoint=endpoint.name).set(endpoint.inflight)
+
+    def first_response(self, endpoint, seconds):
+        """Record the time from sending a call to its first response"""
+        metrics.VLLM_ENDPOINT_LATENCY.labels(endpoint=endpoint.name).observe(seconds)
+        with self._lock:
+            if endpoint.ewma is None:
+                endpoint.ewma = seconds
+            else:
+                endpoint.ewma = (1 - EWMA_ALPHA) * endpoint.ewma + EWMA_ALPHA * seconds
+
+    def finish(self, endpoint, error=None, eject=False):
+        """End a call; with eject, keep the endpoint out of rotation until it is re-admitted"""
+        with self._lock:
+            endpoint.inflight -= 1
+            metrics.VLLM_ENDPOINT_INFLIGHT.labels(endpoint=endpoint.name).set(endpoint.inflight)
+            if error is not None:
+                endpoint.failures += 1
+                endpoint.last_error = str(error)[:200]
+                metrics.VLLM_ENDPOINT_FAILURES.labels(endpoint=endpoint.name).inc()
+        if eject:
+            self.eject(endpoint, error)
+
+    def eject(self, endpoint, reason=None):
+        with self._lock:
+            if not endpoint.healthy:
+                return
+            endpoint.healthy = False
+            endpoint.ejected_at = time.time()
+            if reason is not None:
+                endpoint.last_error = str(reason)[:200]
+        metrics.VLLM_ENDPOINT_UP.labels(endpoint=endpoint.name).set(0)
+        if self.logger:
+            self.logger.warning(f"🚫 vLLM endpoint {endpoint.name} ejected: {str(reason)[:100]}")
+
+    def admit(self, endpoint):
+        with self._lock:
+            if endpoint.healthy:
+                return
+            endpoint.healthy = True
+            endpoint.ejected_at = None
+        metrics.VLLM_ENDPOINT_UP.labels(endpoint=endpoint.name).set(1)
+        if self.logger:
+            self.logger.info(f"✅ vLLM endpoint {endpoint.name} re-admitted")
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "endpoints": [endpoint.snapshot(now) for endpoint in self.endpoints]
+            }